@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import logging
+import asyncio
 import traceback
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
@@ -10,8 +11,10 @@ import vectorstore_global
 # routerオブジェクトをインポートし、posとしてエイリアスを付ける
 from routers.itnavi import router as itnavi_router
 
-# vectorstore モジュールからインポート
-from modules.mdlVectorstore import create_talent_vectorstore, create_case_vectorstore
+# インデックスの起動時読み込み
+from modules.mdlIndexLoader import load_all_indexes, start_background_loading, lazy_index_loading
+# 戦略文書作成ジョブのワーカー
+from modules.mdlDocumentJob import start_workers, stop_workers, start_on_boot
 
 # グローバル変数としてベクトルストアを保持
 talent_vectorstore = None
@@ -19,12 +22,21 @@ talent_vectorstore = None
 # lifespan コンテキストマネージャを利用して起動時処理を記述
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    # 起動時に RAG(vectorstore) を作成
-    vectorstore_global.talent_vectorstore = create_talent_vectorstore()
-    vectorstore_global.case_vectorstore = create_case_vectorstore()
+    # 起動時に RAG(vectorstore) を talent / case 並列に読み込む
+    # （読み込み後に常駐バイト数の出力と、事例→人材の類似度事前計算の読み込み・再計算を行う）
+    if lazy_index_loading():
+        # LAZY_INDEX_LOADING=TRUE: 読み込みを待たずにリクエストの受け付けを開始する（状態は /ready で確認）
+        start_background_loading()
+    else:
+        await asyncio.to_thread(load_all_indexes)
+    # 戦略文書作成ジョブ（t_document_job）のワーカーを起動し、前回のプロセスで残ったジョブを実行する
+    # DOCUMENT_JOB_START_ON_BOOT=FALSE の場合は最初のジョブ登録・参照時に起動する
+    if start_on_boot():
+        start_workers()
     yield
     # シャットダウン時の処理（必要に応じて記述）
     print("[lifespan shutdown] アプリ終了処理を実施")
+    await asyncio.to_thread(stop_workers)
 
 # FastAPI アプリ作成時に lifespan を指定
 app = FastAPI(lifespan=lifespan)
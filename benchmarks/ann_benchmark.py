@@ -0,0 +1,154 @@
+# ANN インデックス種別ベンチマーク
+#
+# 合成データ（クラスタ構造を持つ正規化ベクトル）に対して、インデックス仕様ごとに以下を計測する。
+#   - recall@k      : 全件比較 (Flat) の検索結果に対する再現率
+#   - latency       : 1クエリずつ検索した場合のレイテンシ (p50 / p95 / p99, ミリ秒)
+#   - build         : 学習 + 追加にかかった時間 (秒)
+#   - memory        : インデックスの保存サイズ (MB)。ヒープへ読み込んだ場合の常駐メモリにほぼ等しい
+# インデックスの作成には modules.mdlIndexSpec.build_index を使うため、アプリと同じ仕様文字列で比較できる。
+#
+# 実行例（リポジトリのルートで実行）:
+#   python benchmarks/ann_benchmark.py
+#   python benchmarks/ann_benchmark.py --sizes 10000,100000 --dim 1536 --specs "Flat" "HNSW32;efSearch=64"
+#   python benchmarks/ann_benchmark.py --json rag/ann_benchmark.json
+# ※ 1M 件 x 1536 次元は生データだけで約 6GB のメモリを使用する。メモリが足りない場合は --dim を下げて傾向を確認する
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.mdlIndexSpec import build_index
+
+DEFAULT_SIZES = "10000,100000,1000000"
+# {nlist} はデータ件数から決めるクラスタ数 (4 * sqrt(n))、{pq_m} は --pq-m の値に置き換える
+DEFAULT_SPECS = [
+    "Flat",
+    "IVF{nlist},Flat;nprobe=16",
+    "HNSW32;efSearch=64",
+    "IVF{nlist},PQ{pq_m};nprobe=16",
+]
+
+def index_bytes(index) -> int:
+    """
+    インデックスをファイルへ書き出した場合のサイズを返す（serialize_index のようにメモリ上へ複製しない）
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.faiss")
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+
+def make_corpus(n: int, dim: int, n_queries: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    埋め込みベクトルに近い分布（クラスタ構造 + L2 正規化）の合成データと、コーパス近傍のクエリを生成する
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, int(np.sqrt(n)))
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    corpus = np.empty((n, dim), dtype=np.float32)
+    # 1M 件でも一時配列が大きくならないようにブロック単位で生成する
+    block = 100000
+    for start in range(0, n, block):
+        end = min(n, start + block)
+        labels = rng.integers(0, n_clusters, end - start)
+        corpus[start:end] = centers[labels] + 0.5 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    faiss.normalize_L2(corpus)
+
+    queries = corpus[rng.integers(0, n, n_queries)] + 0.1 * rng.standard_normal((n_queries, dim), dtype=np.float32)
+    faiss.normalize_L2(queries)
+    return corpus, queries
+
+def expand_spec(spec: str, n: int, pq_m: int) -> str:
+    nlist = max(1, int(4 * np.sqrt(n)))
+    return spec.replace("{nlist}", str(nlist)).replace("{pq_m}", str(pq_m))
+
+def percentile_ms(latencies: list[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000, 3)
+
+def run_spec(spec: str, corpus: np.ndarray, queries: np.ndarray, ground_truth: np.ndarray, k: int, threads: int) -> dict:
+    """
+    1つのインデックス仕様について作成・検索を行い、計測結果を返す（作成は全スレッド、検索は threads スレッドで実行）
+    """
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+    started = time.perf_counter()
+    index = build_index(spec, corpus)
+    index.add(corpus)
+    build_seconds = time.perf_counter() - started
+    memory_mb = index_bytes(index) / 1024 / 1024
+
+    faiss.omp_set_num_threads(threads)
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, labels = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = labels[0]
+
+    hits = sum(len(set(found[i]) & set(ground_truth[i])) for i in range(len(queries)))
+    result = {
+        "spec": spec,
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "latency_p50_ms": percentile_ms(latencies, 50),
+        "latency_p95_ms": percentile_ms(latencies, 95),
+        "latency_p99_ms": percentile_ms(latencies, 99),
+        "build_seconds": round(build_seconds, 2),
+        "memory_mb": round(memory_mb, 1),
+    }
+    del index
+    gc.collect()
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ANN インデックス種別ごとの recall@k / レイテンシ / 作成時間 / メモリを計測する")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"コーパス件数（カンマ区切り、既定: {DEFAULT_SIZES}）")
+    parser.add_argument("--dim", type=int, default=1536, help="ベクトルの次元数（既定: 1536 = OpenAI 埋め込み）")
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS, help="インデックス仕様（modules.mdlIndexSpec の書式）")
+    parser.add_argument("--queries", type=int, default=1000, help="クエリ数")
+    parser.add_argument("--k", type=int, default=4, help="recall@k の k（既定: 4 = 検索 API の取得件数）")
+    parser.add_argument("--pq-m", type=int, default=64, help="{pq_m} に入る PQ の分割数（dim を割り切れる値）")
+    parser.add_argument("--threads", type=int, default=1, help="faiss のスレッド数（既定: 1 = リクエスト単位の検索を想定）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    results = []
+    for n in [int(size) for size in args.sizes.split(",")]:
+        print(f"===== n={n:,} dim={args.dim} queries={args.queries} k={args.k} =====")
+        corpus, queries = make_corpus(n, args.dim, args.queries, args.seed)
+
+        # 正解データ（全件比較）
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(corpus)
+        _, ground_truth = exact.search(queries, args.k)
+        del exact
+
+        print(f"{'spec':<36}{'recall@k':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'build(s)':>10}{'mem(MB)':>10}")
+        for spec in args.specs:
+            spec = expand_spec(spec, n, args.pq_m)
+            try:
+                result = run_spec(spec, corpus, queries, ground_truth, args.k, args.threads)
+            except Exception as e:
+                print(f"{spec:<36} エラー: {e}")
+                continue
+            result.update({"n": n, "dim": args.dim, "k": args.k})
+            results.append(result)
+            print(
+                f"{spec:<36}{result['recall_at_k']:>10.4f}{result['latency_p50_ms']:>10.3f}{result['latency_p95_ms']:>10.3f}"
+                f"{result['latency_p99_ms']:>10.3f}{result['build_seconds']:>10.2f}{result['memory_mb']:>10.1f}"
+            )
+        del corpus, queries
+        gc.collect()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.json}")
+
+if __name__ == "__main__":
+    main()
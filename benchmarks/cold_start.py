@@ -0,0 +1,157 @@
+# コールドスタート計測ベンチマーク
+#
+# デプロイ・スケールアウト直後の新しいプロセスを想定し、以下を計測する。
+#   import_ms         : python -X importtime -c "import app" の自己時間 (self) の合計
+#   ttfb_root_ms      : uvicorn のプロセス起動から GET / が初めて 200 を返すまで
+#   first_search_ms   : uvicorn のプロセス起動から GET /searchResults が初めて 200 を返すまで（インデックスの読み込みを含む）
+# --runs 回繰り返して中央値を出力する。--max-* を指定した場合、中央値が上限を超えた項目があれば終了コード 1 で終了する（CI のゲート用）。
+# 環境変数（DB 接続先、LAZY_INDEX_LOADING、VECTORSTORE_LOAD_MODE など）はそのままアプリのプロセスへ引き継ぐ。
+#
+# 実行例（インデックス rag/ があるディレクトリで実行）:
+#   python benchmarks/cold_start.py --search-id 1 --search-id-sub 1
+#   LAZY_INDEX_LOADING=TRUE python benchmarks/cold_start.py --search-id 1 --search-id-sub 1 --runs 5 --json rag/cold_start.json
+#   python benchmarks/cold_start.py --max-import-ms 800 --max-ttfb-ms 3000
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from typing import Optional
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_importtime(stderr: str) -> tuple[int, list[tuple[str, int]]]:
+    """
+    -X importtime の出力から、自己時間の合計 (マイクロ秒) と最上位パッケージごとの累積時間を返す
+    """
+    total = 0
+    packages: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        total += int(self_us)
+        package = name.strip().split(".")[0]
+        # 同じパッケージが入れ子で出力されるため、最上位の（最も大きい）累積時間を採用する
+        packages[package] = max(packages.get(package, 0), int(cumulative_us))
+    return total, sorted(packages.items(), key=lambda item: -item[1])
+
+def measure_import(top: int) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {APP_DIR!r}); import app"],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import app に失敗しました:\n{completed.stderr[-2000:]}")
+    total, packages = parse_importtime(completed.stderr)
+    return {"import_ms": round(total / 1000, 1), "top_packages_ms": {name: round(us / 1000, 1) for name, us in packages[:top]}}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_200(url: str, started: float, deadline: float) -> Optional[float]:
+    """
+    url が 200 を返すまで繰り返しリクエストし、started からの経過ミリ秒を返す（deadline までに 200 にならない場合は None）
+    """
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=max(0.1, deadline - time.perf_counter())) as response:
+                if response.status == 200:
+                    return round((time.perf_counter() - started) * 1000, 1)
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.05)
+    return None
+
+def measure_server(search_path: Optional[str], timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", APP_DIR, "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ.copy(),
+    )
+    try:
+        deadline = started + timeout
+        base = f"http://127.0.0.1:{port}"
+        result = {"ttfb_root_ms": wait_for_200(f"{base}/", started, deadline)}
+        if search_path:
+            result["first_search_ms"] = wait_for_200(f"{base}{search_path}", started, deadline)
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def median(values: list) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 1) if values else None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="import 時間・GET / の初回応答・/searchResults の初回成功までの時間を計測する")
+    parser.add_argument("--runs", type=int, default=3, help="計測回数（中央値を出力）")
+    parser.add_argument("--search-id", type=int, help="/searchResults の search_id（省略時は first_search_ms を計測しない）")
+    parser.add_argument("--search-id-sub", type=int, help="/searchResults の search_id_sub")
+    parser.add_argument("--timeout", type=float, default=300, help="1回あたりの待ち時間の上限（秒）")
+    parser.add_argument("--top", type=int, default=10, help="import 時間の大きいパッケージの表示件数")
+    parser.add_argument("--max-import-ms", type=float, help="import_ms の上限")
+    parser.add_argument("--max-ttfb-ms", type=float, help="ttfb_root_ms の上限")
+    parser.add_argument("--max-search-ms", type=float, help="first_search_ms の上限")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    search_path = None
+    if args.search_id is not None:
+        search_path = f"/searchResults?search_id={args.search_id}&search_id_sub={args.search_id_sub or 0}"
+
+    runs = []
+    for i in range(args.runs):
+        run = measure_import(args.top)
+        run.update(measure_server(search_path, args.timeout))
+        runs.append(run)
+        print(
+            f"run {i + 1}: import={run['import_ms']}ms ttfb(/)={run['ttfb_root_ms']}ms"
+            + (f" first /searchResults={run['first_search_ms']}ms" if search_path else "")
+        )
+
+    summary = {
+        "runs": args.runs,
+        "lazy_index_loading": os.getenv("LAZY_INDEX_LOADING") == "TRUE",
+        "import_ms": median([run["import_ms"] for run in runs]),
+        "ttfb_root_ms": median([run["ttfb_root_ms"] for run in runs]),
+        "first_search_ms": median([run.get("first_search_ms") for run in runs]) if search_path else None,
+        "top_packages_ms": runs[-1]["top_packages_ms"],
+    }
+    print(f"===== 中央値 ({args.runs} 回) =====")
+    print(f"import_ms       : {summary['import_ms']}")
+    print(f"ttfb_root_ms    : {summary['ttfb_root_ms']}")
+    if search_path:
+        print(f"first_search_ms : {summary['first_search_ms']}")
+    print("import 時間の大きいパッケージ (ms):")
+    for name, ms in summary["top_packages_ms"].items():
+        print(f"  {name:<24}{ms:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs}, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.json}")
+
+    # 上限を超えた項目（計測できなかった場合も含む）があれば終了コード 1
+    failures = []
+    for key, limit in (("import_ms", args.max_import_ms), ("ttfb_root_ms", args.max_ttfb_ms), ("first_search_ms", args.max_search_ms)):
+        if limit is not None and (summary[key] is None or summary[key] > limit):
+            failures.append(f"{key}={summary[key]} (上限: {limit})")
+    if failures:
+        print("上限を超えました: " + ", ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
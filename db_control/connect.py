@@ -1,8 +1,8 @@
 import platform
-from sqlalchemy import create_engine
 import os
 import tempfile
 import atexit
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,25 +10,43 @@ CONNECT = os.getenv("CONNECT_MODE")
 DATABASE_URL = os.getenv("DB_URL")
 pem_content = os.getenv("SSL_CA_STR")
 
-print(CONNECT)
-print(DATABASE_URL)
+# エンジンは最初の DB アクセス時に作成する（インポート時に SSL 証明書の一時ファイル作成や接続設定を行わない）
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    SQLAlchemy のエンジンを返す。初回の呼び出し時に作成し、以降は同じエンジンを返す
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_db_engine()
+    return _engine
+
+def create_db_engine():
+    from sqlalchemy import create_engine
+
+    print(CONNECT)
+    print(DATABASE_URL)
+
+    if CONNECT == "local":
+        print("===Connect to LocalDB===")
+        # ローカル環境でのデータベース接続設定
+        return create_engine(os.getenv('DB'), echo=True)
 
-if CONNECT == "local":
-    print("===Connect to LocalDB===")
-    # ローカル環境でのデータベース接続設定
-    engine = create_engine(os.getenv('DB'), echo=True)
-else:
     print("===Connect to AzureDB===")
 
     # SSL証明書内容の確認と処理
     if pem_content is None:
         raise ValueError("SSL_CA_CERT is not set in environment variables.")
-    
-    pem_content = pem_content.replace("\\n", "\n").replace("\\", "")
+
+    pem = pem_content.replace("\\n", "\n").replace("\\", "")
 
     # 一時ファイル作成
     with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".pem") as temp_pem:
-        temp_pem.write(pem_content)
+        temp_pem.write(pem)
         temp_pem_path = temp_pem.name
 
     with open(temp_pem_path, "r") as temp_pem:
@@ -36,8 +54,11 @@ else:
         print(temp_pem_path)
         # print(temp_pem.read())
 
+    # Python正常終了時に一時ファイルを削除
+    atexit.register(cleanup_temp_file, temp_pem_path)
+
     # データベース接続設定
-    engine = create_engine(
+    return create_engine(
         DATABASE_URL,
         connect_args={
             "ssl": {
@@ -46,10 +67,7 @@ else:
         }
     )
 
-    # 一時ファイル削除の登録
-    def cleanup_temp_file(path):
-        if os.path.exists(path):
-            os.remove(path)
-
-    # Python正常終了時に一時ファイルを削除
-    atexit.register(cleanup_temp_file, temp_pem_path)
\ No newline at end of file
+# 一時ファイル削除の登録
+def cleanup_temp_file(path):
+    if os.path.exists(path):
+        os.remove(path)
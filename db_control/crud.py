@@ -1,13 +1,12 @@
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import asc, desc, func
+from sqlalchemy import asc, desc, func, or_, and_, update
 import json
 import random
 import string
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Tuple, Optional
 from zoneinfo import ZoneInfo
-from db_control.connect import engine
+from db_control.connect import get_engine
 from db_control.mymodels import (
     m_industry,
     m_company_size,
@@ -16,10 +15,13 @@ from db_control.mymodels import (
     m_case,
     m_user,
     m_job,
+    talent_job,
     t_search,
     d_search,
     t_agent_request,
     t_document, 
+    t_document_job,
+    t_dx_advice,
     c_user_id,
     case_industry, 
     case_company_size,
@@ -35,7 +37,7 @@ def select_m_industry() -> Tuple[int, str]:
     status_code = 200
 
     # session構築
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
     
     try:
@@ -78,7 +80,7 @@ def select_m_company_size() -> Tuple[int, str]:
     status_code = 200
 
     # session構築
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -124,7 +126,7 @@ def select_m_department() -> Tuple[int, str]:
     status_code = 200
 
     # session構築
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -170,7 +172,7 @@ def select_m_theme() -> Tuple[int, str]:
     status_code = 200
 
     # session構築
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -215,7 +217,7 @@ def select_m_job() -> Tuple[int, str]:
     status_code = 200
 
     # session構築
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
     
     try:
@@ -267,7 +269,7 @@ def insert_search(search_mode: int) -> Tuple[int, Optional[int]]:
     status_code = 200
     inserted_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -309,7 +311,7 @@ def insert_d_search_case(data: caseSearchData) -> Tuple[int, Optional[int]]:
     status_code = 200
     inserted_sub_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -365,7 +367,7 @@ def insert_d_search_talent(data: talentSearchData) -> Tuple[int, Optional[int]]:
     status_code = 200
     inserted_sub_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -418,7 +420,7 @@ def select_m_case_list(search_id: Optional[int], search_id_sub: Optional[int]) -
     5) 結果が無ければ 404, あれば 200
     """
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     status_code = 200
@@ -524,7 +526,7 @@ def select_featured_m_case_list(FEATURED_COUNT) -> Tuple[int, str]:
     """
     status_code = 200
     result_json = ""
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -623,7 +625,7 @@ def update_t_search_mode(
     status_code = 200
     return_sub_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -683,7 +685,7 @@ def update_d_search_case(
     status_code = 200
     return_sub_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -774,7 +776,7 @@ def update_d_search_talent(
     status_code = 200
     return_sub_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -854,7 +856,7 @@ def select_m_case(search_id: int, search_id_sub: int) -> Tuple[int, str]:
     status_code = 200
     result_json = ""
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -919,7 +921,7 @@ def insert_m_user(data: userEntryData) -> Tuple[int, Optional[str]]:
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1002,7 +1004,7 @@ def select_m_user(user_id: str) -> Tuple[int, Optional[str]]:
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1055,7 +1057,7 @@ def select_d_search(search_id: int, search_id_sub: int) -> Tuple[int, Optional[s
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1151,7 +1153,7 @@ def insert_t_agent_request(data: userData) -> Tuple[int, Optional[str]]:
     status_code = 200
     inserted_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1191,7 +1193,7 @@ def insert_t_document(search_id, search_id_sub, strategy_doc: str) -> Tuple[int,
     status_code = 200
     inserted_id: Optional[int] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1233,7 +1235,7 @@ def select_t_document(document_id: int) -> Tuple[int, Optional[str]]:
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1287,7 +1289,7 @@ def check_t_document(search_id: int, search_id_sub: int, document_id: int) -> Tu
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1335,7 +1337,7 @@ def update_t_document(document_id: int) -> Tuple[int, Optional[str]]:
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1357,6 +1359,305 @@ def update_t_document(document_id: int) -> Tuple[int, Optional[str]]:
 
     return status_code, result_str
 
+def document_job_dict(record: t_document_job) -> dict:
+    """
+    t_document_job のレコードを辞書化する
+    """
+    def ymd(value):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+    return {
+        "job_id": record.job_id,
+        "search_id": record.search_id,
+        "search_id_sub": record.search_id_sub,
+        "user_id": record.user_id,
+        "status": record.status,
+        "regenerate": bool(record.regenerate),
+        "attempts": record.attempts,
+        "document_id": record.document_id,
+        "error": record.error,
+        "next_run_ymd": ymd(record.next_run_ymd),
+        "create_ymd": ymd(record.create_ymd),
+        "update_ymd": ymd(record.update_ymd),
+    }
+
+# t_document_jobデータ追加
+def insert_t_document_job(data: userData, regenerate: bool = False) -> Tuple[int, Optional[str]]:
+    """
+    t_document_job テーブルに戦略文書作成ジョブを追加し、job_id を返す。
+      - regenerate が True の場合は生成結果のキャッシュを使わずに生成する
+      - status は 'pending'、attempts は 0
+      - next_run_ymd / create_ymd / update_ymd にシステム日時を設定
+    """
+    status_code = 200
+    inserted_id: Optional[int] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        with session.begin():
+            now = datetime.now(ZoneInfo("Asia/Tokyo"))
+            new_job = t_document_job(
+                search_id=data.search_id,
+                search_id_sub=data.search_id_sub,
+                user_id=data.user_id,
+                status="pending",
+                regenerate=regenerate,
+                attempts=0,
+                next_run_ymd=now,
+                create_ymd=now,
+                update_ymd=now,
+            )
+            session.add(new_job)
+            session.flush()
+            inserted_id = new_job.job_id
+
+    except Exception as e:
+        session.rollback()
+        print("Error:", e)
+        status_code = 500
+        return status_code, json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, str(inserted_id) if inserted_id is not None else None
+
+# t_document_jobデータ取得
+def select_t_document_job(job_id: int) -> Tuple[int, Optional[str]]:
+    """
+    t_document_job テーブルから job_id をキーに1件取得し、JSON文字列にして返す。
+      - 404: レコードが見つからない
+      - 500: 例外発生
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        record = session.query(t_document_job).filter(t_document_job.job_id == job_id).first()
+        if not record:
+            status_code = 404
+            result_str = json.dumps({"message": "t_document_job record not found"}, ensure_ascii=False)
+        else:
+            result_str = json.dumps(document_job_dict(record), ensure_ascii=False)
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, result_str
+
+# t_document_jobの実行対象を1件取得（ロック）
+def claim_t_document_job(worker_id: str, lease_seconds: int, max_attempts: int) -> Tuple[int, Optional[str]]:
+    """
+    実行可能なジョブを1件取得して status を 'running' にし、JSON文字列で返す。
+      - 対象: status が 'pending' で next_run_ymd を過ぎたもの、または 'running' のまま locked_until を過ぎたもの
+        （ワーカーの停止・プロセスの再起動で中断したジョブ）
+      - attempts を条件に含めて更新し（更新件数 1 の場合のみ取得とする）、複数のワーカー・プロセスが同じジョブを取得しないようにする
+      - 中断したジョブのうち attempts が max_attempts に達したものは 'failed' にする
+    戻り値: (200, ジョブのJSON) / (404, None) 実行可能なジョブが無い / (500, エラー情報)
+    """
+    status_code = 404
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        now = datetime.now(ZoneInfo("Asia/Tokyo"))
+        # 候補は値として取得する（ORM のオブジェクトはコミット時に失効し、次の候補の参照時に他のワーカーの更新後の値を読み直すため）
+        candidates = (
+            session.query(t_document_job.job_id, t_document_job.status, t_document_job.attempts)
+            .filter(or_(
+                and_(t_document_job.status == "pending", t_document_job.next_run_ymd <= now),
+                and_(t_document_job.status == "running", t_document_job.locked_until < now),
+            ))
+            .order_by(asc(t_document_job.job_id))
+            .limit(10)
+            .all()
+        )
+        for job in candidates:
+            expired = job.status == "running"
+            values = {"status": "running", "attempts": job.attempts + 1, "locked_by": worker_id,
+                      "locked_until": now + timedelta(seconds=lease_seconds),
+                      "update_ymd": now}
+            if expired and job.attempts >= max_attempts:
+                values = {"status": "failed", "error": "ワーカーが停止したまま再試行の上限に達しました", "locked_by": None,
+                          "locked_until": None, "update_ymd": now}
+            updated = session.execute(
+                update(t_document_job)
+                .where(t_document_job.job_id == job.job_id, t_document_job.status == job.status, t_document_job.attempts == job.attempts)
+                .values(**values)
+            ).rowcount
+            session.commit()
+            if updated == 1 and values["status"] == "running":
+                status_code = 200
+                result_str = json.dumps(document_job_dict(session.get(t_document_job, job.job_id)), ensure_ascii=False)
+                break
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, result_str
+
+# t_document_jobのリース期限を延長
+def renew_t_document_job(job_id: int, worker_id: str, lease_seconds: int) -> Tuple[int, Optional[str]]:
+    """
+    実行中のジョブの locked_until を lease_seconds 秒後に延長する（実行に時間がかかるジョブを中断とみなさないようにする）。
+      - 取得したワーカー (locked_by) と一致する場合のみ更新する
+    戻り値: (200, メッセージ) / (409, メッセージ) ジョブを保持していない / (500, エラー情報)
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        now = datetime.now(ZoneInfo("Asia/Tokyo"))
+        updated = session.execute(
+            update(t_document_job)
+            .where(t_document_job.job_id == job_id, t_document_job.status == "running", t_document_job.locked_by == worker_id)
+            .values(locked_until=now + timedelta(seconds=lease_seconds), update_ymd=now)
+        ).rowcount
+        session.commit()
+        if updated != 1:
+            status_code = 409
+            result_str = json.dumps({"message": "t_document_job is not locked by this worker"}, ensure_ascii=False)
+        else:
+            result_str = json.dumps({"message": "t_document_job renewed successfully"}, ensure_ascii=False)
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, result_str
+
+# t_document_jobの実行結果を登録
+def update_t_document_job(
+    job_id: int, worker_id: str, status: str, document_id: Optional[int] = None, error: Optional[str] = None, retry_seconds: int = 0
+) -> Tuple[int, Optional[str]]:
+    """
+    取得したジョブの実行結果を登録する。
+      - status: 'ready'（document_id を設定）/ 'failed' / 'pending'（retry_seconds 秒後に再試行）
+      - 取得したワーカー (locked_by) と一致する場合のみ更新する（中断とみなされ別のワーカーが再取得した場合は更新しない）
+    戻り値: (200, メッセージ) / (409, メッセージ) ジョブを保持していない / (500, エラー情報)
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        now = datetime.now(ZoneInfo("Asia/Tokyo"))
+        updated = session.execute(
+            update(t_document_job)
+            .where(t_document_job.job_id == job_id, t_document_job.status == "running", t_document_job.locked_by == worker_id)
+            .values(
+                status=status, document_id=document_id, error=error, locked_by=None, locked_until=None,
+                next_run_ymd=now + timedelta(seconds=retry_seconds), update_ymd=now,
+            )
+        ).rowcount
+        session.commit()
+        if updated != 1:
+            status_code = 409
+            result_str = json.dumps({"message": "t_document_job is not locked by this worker"}, ensure_ascii=False)
+        else:
+            result_str = json.dumps({"message": "t_document_job updated successfully"}, ensure_ascii=False)
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, result_str
+
+# t_dx_adviceデータ登録・更新
+def upsert_t_dx_advice(
+    search_id: int, search_id_sub: int, state: str, advice: Optional[str] = None, prompt: Optional[str] = None, error: Optional[str] = None
+) -> Tuple[int, Optional[str]]:
+    """
+    t_dx_advice テーブルに (search_id, search_id_sub) のアドバイスの生成状況を登録する（登録済みの場合は更新する）
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        with session.begin():
+            now = datetime.now(ZoneInfo("Asia/Tokyo"))
+            record = session.get(t_dx_advice, (search_id, search_id_sub))
+            if record is None:
+                record = t_dx_advice(search_id=search_id, search_id_sub=search_id_sub, create_ymd=now)
+                session.add(record)
+            record.state = state
+            record.advice = advice
+            record.prompt = prompt
+            record.error = error
+            record.update_ymd = now
+        result_str = json.dumps({"message": "t_dx_advice updated successfully"}, ensure_ascii=False)
+    except Exception as e:
+        session.rollback()
+        print("Error:", e)
+        status_code = 500
+        result_str = json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, result_str
+
+# t_dx_adviceデータ取得
+def select_t_dx_advice(search_id: int, search_id_sub: int) -> Tuple[int, Optional[str]]:
+    """
+    t_dx_advice テーブルから (search_id, search_id_sub) のアドバイスの生成状況を取得し、JSON文字列にして返す。
+      - 404: レコードが見つからない
+      - 500: 例外発生
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        record = session.get(t_dx_advice, (search_id, search_id_sub))
+        if not record:
+            status_code = 404
+            result_str = json.dumps({"message": "t_dx_advice record not found"}, ensure_ascii=False)
+        else:
+            result_str = json.dumps({
+                "search_id": record.search_id,
+                "search_id_sub": record.search_id_sub,
+                "state": record.state,
+                "advice": record.advice,
+                "prompt": record.prompt,
+                "error": record.error,
+                "create_ymd": record.create_ymd.strftime("%Y-%m-%d %H:%M:%S"),
+                "update_ymd": record.update_ymd.strftime("%Y-%m-%d %H:%M:%S"),
+            }, ensure_ascii=False)
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps({"error": "Exception occurred", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
+
+    return status_code, result_str
+
 def check_case_or_job(search_id: int, search_id_sub: int) -> Tuple[int, Optional[str]]:
     """
     d_search テーブルから (search_id, search_id_sub) のレコードを取得し、
@@ -1376,7 +1677,7 @@ def check_case_or_job(search_id: int, search_id_sub: int) -> Tuple[int, Optional
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1429,6 +1730,7 @@ def check_case_or_job(search_id: int, search_id_sub: int) -> Tuple[int, Optional
             else:
                 result_data = {
                     "flag": 1,
+                    "job_id": job_record.job_id,
                     "job_name": job_record.job_name
                 }
                 result_str = json.dumps(result_data, ensure_ascii=False)
@@ -1472,7 +1774,7 @@ def select_m_job_from_search(search_id: int, search_id_sub: int) -> Tuple[int, O
     status_code = 200
     result_str: Optional[str] = None
 
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine())
     session = Session()
 
     try:
@@ -1515,4 +1817,101 @@ def select_m_job_from_search(search_id: int, search_id_sub: int) -> Tuple[int, O
     finally:
         session.close()
 
-    return status_code, result_str
\ No newline at end of file
+    return status_code, result_str
+
+def select_talent_ids_by_job(job_id: int) -> Tuple[int, Optional[str]]:
+    """
+    talent_job から指定した職種を保有する人材の talent_id 一覧を取得する（ベクトル検索の絞り込み用）
+
+    戻り値:
+      (status_code, result_json)
+      - 200: 正常時（talent_id のリストをJSON文字列で返す。該当なしの場合は空リスト）
+      - 500: 例外発生時
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        rows = (
+            session.query(talent_job.talent_id)
+            .filter(talent_job.job_id == job_id)
+            .distinct()
+            .all()
+        )
+        result_str = json.dumps([row.talent_id for row in rows], ensure_ascii=False)
+
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps(
+            {"error": "Exception occurred", "details": str(e)},
+            ensure_ascii=False
+        )
+    finally:
+        session.close()
+
+    return status_code, result_str
+
+def select_case_ids_by_facets(
+    industry_id: Optional[int] = None,
+    company_size_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    theme_id: Optional[int] = None
+) -> Tuple[int, Optional[str]]:
+    """
+    事例対応表 (case_industry / case_company_size / case_department / case_theme) から、
+    指定したすべての条件に該当する表示対象の case_id 一覧を取得する（ベクトル検索の絞り込み用）。
+    Null の条件は絞り込みに使用しない。
+
+    戻り値:
+      (status_code, result_json)
+      - 200: 正常時（case_id のリストをJSON文字列で返す。該当なしの場合は空リスト）
+      - 500: 例外発生時
+    """
+    status_code = 200
+    result_str: Optional[str] = None
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+
+    try:
+        query = session.query(m_case.case_id).filter(m_case.is_visible == 1)
+
+        if industry_id is not None:
+            query = (
+                query.join(case_industry, m_case.case_id == case_industry.case_id)
+                     .filter(case_industry.industry_id == industry_id)
+            )
+        if company_size_id is not None:
+            query = (
+                query.join(case_company_size, m_case.case_id == case_company_size.case_id)
+                     .filter(case_company_size.company_size_id == company_size_id)
+            )
+        if department_id is not None:
+            query = (
+                query.join(case_department, m_case.case_id == case_department.case_id)
+                     .filter(case_department.department_id == department_id)
+            )
+        if theme_id is not None:
+            query = (
+                query.join(case_theme, m_case.case_id == case_theme.case_id)
+                     .filter(case_theme.theme_id == theme_id)
+            )
+
+        rows = query.distinct().all()
+        result_str = json.dumps([row.case_id for row in rows], ensure_ascii=False)
+
+    except Exception as e:
+        session.rollback()
+        status_code = 500
+        result_str = json.dumps(
+            {"error": "Exception occurred", "details": str(e)},
+            ensure_ascii=False
+        )
+    finally:
+        session.close()
+
+    return status_code, result_str
@@ -0,0 +1,19 @@
+-- 戦略文書作成ジョブ (modules/mdlDocumentJob.py)
+-- POST /strategy（wait=false）で登録したジョブをワーカーが取得・実行する
+CREATE TABLE IF NOT EXISTS t_document_job (
+  job_id        INT AUTO_INCREMENT PRIMARY KEY,
+  search_id     INT NOT NULL,
+  search_id_sub INT NOT NULL,
+  user_id       VARCHAR(255) NULL,
+  status        VARCHAR(16) NOT NULL,
+  regenerate    BOOLEAN NOT NULL DEFAULT FALSE,
+  attempts      INT NOT NULL DEFAULT 0,
+  document_id   INT NULL,
+  error         TEXT NULL,
+  locked_by     VARCHAR(255) NULL,
+  locked_until  DATETIME NULL,
+  next_run_ymd  DATETIME NOT NULL,
+  create_ymd    DATETIME NOT NULL,
+  update_ymd    DATETIME NOT NULL,
+  INDEX idx_t_document_job_status (status, next_run_ymd)
+);
@@ -0,0 +1,14 @@
+-- DXアドバイスの生成状況・結果 (modules/mdlDxAdvice.py)
+-- POST /dxAdvice?defer_advice=true でバックグラウンド生成したアドバイスを、どのワーカー・再起動後でも
+-- GET /dxAdvice / GET /dxAdvice/stream で search_id / search_id_sub を指定して取得できるよう保存する
+CREATE TABLE IF NOT EXISTS t_dx_advice (
+  search_id     INT NOT NULL,
+  search_id_sub INT NOT NULL,
+  state         VARCHAR(16) NOT NULL,
+  advice        TEXT NULL,
+  prompt        TEXT NULL,
+  error         TEXT NULL,
+  create_ymd    DATETIME NOT NULL,
+  update_ymd    DATETIME NOT NULL,
+  PRIMARY KEY (search_id, search_id_sub)
+);
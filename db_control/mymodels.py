@@ -2,7 +2,7 @@ from sqlalchemy import ForeignKey,DECIMAL, Nullable
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from datetime import datetime
 from sqlalchemy.orm import relationship
-from typing import List
+from typing import List, Optional
 
 class Base(DeclarativeBase):
     pass
@@ -213,6 +213,36 @@ class t_document(Base):
     download_ymd: Mapped[datetime] = mapped_column()
     status: Mapped[str] = mapped_column()
 
+# 戦略文書作成ジョブ: t_document_job（POST /strategy で登録し、modules.mdlDocumentJob のワーカーが処理する）
+class t_document_job(Base):
+    __tablename__ = "t_document_job"
+    job_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    search_id: Mapped[int] = mapped_column()
+    search_id_sub: Mapped[int] = mapped_column()
+    user_id: Mapped[Optional[str]] = mapped_column()
+    status: Mapped[str] = mapped_column()                   # pending / running / ready / failed
+    regenerate: Mapped[bool] = mapped_column(default=False) # 生成結果のキャッシュを使わずに生成する
+    attempts: Mapped[int] = mapped_column(default=0)        # 取得（実行開始）した回数
+    document_id: Mapped[Optional[int]] = mapped_column()    # 作成した t_document.document_id
+    error: Mapped[Optional[str]] = mapped_column()
+    locked_by: Mapped[Optional[str]] = mapped_column()      # 実行中のワーカー
+    locked_until: Mapped[Optional[datetime]] = mapped_column()  # 実行中のワーカーが停止した場合に再取得できるようになる日時
+    next_run_ymd: Mapped[datetime] = mapped_column()        # 実行可能になる日時（再試行の待ち時間）
+    create_ymd: Mapped[datetime] = mapped_column()
+    update_ymd: Mapped[datetime] = mapped_column()
+
+# DXアドバイスの生成状況・結果: t_dx_advice（/dxAdvice?defer_advice=true。テーブル定義は db_control/ddl/t_dx_advice.sql）
+class t_dx_advice(Base):
+    __tablename__ = "t_dx_advice"
+    search_id: Mapped[int] = mapped_column(primary_key=True)
+    search_id_sub: Mapped[int] = mapped_column(primary_key=True)
+    state: Mapped[str] = mapped_column()                    # running / ready / failed
+    advice: Mapped[Optional[str]] = mapped_column()
+    prompt: Mapped[Optional[str]] = mapped_column()         # 参考事例検索用のプロンプト
+    error: Mapped[Optional[str]] = mapped_column()
+    create_ymd: Mapped[datetime] = mapped_column()
+    update_ymd: Mapped[datetime] = mapped_column()
+
 class t_agent_request(Base):
     __tablename__ = "t_agent_request"
     agent_request_id: Mapped[int] = mapped_column(primary_key=True)
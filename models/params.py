@@ -50,6 +50,14 @@ class talentSearchData(BaseModel):
     search_id_sub: Optional[int] = None # 検索サブID
     job_id: Optional[int] = None # 職種ID
 
+# プロンプトによる人材検索（一括）のデータモデル
+class talentPromptQuery(BaseModel):
+    prompt: str # プロンプト
+    cnt: int = 4 # 取得件数
+
+class talentBatchSearchData(BaseModel):
+    queries: List[talentPromptQuery] # プロンプトと取得件数のリスト
+
 # 人員特定時のデータモデル
 class setTalentData(BaseModel):
     search_id: Optional[int] = None # 検索ID
@@ -61,3 +69,7 @@ class dxAdviceData(BaseModel):
     timing: Optional[str] = None # タイミング
     domain: Optional[str] = None # 課題
     free_word: Optional[str] = None # フリーワード
+    industry_id: Optional[int] = None   # 業界ID（参考事例の絞り込み）
+    company_size_id: Optional[int] = None   # 企業規模ID（参考事例の絞り込み）
+    department_id: Optional[int] = None   # 部署ID（参考事例の絞り込み）
+    theme_id: Optional[int] = None  # テーマID（参考事例の絞り込み）
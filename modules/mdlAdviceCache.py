@@ -0,0 +1,294 @@
+# DXアドバイスの回答キャッシュモジュール
+#
+# /dxAdvice (mdlDxAdvice.getAdviceCase) の GPT 出力（アドバイスと RAG 用プロンプト）を SQLite に保存し、
+# 同じ・よく似た入力では GPT を呼び出さずに保存済みの回答を返す。参考事例の検索は毎回行う（キャッシュしない）。
+#   - 完全一致: タイミング・課題・フリーワードを正規化（NFKC・前後の空白除去・連続する空白の1文字化）した値が一致する場合
+#   - 類似一致: フリーワードがある場合はフリーワードを埋め込み、タイミング・課題が同じ過去の入力のうち
+#               コサイン類似度が ADVICE_CACHE_SIMILARITY 以上で最も近いものの回答を使う
+#               （過去の入力のベクトルは タイミング・課題ごとの FAISS インデックス (内積) にプロセス内で保持し、
+#                 他のプロセスが追加した入力も参照時に SQLite から追加で読み込む）
+#   - 有効期限 ADVICE_CACHE_TTL_SECONDS 秒、件数上限 ADVICE_CACHE_SIZE 件（超えた場合は最後に使われた日時の古いものから削除）
+#   - どちらかを 0 にした場合はキャッシュを使わない。ADVICE_CACHE_SIMILARITY を 1 より大きくした場合は類似一致を使わない
+#   - GPT の出力からアドバイス・プロンプトの両方を抽出できた場合のみ保存する
+# 保存済みの回答は POST /clearDxAdviceCache で削除できる（タイミング・課題を指定した場合はその組み合わせのみ）。
+# ヒット率は GET /dxAdviceCacheStats で確認できる。
+# ※ faiss・埋め込み (langchain) は類似一致を行う場合のみ読み込む
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from typing import Optional
+
+# キャッシュ形式のバージョン（プロンプトや出力の抽出方法を変えて既存の回答を使えなくなった場合に上げる）
+PROMPT_VERSION = 1
+DEFAULT_CACHE_PATH = "rag/advice_cache.sqlite3"
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 2000
+DEFAULT_SIMILARITY = 0.92
+
+_cache = None
+_lock = threading.Lock()
+
+def normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip()
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def group_key(model: str, timing: Optional[str], domain: Optional[str]) -> str:
+    """
+    類似一致の対象を絞り込むキー（キャッシュ形式のバージョン + モデル名 + タイミング + 課題）
+    """
+    return _hash(str(PROMPT_VERSION), model, normalize_text(timing), normalize_text(domain))
+
+def exact_key(model: str, timing: Optional[str], domain: Optional[str], free_word: Optional[str]) -> str:
+    return _hash(group_key(model, timing, domain), normalize_text(free_word))
+
+class AdviceCache:
+    """
+    DXアドバイスの回答キャッシュ (SQLite + タイミング・課題ごとの FAISS インデックス)
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_size: int, similarity: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        # (group_key, 埋め込みモデル名, 次元数) -> faiss.IndexIDMap（ID は advice_cache.id）
+        self._indexes: dict = {}
+        self._loaded_id = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS advice_cache ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " exact_key TEXT NOT NULL UNIQUE,"
+                " group_key TEXT NOT NULL,"
+                " free_word TEXT NOT NULL,"
+                " embedding_model TEXT,"
+                " vector BLOB,"
+                " advice TEXT NOT NULL,"
+                " prompt TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_advice_cache_last_used ON advice_cache (last_used_at)")
+            self._conn.commit()
+        except Exception as e:
+            # キャッシュが使えない場合もアドバイスの生成は続ける
+            print("[mdlAdviceCache] キャッシュを開けませんでした:", e)
+            self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None and self.ttl_seconds > 0 and self.max_size > 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.enabled and self.similarity <= 1
+
+    def get(self, model: str, timing: Optional[str], domain: Optional[str], free_word: Optional[str]) -> Optional[dict]:
+        """
+        保存済みの回答 {"advice", "prompt", "cache": "exact" | "semantic", "similarity"} を返す（無い場合は None）
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, advice, prompt FROM advice_cache WHERE exact_key = ? AND created_at > ?",
+                (exact_key(model, timing, domain, free_word), now - self.ttl_seconds),
+            ).fetchone()
+            if row is not None:
+                self.exact_hits += 1
+                return self._use(row, now, "exact", 1.0)
+
+        free = normalize_text(free_word)
+        if not free or not self.semantic_enabled:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 埋め込みはロックの外で計算する（OpenAI API を呼び出す場合がある）
+        embedded = self._embed(free)
+        with self._lock:
+            if embedded is not None:
+                embedding_model, vector = embedded
+                row, score = self._nearest(group_key(model, timing, domain), embedding_model, vector, now)
+                if row is not None:
+                    self.semantic_hits += 1
+                    return self._use(row, now, "semantic", score)
+            self.misses += 1
+            return None
+
+    def put(self, model: str, timing: Optional[str], domain: Optional[str], free_word: Optional[str], advice: str, prompt: str) -> None:
+        if not self.enabled or not advice or not prompt:
+            return
+        free = normalize_text(free_word)
+        embedding_model, vector = None, None
+        if free and self.semantic_enabled:
+            embedded = self._embed(free)
+            if embedded is not None:
+                embedding_model, values = embedded
+                vector = array("f", values).tobytes()
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO advice_cache"
+                    " (exact_key, group_key, free_word, embedding_model, vector, advice, prompt, created_at, last_used_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (exact_key(model, timing, domain, free_word), group_key(model, timing, domain), free,
+                     embedding_model, vector, advice, prompt, now, now),
+                )
+                # 期限切れのものと、件数上限を超えた分（最後に使われた日時の古いもの）を削除する
+                deleted = self._conn.execute("DELETE FROM advice_cache WHERE created_at <= ?", (now - self.ttl_seconds,)).rowcount
+                deleted += self._conn.execute(
+                    "DELETE FROM advice_cache WHERE id IN ("
+                    " SELECT id FROM advice_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,),
+                ).rowcount
+                self._conn.commit()
+                if deleted:
+                    self._reset_indexes()
+            except Exception as e:
+                print("[mdlAdviceCache] キャッシュへの書き込みに失敗しました:", e)
+
+    def invalidate(self, model: str, timing: Optional[str] = None, domain: Optional[str] = None) -> int:
+        """
+        保存済みの回答を削除し、削除した件数を返す。
+        timing / domain のどちらかを指定した場合はその組み合わせの回答のみ、どちらも省略した場合はすべて削除する
+        """
+        if self._conn is None:
+            return 0
+        with self._lock:
+            if timing is None and domain is None:
+                deleted = self._conn.execute("DELETE FROM advice_cache").rowcount
+            else:
+                deleted = self._conn.execute(
+                    "DELETE FROM advice_cache WHERE group_key = ?", (group_key(model, timing, domain),)
+                ).rowcount
+            self._conn.commit()
+            self._reset_indexes()
+        print(f"[mdlAdviceCache] キャッシュを {deleted} 件削除しました")
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            entries = None
+            if self._conn is not None:
+                entries = self._conn.execute("SELECT COUNT(*) FROM advice_cache").fetchone()[0]
+            return {
+                "enabled": self.enabled,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "indexed_vectors": sum(index.ntotal for index in self._indexes.values()),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity": self.similarity,
+                "prompt_version": PROMPT_VERSION,
+                "path": self.path,
+            }
+
+    def _use(self, row, now: float, kind: str, score: float) -> dict:
+        # ロック取得済みの前提で呼び出す
+        self._conn.execute("UPDATE advice_cache SET last_used_at = ? WHERE id = ?", (now, row[0]))
+        self._conn.commit()
+        return {"advice": row[1], "prompt": row[2], "cache": kind, "similarity": round(float(score), 4)}
+
+    @staticmethod
+    def _embed(text: str) -> Optional[tuple[str, list[float]]]:
+        """
+        フリーワードを埋め込み、(埋め込みモデル名, ベクトル) を返す（失敗した場合は None とし、類似一致を行わない）
+        """
+        try:
+            from modules.mdlEmbedding import get_embeddings, embedding_model_name
+            embeddings = get_embeddings()
+            return embedding_model_name(embeddings), embeddings.embed_query(text)
+        except Exception as e:
+            print("[mdlAdviceCache] フリーワードの埋め込みに失敗しました:", e)
+            return None
+
+    def _reset_indexes(self) -> None:
+        # ロック取得済みの前提で呼び出す（次回の参照時に SQLite から作り直す）
+        self._indexes = {}
+        self._loaded_id = 0
+
+    def _load_new_rows(self) -> None:
+        """
+        前回以降に追加された入力のベクトルをインデックスに追加する（ロック取得済みの前提で呼び出す）
+        """
+        import numpy as np
+        import faiss
+
+        rows = self._conn.execute(
+            "SELECT id, group_key, embedding_model, vector FROM advice_cache WHERE id > ? AND vector IS NOT NULL ORDER BY id",
+            (self._loaded_id,),
+        ).fetchall()
+        for row_id, group, embedding_model, blob in rows:
+            self._loaded_id = row_id
+            vector = np.frombuffer(blob, dtype="float32").reshape(1, -1).copy()
+            faiss.normalize_L2(vector)
+            key = (group, embedding_model, vector.shape[1])
+            if key not in self._indexes:
+                self._indexes[key] = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            self._indexes[key].add_with_ids(vector, np.array([row_id], dtype="int64"))
+
+    def _nearest(self, group: str, embedding_model: str, values: list[float], now: float):
+        """
+        タイミング・課題が同じ過去の入力のうち、類似度が閾値以上で最も近いものの (行, 類似度) を返す（ロック取得済みの前提で呼び出す）
+        """
+        import numpy as np
+        import faiss
+
+        self._load_new_rows()
+        vector = np.array([values], dtype="float32")
+        faiss.normalize_L2(vector)
+        index = self._indexes.get((group, embedding_model, vector.shape[1]))
+        if index is None or index.ntotal == 0:
+            return None, 0.0
+        # 期限切れ・削除済みの行も含まれるため、上位数件を順に確認する
+        scores, ids = index.search(vector, min(8, index.ntotal))
+        for score, row_id in zip(scores[0], ids[0]):
+            if row_id < 0 or score < self.similarity:
+                break
+            row = self._conn.execute(
+                "SELECT id, advice, prompt FROM advice_cache WHERE id = ? AND created_at > ?",
+                (int(row_id), now - self.ttl_seconds),
+            ).fetchone()
+            if row is not None:
+                return row, score
+        return None, 0.0
+
+def get_advice_cache() -> AdviceCache:
+    """
+    プロセス内で共有する AdviceCache を返す（未作成なら作成する）
+    """
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = AdviceCache(
+                    os.getenv("ADVICE_CACHE_PATH") or DEFAULT_CACHE_PATH,
+                    int(os.getenv("ADVICE_CACHE_TTL_SECONDS") or DEFAULT_CACHE_TTL_SECONDS),
+                    int(os.getenv("ADVICE_CACHE_SIZE") or DEFAULT_CACHE_SIZE),
+                    float(os.getenv("ADVICE_CACHE_SIMILARITY") or DEFAULT_SIMILARITY),
+                )
+    return _cache
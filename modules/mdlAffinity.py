@@ -0,0 +1,222 @@
+# 事例→人材の類似度事前計算モジュール
+#
+# 事例インデックスと人材インデックスのベクトルから、全事例 x 全人材の距離を行列積でまとめて計算し、
+# 事例ごとに距離が近い上位 N 人の talent_id を配列ファイルに保存する。
+# /searchResults（事例の場合）は保存済みの配列を参照するだけで、埋め込み API 呼び出しも ANN 検索も行わない。
+#
+# ディレクトリ構成（バージョン管理は modules.mdlIndexVersion と同じ）:
+#   rag/case_talent_affinity/
+#     manifest.json          … versions[<version>] に計算元の talent / case のインデックスのバージョンを記録
+#     versions/<version>/
+#       case_ids.npy         … 行 i の事例の case_id (int64)
+#       talent_ids.npy       … 行 i の事例に近い順の talent_id (int64, 事例数 x N)
+#       distances.npy        … talent_ids と同じ並びの L2 距離の2乗 (float32)
+# 計算元のインデックスのどちらかが更新されると、再計算されるまで参照されない（ANN 検索にフォールバックする）。
+# 再計算はファイルロックで1プロセスずつ行い、別のプロセスが計算中の場合は完了を待って保存された結果を読み込む。
+import os
+import json
+import time
+import threading
+import numpy as np
+import faiss
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+import vectorstore_global
+from modules.mdlIndexVersion import (
+    current_index_dir, current_version, new_version_dir, publish_version, read_manifest, rebuild_lock
+)
+from modules.mdlVectorstore import owner_rows
+
+AFFINITY_DIR = "rag/case_talent_affinity"
+# 事例ごとに保持する人材数（環境変数 AFFINITY_TOP_N）
+DEFAULT_TOP_N = 20
+# 一度に距離を計算する事例のベクトル数（メモリ使用量の上限: BLOCK_ROWS x 人材ベクトル数 x 4 バイト）
+BLOCK_ROWS = 1024
+# 別のプロセスが事前計算中の場合に、ファイルロックの解放を確認する間隔（秒）
+REFRESH_POLL_SECONDS = 2
+
+_refresh_lock = threading.Lock()
+
+def index_vectors(index) -> np.ndarray:
+    """
+    インデックスに格納されたベクトルを行番号順の行列として取り出す（IVF は direct map を作成してから取り出す）
+    """
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+def group_by_owner(vs, owner_key: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    FAISS の行を所有者ID順に並べ替えるための (所有者IDの配列, 並べ替え後の行番号, 各所有者の先頭位置) を返す
+    """
+    rows_by_owner = owner_rows(vs, owner_key)
+    owners = np.array(sorted(rows_by_owner), dtype=np.int64)
+    order = np.array([row for owner in owners for row in rows_by_owner[int(owner)]], dtype=np.int64)
+    counts = np.array([len(rows_by_owner[int(owner)]) for owner in owners], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    return owners, order, starts
+
+def compute_affinity(case_vs, talent_vs, top_n: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    全事例 x 全人材の L2 距離の2乗を行列積 (|c|^2 - 2 c・t + |t|^2) で計算し、事例ごとに近い順の上位 top_n 人を返す。
+    1件の事例・人材が複数の Document に分かれている場合は、Document 間の最小距離をその事例・人材の距離とする。
+    """
+    case_ids, case_order, case_starts = group_by_owner(case_vs, "case_id")
+    talent_ids, talent_order, talent_starts = group_by_owner(talent_vs, "talent_id")
+    if len(case_ids) == 0 or len(talent_ids) == 0:
+        raise ValueError("事例または人材のインデックスが空です")
+
+    case_vectors = index_vectors(case_vs.index)[case_order]
+    talent_vectors = index_vectors(talent_vs.index)[talent_order]
+    if case_vectors.shape[1] != talent_vectors.shape[1]:
+        raise ValueError(f"ベクトルの次元数が一致しません (case: {case_vectors.shape[1]}, talent: {talent_vectors.shape[1]})")
+    talent_norms = (talent_vectors ** 2).sum(axis=1)
+
+    top_n = min(top_n, len(talent_ids))
+    n_cases = len(case_ids)
+    # 事例の Document 単位で計算し、最後に事例単位へ集約する
+    doc_distances = np.empty((len(case_vectors), len(talent_ids)), dtype=np.float32) if len(case_vectors) != n_cases else None
+    best_ids = np.empty((n_cases, top_n), dtype=np.int64)
+    best_distances = np.empty((n_cases, top_n), dtype=np.float32)
+
+    for start in range(0, len(case_vectors), BLOCK_ROWS):
+        block = case_vectors[start:start + BLOCK_ROWS]
+        distances = (block ** 2).sum(axis=1)[:, None] - 2 * block @ talent_vectors.T + talent_norms[None, :]
+        # 人材の Document を人材単位に集約（最小距離）
+        distances = np.minimum.reduceat(distances, talent_starts, axis=1)
+        if doc_distances is not None:
+            doc_distances[start:start + len(block)] = distances
+            continue
+        top = np.argpartition(distances, top_n - 1, axis=1)[:, :top_n]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        best_ids[start:start + len(block)] = talent_ids[np.take_along_axis(top, order, axis=1)]
+        best_distances[start:start + len(block)] = np.take_along_axis(top_distances, order, axis=1)
+
+    if doc_distances is not None:
+        # 事例の Document を事例単位に集約（最小距離）してから上位を選ぶ
+        distances = np.minimum.reduceat(doc_distances, case_starts, axis=0)
+        top = np.argpartition(distances, top_n - 1, axis=1)[:, :top_n]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        best_ids = talent_ids[np.take_along_axis(top, order, axis=1)]
+        best_distances = np.take_along_axis(top_distances, order, axis=1)
+
+    return case_ids, best_ids, np.maximum(best_distances, 0).astype(np.float32)
+
+def source_versions() -> dict:
+    """
+    このプロセスで稼働中の talent / case インデックスのバージョン（ディスクは参照しない）
+    """
+    versions = vectorstore_global.loaded_versions
+    return {"talent_version": versions["talent"], "case_version": versions["case"]}
+
+def is_current(affinity: Optional[dict]) -> bool:
+    """
+    事前計算の計算元が、このプロセスで稼働中の talent / case インデックスのバージョンと一致するか
+    （別のプロセスが再作成したインデックスから計算した結果は、このプロセスのインデックスを差し替えるまで参照しない）
+    """
+    if affinity is None:
+        return False
+    info = affinity["info"]
+    return all(info.get(key) == value for key, value in source_versions().items())
+
+def load_affinity() -> Optional[dict]:
+    """
+    現在のバージョンの事前計算結果を読み込み vectorstore_global に設定する。無い場合は None
+    """
+    index_dir = current_index_dir(AFFINITY_DIR)
+    if index_dir is None:
+        vectorstore_global.case_talent_affinity = None
+        return None
+    manifest = read_manifest(AFFINITY_DIR) or {}
+    case_ids = np.load(os.path.join(index_dir, "case_ids.npy"))
+    affinity = {
+        "info": manifest.get("versions", {}).get(current_version(AFFINITY_DIR), {}),
+        "rows": {int(case_id): row for row, case_id in enumerate(case_ids)},
+        "talent_ids": np.load(os.path.join(index_dir, "talent_ids.npy"), mmap_mode="r"),
+        "distances": np.load(os.path.join(index_dir, "distances.npy"), mmap_mode="r"),
+    }
+    vectorstore_global.case_talent_affinity = affinity
+    return affinity
+
+def refresh_affinity(force: bool = False) -> Optional[dict]:
+    """
+    talent / case の両方のインデックスが読み込まれている場合に事前計算を行い、新しいバージョンとして保存・差し替える。
+    force=False で既存の結果が現在のインデックスから計算済みの場合は何もしない。
+    再計算は AFFINITY_DIR のファイルロックを取得したプロセスだけが行う。別のプロセスが計算中の場合は完了を待ち、
+    保存された結果がこのプロセスのインデックスから計算されたものであれば再計算せずに読み込む（force=True の場合も同様）。
+    """
+    with _refresh_lock:
+        waited = False
+        while True:
+            with rebuild_lock(AFFINITY_DIR) as acquired:
+                if acquired:
+                    return _refresh_affinity(force and not waited)
+            if not waited:
+                print("[mdlAffinity] 別のプロセスで事前計算中のため、完了を待ってから結果を読み込みます")
+                waited = True
+            time.sleep(REFRESH_POLL_SECONDS)
+
+def _refresh_affinity(force: bool) -> Optional[dict]:
+    # ※ 呼び出し元 (refresh_affinity) で _refresh_lock と AFFINITY_DIR のファイルロックを取得していること
+    versions = source_versions()
+    talent_vs = vectorstore_global.talent_vectorstore
+    case_vs = vectorstore_global.case_vectorstore
+    if talent_vs is None or case_vs is None:
+        print("[mdlAffinity] talent / case のインデックスが揃っていないため、事前計算をスキップしました。")
+        return None
+
+    affinity = vectorstore_global.case_talent_affinity
+    if not is_current(affinity) and current_index_dir(AFFINITY_DIR) is not None:
+        # 別のプロセスが計算・保存した結果を読み込む
+        affinity = load_affinity()
+    if not force and is_current(affinity):
+        return affinity
+
+    top_n = int(os.getenv("AFFINITY_TOP_N") or DEFAULT_TOP_N)
+    started = datetime.now()
+    case_ids, talent_ids, distances = compute_affinity(case_vs, talent_vs, top_n)
+
+    version, index_dir = new_version_dir(AFFINITY_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "case_ids.npy"), case_ids)
+    np.save(os.path.join(index_dir, "talent_ids.npy"), talent_ids)
+    np.save(os.path.join(index_dir, "distances.npy"), distances)
+    info = {
+        "created_at": datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S"),
+        "cases": len(case_ids),
+        "top_n": int(talent_ids.shape[1]),
+        **versions,
+    }
+    publish_version(AFFINITY_DIR, version, info)
+    affinity = load_affinity()
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"[mdlAffinity] 事例→人材の類似度を事前計算しました: 事例 {len(case_ids)} 件 x 上位 {info['top_n']} 人 ({elapsed:.2f}秒)")
+    return affinity
+
+def lookup_talent_ids(case_id: int, k: int, affinity: Optional[dict] = None) -> Optional[list[int]]:
+    """
+    事前計算結果から事例に近い上位 k 人の talent_id を返す。
+    事前計算が無い・古い・事例が含まれない・k が保持数を超える場合は None（呼び出し元で ANN 検索にフォールバックする）
+    affinity を指定した場合はその事前計算結果を参照する（距離なども同じ結果から取得する場合）
+    """
+    if affinity is None:
+        affinity = vectorstore_global.case_talent_affinity
+    if not is_current(affinity):
+        return None
+    row = affinity["rows"].get(int(case_id))
+    if row is None or k > affinity["talent_ids"].shape[1]:
+        return None
+    return [int(talent_id) for talent_id in affinity["talent_ids"][row, :k]]
+
+# 事前計算を手動で再実行する
+def refreshAffinity() -> tuple[int, str]:
+    affinity = refresh_affinity(force=True)
+    if affinity is None:
+        result = {"message": "talent / case のインデックスが読み込まれていないため、事前計算できません。"}
+        return 409, json.dumps(result, ensure_ascii=False)
+    return 200, json.dumps({"message": "Affinity refreshed.", **affinity["info"]}, ensure_ascii=False)
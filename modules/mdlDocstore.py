@@ -0,0 +1,101 @@
+# メモリマップ型 Docstore モジュール
+#
+# index.pkl (pickle) の代わりに、Document をバージョンディレクトリ内の以下のファイルへ保存する。
+#   docstore.bin          … Document (id / page_content / metadata) を JSON にした UTF-8 バイト列を連結したもの
+#   docstore.offsets.npy  … FAISS の行番号 i の Document が docstore.bin の [offsets[i], offsets[i+1]) にあることを示す int64 配列
+#   docstore.ids.json     … FAISS の行番号順の docstore ID
+# 読み込み時は docstore.bin / offsets を mmap で開くだけで、Document は検索でヒットした分だけデコードする。
+# ファイルは読み取り専用でマップされるため、同一インスタンス上の複数ワーカー間で OS のページキャッシュを共有できる。
+import os
+import json
+import mmap
+import numpy as np
+from typing import Union
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+DATA_FILE = "docstore.bin"
+OFFSETS_FILE = "docstore.offsets.npy"
+IDS_FILE = "docstore.ids.json"
+
+def has_mmap_docstore(directory: str) -> bool:
+    return all(os.path.exists(os.path.join(directory, name)) for name in (DATA_FILE, OFFSETS_FILE, IDS_FILE))
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    docstore.bin を mmap した読み取り専用の Docstore。
+    差分更新(sync)用に add / delete はメモリ上の差分として保持し、保存時にファイルへ書き出す。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, IDS_FILE), "r", encoding="utf-8") as f:
+            self.ids: list[str] = json.load(f)
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+
+        self._data = None
+        data_path = os.path.join(directory, DATA_FILE)
+        if os.path.getsize(data_path) > 0:
+            with open(data_path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._added: dict[str, Document] = {}
+        self._deleted: set[str] = set()
+
+    def _decode(self, row: int) -> Document:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        record = json.loads(self._data[start:end].decode("utf-8"))
+        return Document(id=record["id"], page_content=record["page_content"], metadata=record["metadata"])
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        row = self._rows.get(search)
+        if row is None or search in self._deleted:
+            return f"ID {search} not found."
+        return self._decode(row)
+
+    def add(self, texts: dict[str, Document]) -> None:
+        overlapping = {doc_id for doc_id in texts if doc_id in self}
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: list) -> None:
+        if not any(doc_id in self for doc_id in ids):
+            raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+        for doc_id in ids:
+            if doc_id in self._added:
+                del self._added[doc_id]
+            elif doc_id in self._rows:
+                self._deleted.add(doc_id)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._added or (doc_id in self._rows and doc_id not in self._deleted)
+
+def save_docstore(directory: str, docstore: Docstore, index_to_docstore_id: dict[int, str]) -> None:
+    """
+    FAISS の行番号順に Document を docstore.bin へ書き出し、offsets / ids を保存する。
+    """
+    os.makedirs(directory, exist_ok=True)
+    ids = [doc_id for _, doc_id in sorted(index_to_docstore_id.items())]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+
+    with open(os.path.join(directory, DATA_FILE), "wb") as f:
+        position = 0
+        for row, doc_id in enumerate(ids):
+            doc = docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {doc_id}, got {doc}")
+            record = json.dumps(
+                {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False,
+            ).encode("utf-8")
+            f.write(record)
+            position += len(record)
+            offsets[row + 1] = position
+
+    np.save(os.path.join(directory, OFFSETS_FILE), offsets)
+    with open(os.path.join(directory, IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(ids, f, ensure_ascii=False)
@@ -0,0 +1,211 @@
+# 戦略文書作成ジョブ（DB のキューテーブル）モジュール
+#
+# POST /strategy はジョブを t_document_job に登録して即座に job_id を返し、戦略文書の作成 (mdlStrategy.createDoc) は
+# ワーカースレッドで実行する。ジョブは DB に保持するため、リクエストのタイムアウトやプロセスの再起動で失われない。
+#   pending（実行待ち）→ running（実行中）→ ready（作成済み。document_id を設定）/ failed（失敗）
+#   - 同時に実行するジョブ数はワーカー数（環境変数 STRATEGY_WORKERS。0 の場合はこのプロセスではジョブを実行しない）
+#   - ワーカーは起動時 (lifespan) にバックグラウンドのスレッドで開始し、前回のプロセスで残ったジョブもすぐに実行する
+#     （DB への接続はワーカースレッドで行い、起動は待たせない）。
+#     DOCUMENT_JOB_START_ON_BOOT=FALSE の場合は、このプロセスで最初にジョブを登録した時、または
+#     GET /strategy?job_id=... で実行待ち・実行中のジョブを参照した時に起動する
+#   - 失敗したジョブは DOCUMENT_JOB_MAX_ATTEMPTS 回まで、DOCUMENT_JOB_RETRY_SECONDS × 2^(回数-1) 秒後に再試行する
+#     （ユーザー・検索情報・事例が見つからない場合 (404) は再試行しない）
+#   - 実行中のまま DOCUMENT_JOB_LEASE_SECONDS 秒を過ぎたジョブ（ワーカーの停止・プロセスの再起動で中断したもの）は再取得して実行し直す
+#     （実行中のワーカーは DOCUMENT_JOB_LEASE_SECONDS / HEARTBEAT_DIVISOR 秒ごとに期限を延長するため、生成に時間がかかるだけのジョブは再取得しない）
+#   - ジョブの取得は t_document_job の更新件数で判定するため、複数のプロセス・インスタンスで同じテーブルを共有できる
+#   - ジョブの取得でエラーになった場合（テーブルが無いなど）は、確認の間隔を最大 MAX_BACKOFF_SECONDS 秒まで倍々に延ばす
+#   - regenerate を指定したジョブは生成結果のキャッシュ (mdlStrategyCache) を使わずに生成する
+# 状態は GET /strategy?job_id=... で確認する。
+# テーブル定義: db_control/ddl/t_document_job.sql
+import os
+import json
+import socket
+import threading
+import traceback
+from fastapi import HTTPException
+from models.params import userData
+from db_control import crud
+from modules import mdlStrategy
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_SECONDS = 30
+DEFAULT_LEASE_SECONDS = 600
+# 実行可能なジョブが無い場合にテーブルを確認する間隔（秒）。同じプロセスで登録されたジョブは待たずに実行する
+POLL_SECONDS = 5
+# ジョブの取得でエラーが続く場合の確認間隔の上限（秒）
+MAX_BACKOFF_SECONDS = 300
+# 実行中のジョブのリース期限を延長する間隔（リース期間をこの値で割った秒数）
+HEARTBEAT_DIVISOR = 3
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers: list[threading.Thread] = []
+_lock = threading.Lock()
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def worker_count() -> int:
+    return max(0, _env_int("STRATEGY_WORKERS", DEFAULT_WORKERS))
+
+def start_on_boot() -> bool:
+    return os.getenv("DOCUMENT_JOB_START_ON_BOOT", "TRUE") != "FALSE"
+
+def max_attempts() -> int:
+    return max(1, _env_int("DOCUMENT_JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+
+def lease_seconds() -> int:
+    return max(1, _env_int("DOCUMENT_JOB_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+
+def retry_seconds(attempts: int) -> int:
+    return _env_int("DOCUMENT_JOB_RETRY_SECONDS", DEFAULT_RETRY_SECONDS) * 2 ** max(0, attempts - 1)
+
+# 戦略文書作成ジョブを登録する
+def submitDoc(data: userData, regenerate: bool = False) -> tuple[int, str]:
+    """
+    ユーザー・検索情報・事例を確認したうえでジョブを登録し、(202, ジョブ情報JSON) を返す。
+    見つからない場合は createDoc と同様に 404 を返す（ジョブは登録しない）。
+    """
+    status, result = mdlStrategy.buildStrategyPrompt(data)
+    if status != 200:
+        return status, result
+
+    status, job_id = crud.insert_t_document_job(data, regenerate)
+    if status != 200:
+        error_detail = json.loads(job_id) if job_id is not None else {"error": "Unknown error"}
+        raise HTTPException(status_code=status, detail=error_detail)
+    start_workers()
+    _wakeup.set()
+
+    status, result = crud.select_t_document_job(int(job_id))
+    if status != 200:
+        raise HTTPException(status_code=status, detail=json.loads(result))
+    return 202, result
+
+# 戦略文書作成ジョブの状態を取得する（ready の場合は戦略文書も返す）
+def getDocJob(search_id: int, search_id_sub: int, job_id: int) -> tuple[int, str]:
+    status, result = crud.select_t_document_job(job_id)
+    if status != 200:
+        return status, result
+    job = json.loads(result)
+    if job["search_id"] != search_id or job["search_id_sub"] != search_id_sub:
+        return 404, json.dumps({"message": "t_document_job record not found"}, ensure_ascii=False)
+    if job["status"] in ("pending", "running"):
+        # 再起動後にジョブを登録していないプロセスでも、残ったジョブ（中断したものを含む）を実行する
+        start_workers()
+
+    if job["status"] == "ready":
+        status, document = crud.select_t_document(job["document_id"])
+        if status != 200:
+            return status, document
+        job["document"] = json.loads(document)["document"]
+    return 200, json.dumps(job, ensure_ascii=False)
+
+def _heartbeat(job_id: int, worker_id: str, stop: threading.Event) -> None:
+    """
+    stop が set されるまで、実行中のジョブのリース期限を定期的に延長する
+    """
+    lease = lease_seconds()
+    while not stop.wait(max(1, lease // HEARTBEAT_DIVISOR)):
+        status, result = crud.renew_t_document_job(job_id, worker_id, lease)
+        if status == 409:
+            # 別のワーカーが再取得した（このワーカーの結果は登録されない）
+            print(f"[mdlDocumentJob] 戦略文書作成ジョブ {job_id} のリースを失いました ({worker_id})")
+            return
+        if status != 200:
+            print(f"[mdlDocumentJob] 戦略文書作成ジョブ {job_id} のリース期限を延長できませんでした: {result}")
+
+def run_job(job: dict, worker_id: str) -> None:
+    """
+    取得したジョブを実行し、結果（ready / 再試行 / failed）を t_document_job に登録する
+    """
+    data = userData(search_id=job["search_id"], search_id_sub=job["search_id_sub"], user_id=job["user_id"])
+    print(f"[mdlDocumentJob] 戦略文書作成ジョブを開始しました: {job['job_id']} ({job['attempts']}回目, {worker_id})")
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, args=(job["job_id"], worker_id, stop_heartbeat), name=f"document-job-heartbeat-{job['job_id']}", daemon=True
+    )
+    heartbeat.start()
+    try:
+        status, result = mdlStrategy.createDoc(data, job["regenerate"])
+    except HTTPException as e:
+        status, result = e.status_code, json.dumps(e.detail, ensure_ascii=False)
+    except Exception as e:
+        traceback.print_exc()
+        status, result = 500, json.dumps({"message": "strategy generation failed", "details": str(e)}, ensure_ascii=False)
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    if status == 200:
+        update_status, update_result = crud.update_t_document_job(job["job_id"], worker_id, "ready", document_id=int(result))
+    elif status == 404 or job["attempts"] >= max_attempts():
+        update_status, update_result = crud.update_t_document_job(job["job_id"], worker_id, "failed", error=result)
+    else:
+        wait = retry_seconds(job["attempts"])
+        update_status, update_result = crud.update_t_document_job(job["job_id"], worker_id, "pending", error=result, retry_seconds=wait)
+        if update_status == 200:
+            print(f"[mdlDocumentJob] 戦略文書作成ジョブ {job['job_id']} は {wait} 秒後に再試行します: {result}")
+
+    if update_status == 409:
+        # 中断とみなされ別のワーカーが再取得した場合は、そのワーカーの結果を優先する
+        extra = f"（登録した t_document の document_id={result} は参照されません）" if status == 200 else ""
+        print(f"[mdlDocumentJob] 戦略文書作成ジョブ {job['job_id']} は別のワーカーが実行しているため、結果を登録しませんでした{extra}")
+    elif update_status != 200:
+        # 登録できなかったジョブは DOCUMENT_JOB_LEASE_SECONDS の経過後に再取得して実行し直す
+        print(f"[mdlDocumentJob] 戦略文書作成ジョブ {job['job_id']} の結果を登録できませんでした: {update_result}")
+    print(f"[mdlDocumentJob] 戦略文書作成ジョブが終了しました: {job['job_id']} (status={status})")
+
+def _worker_loop(worker_id: str) -> None:
+    errors = 0  # 連続したエラーの回数
+    while not _stop.is_set():
+        try:
+            status, result = crud.claim_t_document_job(worker_id, lease_seconds(), max_attempts())
+            if status == 200:
+                errors = 0
+                run_job(json.loads(result), worker_id)
+                continue
+            if status == 404:
+                errors = 0
+            else:
+                errors += 1
+                print(f"[mdlDocumentJob] ジョブの取得でエラーが発生しました（{errors}回連続）: {result}")
+        except Exception as e:
+            errors += 1
+            print("[mdlDocumentJob] ワーカーでエラーが発生しました:", e)
+            traceback.print_exc()
+        wait = POLL_SECONDS if errors == 0 else min(MAX_BACKOFF_SECONDS, POLL_SECONDS * 2 ** errors)
+        if errors:
+            print(f"[mdlDocumentJob] {wait} 秒後に再確認します（t_document_job が無い場合は db_control/ddl/t_document_job.sql を適用してください）")
+        _wakeup.wait(wait)
+        _wakeup.clear()
+
+def start_workers() -> list[threading.Thread]:
+    """
+    STRATEGY_WORKERS 個のワーカースレッドを起動する（起動済みの場合は何もしない。起動前に登録・中断されたジョブも実行する）
+    """
+    with _lock:
+        if _workers or worker_count() == 0:
+            return _workers
+        _stop.clear()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(worker_count()):
+            thread = threading.Thread(target=_worker_loop, args=(f"{prefix}:{i}",), name=f"document-job-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+    print(f"[mdlDocumentJob] 戦略文書作成ワーカーを {len(_workers)} 個起動しました")
+    return _workers
+
+def stop_workers(timeout: float = 5) -> None:
+    """
+    ワーカーを停止する（シャットダウン時）。実行中のジョブは終了を timeout 秒まで待ち、
+    終わらなかったジョブは DOCUMENT_JOB_LEASE_SECONDS の経過後に別のワーカーが再実行する
+    """
+    with _lock:
+        _stop.set()
+        _wakeup.set()
+        for thread in _workers:
+            thread.join(timeout)
+        _workers.clear()
@@ -1,15 +1,39 @@
 import json
 import re
+import time
+import threading
+import traceback
 from db_control import crud
 from fastapi import HTTPException
 from models.params import caseSearchData, dxAdviceData
-from typing import Final,Dict
-import vectorstore_global
+from typing import Final,Dict,Optional,Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from modules.mdlIndexLoader import require_vectorstore
+from modules.mdlAdviceCache import get_advice_cache
+from modules.mdlStrategy import StrategyStreamFilter, sse_event
 # from dotenv import load_dotenv
 import os
-import openai
 
 SEARCH_MODE: Final[int] = 2  #アドバイス取得のため2を指定
+# アドバイスの生成に使用するモデル
+ADVICE_MODEL: Final[str] = "gpt-4o-mini"
+# GPT の出力のうちアドバイスの本文を囲むマーカー
+ADVICE_START_MARKER: Final[str] = "<<START_ADVICE>>"
+ADVICE_END_MARKER: Final[str] = "<<END_ADVICE>>"
+# defer_advice で生成中のアドバイスをメモリに保持する件数（t_dx_advice に保存できなかったものを含む。超えた場合は生成済みのものから古い順に削除する）
+# ※ 生成状況・結果は t_dx_advice に保存し、どのワーカープロセスからも取得できる（生成中の本文のみプロセス内のメモリに保持する）
+MAX_ADVICE_JOBS = 500
+# GET /dxAdvice/stream で本文が届かない間に keep-alive のコメント行を送る間隔（秒）
+STREAM_KEEPALIVE_SECONDS = 15
+# 別のプロセスで生成中のアドバイスの完了を t_dx_advice で確認する間隔（秒）
+ADVICE_POLL_SECONDS = 1
+# t_dx_advice で生成中のまま更新されない場合に中断とみなす秒数
+ADVICE_STALE_SECONDS = 600
+
+_advice_jobs: dict[tuple[int, int], dict] = {}
+_advice_changed = threading.Condition()
 
 def build_chatgpt_advice_and_rag_prompt(data: dxAdviceData) -> str:
     timing = data.timing or "不明なタイミング"
@@ -57,24 +81,111 @@ def build_chatgpt_advice_and_rag_prompt(data: dxAdviceData) -> str:
 
     return prompt
 
-# アドバイスを生成し参考事例を取得する
-def getAdviceCase(data:dxAdviceData) -> tuple[int, str]:
-    
-    ############################################################
-    # 1.検索データをDBへ登録
-    ############################################################
+def generate_advice(
+    data: dxAdviceData, prompt: str, on_delta: Optional[Callable[[str], None]] = None, cancel: Optional[threading.Event] = None
+) -> tuple[str, str]:
+    """
+    現状を踏まえたアドバイスと参考事例検索用のプロンプトを GPT で生成し、(advice, prompt_rag) を返す。
+    キャッシュ済みの回答があれば GPT を呼び出さない。
+    on_delta を指定した場合は GPT の出力をストリーミングで受け取り、アドバイスの本文の断片を on_delta に渡す
+    （キャッシュ済みの場合・GPT を呼び出さない場合・本文を抽出できなかった場合はアドバイス全体を1回で渡す）
+    cancel を指定した場合もストリーミングで受け取り、cancel が set された時点で GPT の出力の受信を打ち切る
+    （検索データの DB 登録に失敗した場合など。打ち切った場合はキャッシュせず、既定のアドバイスを返す）
+    """
+    advice = "アドバイス(Sample)"
+    prompt_rag = "いい感じの事例を抽出してください"
+    DO_GPT = os.getenv("DO_GPT") 
+    sent = ""  # on_delta に渡したアドバイスの本文
+    # 同じ・よく似た入力（タイミング・課題・フリーワード）の回答がキャッシュにあれば GPT を呼び出さない
+    cached = get_advice_cache().get(ADVICE_MODEL, data.timing, data.domain, data.free_word) if DO_GPT == "TRUE" else None
+    if cached is not None:
+        print(f"[mdlDxAdvice] キャッシュ済みのアドバイスを使います ({cached['cache']}, similarity={cached['similarity']})")
+        advice = cached["advice"]
+        prompt_rag = cached["prompt"]
+    elif DO_GPT == "TRUE":
+        # GPTによる戦略文書生成（openai は GPT を呼び出す場合のみ読み込む）
+        import openai
+        openai.api_key = os.getenv("OPEN_AI_API_KEY")
+        if on_delta is None and cancel is None:
+            response =  openai.chat.completions.create(
+                model=ADVICE_MODEL,
+                messages=[{"role": "user", "content": prompt},],
+            )
+            # レスポンスを解析
+            output_content = response.choices[0].message.content.strip()
+        else:
+            stream_filter = StrategyStreamFilter(ADVICE_START_MARKER, ADVICE_END_MARKER)
+            stream = openai.chat.completions.create(
+                model=ADVICE_MODEL,
+                messages=[{"role": "user", "content": prompt},],
+                stream=True,
+            )
+            try:
+                for chunk in stream:
+                    if cancel is not None and cancel.is_set():
+                        print("[mdlDxAdvice] アドバイスの生成を中断しました")
+                        return advice, prompt_rag
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    out = stream_filter.feed(text or "")
+                    if out and on_delta is not None:
+                        on_delta(out)
+            finally:
+                stream.close()
+            if stream_filter.state == "body":
+                # 終了マーカーが無いまま出力が終わった場合は、マーカーとの一致を確認するため保留していた末尾も渡す
+                out = stream_filter.finish()
+                if out and on_delta is not None:
+                    on_delta(out)
+            sent = stream_filter.body
+            output_content = stream_filter.raw.strip()
+        # デバッグ用: GPTの出力を確認
+        print("GPT Raw Output:", output_content)
+
+        # アドバイス部分を抽出
+        start_index = output_content.find(ADVICE_START_MARKER)
+        end_index = output_content.find(ADVICE_END_MARKER)
+        if start_index != -1 and end_index != -1:
+            # マーカー直後から開始、終了マーカー直前までを抽出
+            advice = output_content[start_index + len(ADVICE_START_MARKER):end_index].strip()
+        elif sent:
+            # 終了マーカーが無い場合は、送った本文をアドバイスとする
+            advice = sent.strip()
+
+        # プロンプト部分を抽出
+        start_marker = "<<START_PROMPT>>"
+        end_marker = "<<END_PROMPT>>"
+        start_index = output_content.find(start_marker)
+        end_index = output_content.find(end_marker)
+        if start_index != -1 and end_index != -1:
+            # マーカー直後から開始、終了マーカー直前までを抽出
+            prompt_rag = output_content[start_index + len(start_marker):end_index].strip()
+
+        # アドバイス・プロンプトの両方を抽出できた場合のみキャッシュする
+        if ADVICE_START_MARKER in output_content and start_marker in output_content and end_marker in output_content:
+            get_advice_cache().put(ADVICE_MODEL, data.timing, data.domain, data.free_word, advice, prompt_rag)
+
+    if on_delta is not None and not sent:
+        on_delta(advice)
+    print(advice)
+    print(prompt_rag)
+    return advice, prompt_rag
+
+def register_search(data: dxAdviceData) -> tuple[int, str]:
+    """
+    検索データ (t_search / d_search) を DB に登録し、{"search_id", "search_id_sub"} の JSON を返す
+    """
     status, new_search_id = crud.insert_search(SEARCH_MODE)  
     if status != 200 or new_search_id is None:
         # insert_searchに失敗した場合はそのまま返す
-        return status, "Search creation failed"
+        return status, json.dumps({"message": "Search creation failed"}, ensure_ascii=False)
     # d_search作成用のcaseDataを生成
     caseData = caseSearchData(
         search_id=new_search_id,
         search_id_sub=None,
-        industry_id=None,
-        company_size_id=None,
-        department_id=None,
-        theme_id=None,
+        industry_id=data.industry_id,
+        company_size_id=data.company_size_id,
+        department_id=data.department_id,
+        theme_id=data.theme_id,
         case_id=None,
     )
 
@@ -91,69 +202,37 @@ def getAdviceCase(data:dxAdviceData) -> tuple[int, str]:
             status_code=status,
             detail=error_detail
         )
-    new_search_sub_id = int(result)
-
-    ############################################################
-    # 2.現状を踏まえたアドバイスを作成 
-    ############################################################
-    # prompt作成
-    prompt = build_chatgpt_advice_and_rag_prompt(data)
-    print(prompt)
-    advice = "アドバイス(Sample)"
-    prompt_rag = "いい感じの事例を抽出してください"
-    DO_GPT = os.getenv("DO_GPT") 
-    if DO_GPT == "TRUE":
-        # GPTによる戦略文書生成
-        openai.api_key = os.getenv("OPEN_AI_API_KEY")
-        response =  openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt},],
-        )
-        # レスポンスを解析
-        output_content = response.choices[0].message.content.strip()
-        # デバッグ用: GPTの出力を確認
-        print("GPT Raw Output:", output_content)
-
-        # アドバイス部分を抽出
-        start_marker = "<<START_ADVICE>>"
-        end_marker = "<<END_ADVICE>>"
-        start_index = output_content.find(start_marker)
-        end_index = output_content.find(end_marker)
-        if start_index != -1 and end_index != -1:
-            # マーカー直後から開始、終了マーカー直前までを抽出
-            advice = output_content[start_index + len(start_marker):end_index].strip()
-
-        # プロンプト部分を抽出
-        start_marker = "<<START_PROMPT>>"
-        end_marker = "<<END_PROMPT>>"
-        start_index = output_content.find(start_marker)
-        end_index = output_content.find(end_marker)
-        if start_index != -1 and end_index != -1:
-            # マーカー直後から開始、終了マーカー直前までを抽出
-            prompt_rag = output_content[start_index + len(start_marker):end_index].strip()
-
-    print(advice)
-    print(prompt_rag)
+    return status, json.dumps({"search_id": new_search_id, "search_id_sub": int(result)}, ensure_ascii=False)
 
-    ############################################################
-    # 3.参考事例を抽出 
-    ############################################################
-    # ベクトルストアが初期化されていない場合のエラーハンドリング
-    if vectorstore_global.case_vectorstore is None:
-        raise HTTPException(status_code=500, detail="Case vectorstore is not initialized.")
+def build_lexical_query(data: dxAdviceData) -> str:
+    """
+    参考事例の語彙検索用のクエリ（入力されたタイミング・課題・フリーワードのみ）
+    """
+    return " ".join(value.strip() for value in (data.timing, data.domain, data.free_word) if value and value.strip())
 
-    # FAISSのretrieverを作成（上位4件を取得）
-    retriever = vectorstore_global.case_vectorstore.as_retriever(search_kwargs={"k": 4})
-    results = retriever.get_relevant_documents(prompt)
+def retrieve_cases(data: dxAdviceData, case_vectorstore, prompt: str) -> list[dict]:
+    """
+    参考事例を検索し、id, title, summary のみのリストを返す
+    """
+    facet_case_ids = None
+    facets = (data.industry_id, data.company_size_id, data.department_id, data.theme_id)
+    if any(facet is not None for facet in facets):
+        # 業界・企業規模・部署・テーマが指定された場合は、該当する事例だけを検索対象にする
+        status, facet_result = crud.select_case_ids_by_facets(*facets)
+        if status != 200:
+            raise HTTPException(status_code=status, detail=json.loads(facet_result))
+        facet_case_ids = json.loads(facet_result)
+    # 語彙検索 (BM25) とベクトル検索を統合して上位4件を取得（語彙だけで十分な場合は埋め込みを省略）
+    # 語彙検索には入力（タイミング・課題・フリーワード）のみを使い、GPT 向けのプロンプト全体は埋め込みにのみ使う
+    from modules.mdlVectorstore import hybrid_search
+    results = hybrid_search(case_vectorstore, prompt, 4, "case_id", facet_case_ids, lexical_query=build_lexical_query(data))
 
-    print(prompt)
     print("----- Retrieved Case Documents -----")
     parsed_results = []
     for i, doc in enumerate(results):
         candidate_text = f"----- Candidate {i+1} -----\n" + doc.page_content
         print(candidate_text)
-        parsed = parse_case_result(candidate_text)
-        parsed_results.append(parsed)
+        parsed_results.append(case_from_document(doc, candidate_text))
     print("----- End of Case Documents -----")
 
     # id, title, summary のみを抽出
@@ -165,20 +244,207 @@ def getAdviceCase(data:dxAdviceData) -> tuple[int, str]:
             "summary": case.get("summary", "")
         }
         compact_cases.append(compact_case)
+    return compact_cases
+
+# アドバイスを生成し参考事例を取得する
+#   1.検索データの DB 登録、2.アドバイスの生成 (GPT)、3.参考事例の検索 は互いに依存しないため並行して実行する
+#     （参考事例の検索には GPT の出力ではなく、入力から作成したプロンプトを使う）
+#   defer_advice=True の場合は 1・3 の完了後に search_id / search_id_sub / cases を返し、アドバイスは DB 登録の成功後に
+#     バックグラウンドで生成する（結果は GET /dxAdvice、生成中の本文は GET /dxAdvice/stream で search_id / search_id_sub を指定して取得する）
+def getAdviceCase(data:dxAdviceData, defer_advice: bool = False) -> tuple[int, str]:
+
+    # 事例のベクトルストアを最初に取得する（起動時の読み込み中は完了を待ち、読み込めない場合は DB 登録・GPT 呼び出しの前に 503）
+    # 再作成による差し替え中も一貫したベクトルストアを参照するため、参照を一度だけ取得する
+    case_vectorstore = require_vectorstore("case")
+
+    # prompt作成
+    prompt = build_chatgpt_advice_and_rag_prompt(data)
+    print(prompt)
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dx-advice")
+    cancel = threading.Event()
+    status = None
+    try:
+        search_future = executor.submit(register_search, data)
+        advice_future = None if defer_advice else executor.submit(generate_advice, data, prompt, None, cancel)
+        cases = retrieve_cases(data, case_vectorstore, prompt)
+        status, result = search_future.result()
+    finally:
+        if status != 200:
+            # DB 登録・参考事例の検索に失敗した場合はアドバイスの生成の完了を待たずに返す
+            # （開始前であれば取り消し、GPT の出力の受信中であれば打ち切る）
+            cancel.set()
+        executor.shutdown(wait=False, cancel_futures=status != 200)
+    if status != 200:
+        return status, result
 
-    # 正常時(200) → data.search_id と 新規発行された search_id_sub を返す
-    new_search_sub_id = int(result)
-    final_json = json.dumps(
-        {
-            "search_id": new_search_id,
-            "search_id_sub": new_search_sub_id,
-            "advice": advice,
-            "prompt": prompt_rag,
-            "cases": compact_cases  # ← 修正済み（3項目のみ）
-        },
-        ensure_ascii=False
+    search = json.loads(result)
+    if defer_advice:
+        job = start_advice_job(search["search_id"], search["search_id_sub"], data, prompt)
+        final = {**search, "advice_state": job["state"], "cases": cases}
+    else:
+        advice, prompt_rag = advice_future.result()
+        final = {**search, "advice": advice, "prompt": prompt_rag, "cases": cases}
+
+    # 正常時(200) → 新規発行された search_id と search_id_sub を返す
+    return status, json.dumps(final, ensure_ascii=False)
+
+def _now() -> str:
+    return datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S")
+
+def start_advice_job(search_id: int, search_id_sub: int, data: dxAdviceData, prompt: str) -> dict:
+    """
+    (search_id, search_id_sub) のアドバイスの生成をバックグラウンドのスレッドで開始し、生成状況を保持する辞書を返す。
+    生成状況は t_dx_advice にも登録し、生成中の本文はこのプロセスのメモリに保持する
+    """
+    job = {
+        "search_id": search_id,
+        "search_id_sub": search_id_sub,
+        "state": "running",
+        "advice": None,
+        "prompt": None,
+        "text": "",
+        "error": None,
+        "started_at": _now(),
+        "finished_at": None,
+    }
+    with _advice_changed:
+        _advice_jobs[(search_id, search_id_sub)] = job
+        # 古いものから削除する（生成中のものは残す）
+        for key in [key for key, value in _advice_jobs.items() if value["state"] != "running"]:
+            if len(_advice_jobs) <= MAX_ADVICE_JOBS:
+                break
+            del _advice_jobs[key]
+    _save_advice_job(job)
+
+    def on_delta(text: str) -> None:
+        with _advice_changed:
+            job["text"] += text
+            _advice_changed.notify_all()
+
+    def run() -> None:
+        try:
+            advice, prompt_rag = generate_advice(data, prompt, on_delta)
+            values = {"state": "ready", "advice": advice, "prompt": prompt_rag}
+        except Exception as e:
+            print("[mdlDxAdvice] アドバイスの生成でエラーが発生しました:", e)
+            traceback.print_exc()
+            values = {"state": "failed", "error": str(e)}
+        with _advice_changed:
+            job.update(values, finished_at=_now())
+        if _save_advice_job(job):
+            # DB に保存できた場合、以降は t_dx_advice から取得する
+            with _advice_changed:
+                if _advice_jobs.get((search_id, search_id_sub)) is job:
+                    del _advice_jobs[(search_id, search_id_sub)]
+        with _advice_changed:
+            _advice_changed.notify_all()
+
+    threading.Thread(target=run, name="dx-advice", daemon=True).start()
+    return job
+
+def _save_advice_job(job: dict) -> bool:
+    """
+    アドバイスの生成状況を t_dx_advice に登録する（失敗した場合もアドバイスの生成は続け、このプロセスのメモリから返す）
+    """
+    status, result = crud.upsert_t_dx_advice(
+        job["search_id"], job["search_id_sub"], job["state"], job["advice"], job["prompt"], job["error"]
     )
-    return status, final_json
+    if status != 200:
+        print(f"[mdlDxAdvice] t_dx_advice への登録に失敗しました（db_control/ddl/t_dx_advice.sql を適用してください）: {result}")
+    return status == 200
+
+def find_advice(search_id: int, search_id_sub: int) -> Optional[dict]:
+    """
+    アドバイスの生成状況を返す（このプロセスで生成中のものはメモリから、それ以外は t_dx_advice から取得する）。
+    t_dx_advice で生成中のまま ADVICE_STALE_SECONDS 秒を過ぎたもの（生成したプロセスの停止・再起動で中断したもの）は failed とする
+    """
+    with _advice_changed:
+        job = _advice_jobs.get((search_id, search_id_sub))
+        if job is not None:
+            return dict(job)
+    status, result = crud.select_t_dx_advice(search_id, search_id_sub)
+    if status != 200:
+        return None
+    view = json.loads(result)
+    view["text"] = view["advice"] or ""
+    updated = datetime.strptime(view["update_ymd"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=ZoneInfo("Asia/Tokyo"))
+    if view["state"] == "running" and (datetime.now(ZoneInfo("Asia/Tokyo")) - updated).total_seconds() > ADVICE_STALE_SECONDS:
+        view.update(state="failed", error="アドバイスの生成が中断されました。再度 /dxAdvice を実行してください")
+    return view
+
+# 生成中・生成済みのアドバイスを取得する（state: running / ready / failed。text は生成中の本文）
+def getAdvice(search_id: int, search_id_sub: int) -> tuple[int, str]:
+    view = find_advice(search_id, search_id_sub)
+    if view is None:
+        return 404, json.dumps({"message": "advice not found"}, ensure_ascii=False)
+    return 200, json.dumps(view, ensure_ascii=False)
+
+# 生成中のアドバイスの本文を Server-Sent Events で返す
+#   event: delta … 本文の断片 {"text": "..."}（接続時点で生成済みの本文もまとめて送る）
+#   event: done  … 生成の完了時 {"search_id", "search_id_sub", "advice", "prompt"}
+#   event: error … 生成に失敗した場合 {"message": "...", "details": "..."}
+# このプロセスで生成中の場合は本文を生成に合わせて送り、それ以外（別のワーカー・再起動前に開始したもの）は
+# t_dx_advice を ADVICE_POLL_SECONDS 秒ごとに確認し、完了時に本文をまとめて送る
+def streamAdvice(search_id: int, search_id_sub: int):
+    with _advice_changed:
+        job = _advice_jobs.get((search_id, search_id_sub))
+    sent = 0
+    waited = 0.0
+    while True:
+        if job is not None:
+            with _advice_changed:
+                _advice_changed.wait_for(lambda: len(job["text"]) != sent or job["state"] != "running", STREAM_KEEPALIVE_SECONDS)
+                view = dict(job)
+        else:
+            view = find_advice(search_id, search_id_sub)
+            if view is None:
+                yield sse_event("error", {"message": "advice not found", "details": None})
+                return
+            if view["state"] == "running":
+                time.sleep(ADVICE_POLL_SECONDS)
+                waited += ADVICE_POLL_SECONDS
+                if waited < STREAM_KEEPALIVE_SECONDS:
+                    continue
+        waited = 0.0
+        text = view["text"][sent:]
+        sent += len(text)
+        if text:
+            yield sse_event("delta", {"text": text})
+        if view["state"] == "ready":
+            yield sse_event("done", {key: view[key] for key in ("search_id", "search_id_sub", "advice", "prompt")})
+            return
+        if view["state"] == "failed":
+            yield sse_event("error", {"message": "advice generation failed", "details": view["error"]})
+            return
+        if not text:
+            # 生成に時間がかかる場合も接続が切られないようコメント行を送る
+            yield ": keep-alive\n\n"
+
+# DXアドバイスの回答キャッシュのヒット/ミス件数を取得
+def getAdviceCacheStats() -> tuple[int, str]:
+    return 200, json.dumps(get_advice_cache().stats(), ensure_ascii=False)
+
+# DXアドバイスの回答キャッシュを削除（timing / domain を指定した場合はその組み合わせのみ）
+def clearAdviceCache(timing: Optional[str] = None, domain: Optional[str] = None) -> tuple[int, str]:
+    deleted = get_advice_cache().invalidate(ADVICE_MODEL, timing, domain)
+    return 200, json.dumps({"deleted": deleted}, ensure_ascii=False)
+
+def case_from_document(doc, candidate_text: str) -> Dict[str, str]:
+    """
+    検索結果の Document から事例情報の辞書を作成する。
+    metadata に各項目を保持している場合はそのまま返し、
+    項目を持たない旧形式のインデックスの場合のみ candidate_text を解析する。
+    """
+    metadata = doc.metadata or {}
+    if "title" not in metadata:
+        return parse_case_result(candidate_text)
+
+    return {
+        "id": str(metadata.get("case_id", "")),
+        "title": metadata.get("title", ""),
+        "summary": metadata.get("summary", ""),
+    }
 
 def parse_case_result(candidate_text: str) -> Dict[str, str]:
     """
@@ -0,0 +1,282 @@
+# 埋め込み(Embedding)関連モジュール
+import os
+import time
+import shutil
+import hashlib
+import threading
+import traceback
+import unicodedata
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from modules.mdlEmbeddingCache import EmbeddingCache, get_embedding_cache
+
+# インデックス作成時のバッチ埋め込み設定
+DEFAULT_BATCH_TOKENS = 50000     # 1バッチあたりの最大トークン数
+DEFAULT_BATCH_SIZE = 256         # 1バッチあたりの最大件数
+DEFAULT_CONCURRENCY = 4          # 同時に実行するバッチ数
+DEFAULT_MAX_RETRIES = 5          # バッチ失敗時の再試行回数
+DEFAULT_CHECKPOINT_DIR = "rag/.checkpoints"
+# 埋め込みの提供元（環境変数 EMBEDDING_PROVIDER）
+#   openai: OpenAI Embeddings API（既定。DO_GPT=TRUE の場合のみインデックスを作成する）
+#   local : LocalHashEmbeddings（ネットワーク・API キー不要。CI や性能検証用）
+DEFAULT_EMBEDDING_PROVIDER = "openai"
+DEFAULT_LOCAL_EMBEDDING_DIM = 512
+# OpenAI の埋め込みモデルの次元数（dimensions を指定しない場合）
+OPENAI_EMBEDDING_DIMS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings をラップし、EmbeddingCache を経由して埋め込みを取得する。
+    キャッシュに無いテキストのみ元の Embeddings で計算する。
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(self.model_name, text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(self.model_name, text, vector)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors: list[Optional[list[float]]] = [self.cache.get(self.model_name, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                self.cache.put(self.model_name, texts[i], vector)
+                vectors[i] = vector
+        return vectors
+
+class LocalHashEmbeddings(Embeddings):
+    """
+    文字 n-gram の特徴ハッシングによる決定的な埋め込み（CPU のみ・外部通信なし）。
+    日本語は単語の区切りが無いため、形態素解析の代わりに文字 1〜3-gram を特徴とする。
+      - NFKC 正規化・小文字化した文字列から n-gram を作り、CRC32 で次元と符号を決めて加算する
+      - 出現回数は 1 + log(回数) で重み付けし、最後に L2 正規化する
+    同じテキストからは常に同じベクトルが得られるため、インデックス作成・検索・負荷試験をオフラインで再現できる。
+    """
+
+    def __init__(self, dim: int = DEFAULT_LOCAL_EMBEDDING_DIM, ngram_range: tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.model = f"local-hash-ngram{ngram_range[0]}-{ngram_range[1]}-{dim}"
+
+    def _embed(self, text: str) -> list[float]:
+        text = unicodedata.normalize("NFKC", text).lower()
+        counts: dict[int, int] = {}
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if gram.isspace():
+                    continue
+                h = zlib.crc32(gram.encode("utf-8"))
+                counts[h] = counts.get(h, 0) + 1
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if counts:
+            hashes = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            weights = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+            np.add.at(vector, hashes % self.dim, signs * weights)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+def embedding_provider() -> str:
+    provider = (os.getenv("EMBEDDING_PROVIDER") or DEFAULT_EMBEDDING_PROVIDER).lower()
+    return provider if provider in ("openai", "local") else DEFAULT_EMBEDDING_PROVIDER
+
+def can_embed_documents() -> bool:
+    """
+    インデックス作成（文書の埋め込み）を行えるかどうか。
+    OpenAI の場合は DO_GPT=TRUE の場合のみ、ローカルの場合は常に可能
+    """
+    return embedding_provider() == "local" or os.getenv("DO_GPT") == "TRUE"
+
+def get_base_embeddings() -> Embeddings:
+    """
+    キャッシュを経由しない Embeddings を返す（インデックス作成時のバッチ埋め込み用）
+    EMBEDDING_PROVIDER=local の場合は LocalHashEmbeddings（次元数は LOCAL_EMBEDDING_DIM）
+    """
+    if embedding_provider() == "local":
+        return LocalHashEmbeddings(int(os.getenv("LOCAL_EMBEDDING_DIM") or DEFAULT_LOCAL_EMBEDDING_DIM))
+    return OpenAIEmbeddings(openai_api_key=os.getenv("OPEN_AI_API_KEY"))
+
+def get_embeddings() -> Embeddings:
+    """
+    ベクトルストアで利用する Embeddings を返す。
+    クエリの埋め込みはキャッシュ経由となり、同じ文字列の再計算（OpenAI API 呼び出し）を行わない。
+    """
+    base = get_base_embeddings()
+    return CachedEmbeddings(base, get_embedding_cache(), embedding_model_name(base))
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.model_name
+    return getattr(embeddings, "model", type(embeddings).__name__)
+
+def embedding_dimension(embeddings: Embeddings) -> Optional[int]:
+    """
+    埋め込みベクトルの次元数を返す（API を呼び出さずに分からない場合は None）
+    """
+    dim = getattr(embeddings, "dim", None) or getattr(embeddings, "dimensions", None)
+    if dim:
+        return int(dim)
+    return OPENAI_EMBEDDING_DIMS.get(embedding_model_name(embeddings))
+
+def _token_counter(model_name: str):
+    """
+    tiktoken によるトークン数カウント関数を返す。
+    エンコーディングを取得できない環境（オフライン等）では文字数で近似する。
+    """
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        print("[mdlEmbedding] tiktoken を利用できないため文字数でトークン数を近似します:", e)
+        return len
+
+def pack_batches(token_counts: list[int], max_tokens: int, max_items: int) -> list[list[int]]:
+    """
+    テキストのトークン数をもとに、上限を超えないよう先頭から順にバッチへ詰める。
+    戻り値は各バッチに含まれるテキストのインデックスのリスト。
+    """
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for i, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def _embed_with_retry(embeddings: Embeddings, texts: list[str], max_retries: int) -> list[list[float]]:
+    """
+    バッチを埋め込む。失敗した場合は指数バックオフで再試行する。
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            wait = min(2 ** attempt, 60)
+            print(f"[mdlEmbedding] バッチ埋め込みに失敗しました。{wait}秒後に再試行します ({attempt + 1}/{max_retries}):", e)
+            time.sleep(wait)
+
+def embed_texts_batched(
+    texts: list[str],
+    embeddings: Embeddings,
+    checkpoint_dir: Optional[str] = None,
+    progress: Optional[dict] = None,
+) -> list[list[float]]:
+    """
+    インデックス作成用のバッチ埋め込み。
+      - tiktoken のトークン数でバッチを詰める (EMBED_BATCH_TOKENS / EMBED_BATCH_SIZE)
+      - 複数バッチを並行して実行する (EMBED_CONCURRENCY)
+      - 失敗したバッチは指数バックオフで再試行する (EMBED_MAX_RETRIES)
+      - 完了したバッチは checkpoint_dir に保存し、中断後の再実行では保存済みのバッチを再利用する
+    progress を渡すと docs_embedded を完了したバッチの件数分だけ加算する。
+    """
+    max_tokens = int(os.getenv("EMBED_BATCH_TOKENS") or DEFAULT_BATCH_TOKENS)
+    max_items = int(os.getenv("EMBED_BATCH_SIZE") or DEFAULT_BATCH_SIZE)
+    concurrency = int(os.getenv("EMBED_CONCURRENCY") or DEFAULT_CONCURRENCY)
+    max_retries = int(os.getenv("EMBED_MAX_RETRIES") or DEFAULT_MAX_RETRIES)
+
+    model_name = embedding_model_name(embeddings)
+    count_tokens = _token_counter(model_name)
+    batches = pack_batches([count_tokens(t) for t in texts], max_tokens, max_items)
+
+    vectors: list[Optional[list[float]]] = [None] * len(texts)
+    progress_lock = threading.Lock()
+
+    def checkpoint_path(batch: list[int]) -> Optional[str]:
+        if checkpoint_dir is None:
+            return None
+        digest = hashlib.sha256(model_name.encode("utf-8"))
+        for i in batch:
+            digest.update(b"\0" + texts[i].encode("utf-8"))
+        return os.path.join(checkpoint_dir, digest.hexdigest() + ".npy")
+
+    def finish(batch: list[int], batch_vectors) -> None:
+        for i, vector in zip(batch, batch_vectors):
+            vectors[i] = list(vector)
+        if progress is not None:
+            with progress_lock:
+                progress["docs_embedded"] = progress.get("docs_embedded", 0) + len(batch)
+
+    def run(batch: list[int]) -> None:
+        batch_vectors = _embed_with_retry(embeddings, [texts[i] for i in batch], max_retries)
+        path = checkpoint_path(batch)
+        if path is not None:
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, np.asarray(batch_vectors, dtype=np.float32))
+            os.replace(tmp_path, path)
+        finish(batch, batch_vectors)
+
+    # チェックポイント済みのバッチは読み込むだけ
+    pending = []
+    resumed = 0
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    for batch in batches:
+        path = checkpoint_path(batch)
+        if path is not None and os.path.exists(path):
+            try:
+                finish(batch, np.load(path).tolist())
+                resumed += 1
+                continue
+            except Exception:
+                traceback.print_exc()
+        pending.append(batch)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(run, batch) for batch in pending]
+        for future in as_completed(futures):
+            # 1バッチでも最終的に失敗した場合は例外を送出する（完了済みバッチはチェックポイントに残る）
+            future.result()
+
+    print(
+        f"[mdlEmbedding] バッチ埋め込み完了: {len(texts)}件 / {len(batches)}バッチ "
+        f"(再利用: {resumed}, 並列数: {concurrency}, {time.perf_counter() - started:.1f}秒)"
+    )
+    return vectors
+
+def clear_checkpoints(checkpoint_dir: str) -> None:
+    """
+    インデックスの公開後に不要となったチェックポイントを削除する
+    """
+    if os.path.exists(checkpoint_dir):
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+def checkpoint_dir_for(target: str) -> str:
+    return os.path.join(os.getenv("EMBED_CHECKPOINT_DIR") or DEFAULT_CHECKPOINT_DIR, target)
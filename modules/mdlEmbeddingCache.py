@@ -0,0 +1,139 @@
+# 埋め込み(Embedding)のキャッシュモジュール
+# langchain・faiss を読み込まずに利用できるよう mdlEmbedding から分離している
+# （ルーターの /embeddingCacheStats はこのモジュールのみを import する）
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Optional
+import vectorstore_global
+
+# メモリ上に保持する埋め込みの最大件数
+DEFAULT_CACHE_SIZE = 4096
+# ディスクキャッシュの保存先（インデックス再作成で削除されないよう rag 直下に置く）
+DEFAULT_CACHE_PATH = "rag/embedding_cache.sqlite3"
+
+_lock = threading.Lock()
+
+class EmbeddingCache:
+    """
+    埋め込みベクトルのキャッシュ。
+      - メモリ: 件数上限付きの LRU (OrderedDict)
+      - ディスク: SQLite (再起動・/createVecrorstore 後も保持される)
+    キーは「モデル名 + テキスト」の SHA-256 ハッシュ。
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, list[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " vector BLOB NOT NULL)"
+            )
+            self._conn.commit()
+        except Exception as e:
+            # ディスクキャッシュが使えない場合もメモリキャッシュのみで動作させる
+            print("[mdlEmbeddingCache] ディスクキャッシュを開けませんでした:", e)
+            self._conn = None
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM embedding_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector: list[float]) -> None:
+        key = self.make_key(model, text)
+        with self._lock:
+            self._remember(key, list(vector))
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO embedding_cache (key, model, vector) VALUES (?, ?, ?)",
+                        (key, model, array("f", vector).tobytes()),
+                    )
+                    self._conn.commit()
+                except Exception as e:
+                    print("[mdlEmbeddingCache] ディスクキャッシュへの書き込みに失敗しました:", e)
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        # ロック取得済みの前提で呼び出す
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            disk_entries = None
+            if self._conn is not None:
+                disk_entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_max_size": self.max_size,
+                "disk_entries": disk_entries,
+                "path": self.path,
+            }
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    プロセス内で共有する EmbeddingCache を返す（未作成なら作成する）。
+    talent / case のインデックスを並列に読み込む起動時など、複数のスレッドから同時に呼び出されても1つだけ作成する
+    """
+    if vectorstore_global.embedding_cache is None:
+        with _lock:
+            if vectorstore_global.embedding_cache is None:
+                vectorstore_global.embedding_cache = EmbeddingCache(
+                    os.getenv("EMBEDDING_CACHE_PATH") or DEFAULT_CACHE_PATH,
+                    int(os.getenv("EMBEDDING_CACHE_SIZE") or DEFAULT_CACHE_SIZE),
+                )
+    return vectorstore_global.embedding_cache
+
+def getEmbeddingCacheStats() -> tuple[int, str]:
+    """
+    クエリ埋め込みキャッシュのヒット/ミス件数を返す
+    """
+    result = get_embedding_cache().stats()
+    return 200, json.dumps(result, ensure_ascii=False)
@@ -0,0 +1,130 @@
+# インデックス再作成ジョブ管理モジュール
+#
+# /createVecrorstore はジョブを登録して即座に job_id を返し、再作成はバックグラウンドのスレッドで実行する。
+# 同一対象(talent / case)のジョブは同時に1つだけ実行し、実行中に再度要求された場合は実行中のジョブに合流させる。
+#   - 合流はプロセス内のジョブのみ。rag/ を共有する別のプロセスが再作成中の場合は、ファイルロック
+#     (mdlIndexVersion.rebuild_lock) で判定して 409 を返す（ジョブ実行時に取得できなかった場合はジョブが 409 で失敗する）
+# ※ ジョブ情報はプロセス内のメモリに保持する（ワーカープロセス間では共有されない）。
+#   複数のワーカープロセスで動かす場合、/vectorstoreJob はジョブを受け付けたプロセス以外では 404 を返す
+# ※ modules.mdlVectorstore (langchain / faiss) はジョブの登録・実行時に import する（ジョブ状態の参照では読み込まない）
+import json
+import threading
+import traceback
+import uuid
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+import vectorstore_global
+from modules.mdlIndexVersion import TALENT_INDEX_DIR, CASE_INDEX_DIR, rebuild_in_progress
+
+# 保持する終了済みジョブの件数
+MAX_FINISHED_JOBS = 50
+
+_jobs: dict[str, dict] = {}
+_running: dict[str, str] = {}  # 対象 -> 実行中の job_id
+_lock = threading.Lock()
+
+def _now() -> str:
+    return datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S")
+
+def _job_view(job: dict, coalesced: bool = False) -> dict:
+    view = {key: value for key, value in job.items() if key != "progress"}
+    view["progress"] = dict(job["progress"])
+    if coalesced:
+        view["coalesced"] = True
+    return view
+
+# インデックス再作成ジョブを登録する
+def submitRebuild(target: str, mode: str = "full", index_spec: Optional[str] = None) -> tuple[int, str]:
+    """
+    インデックス再作成ジョブを登録し、(202, ジョブ情報JSON) を返す。
+    同一対象のジョブが実行中の場合は新しいジョブを作らず、実行中のジョブ情報を返す（coalesced=true）。
+    """
+    if target not in vectorstore_global.vectorstore_locks:
+        result = {"message": f"対象 '{target}' が見つかりません。"}
+        return 404, json.dumps(result, ensure_ascii=False)
+    if mode not in ("full", "sync"):
+        result = {"message": f"mode '{mode}' は指定できません。(full / sync)"}
+        return 400, json.dumps(result, ensure_ascii=False)
+    if index_spec is not None:
+        from modules.mdlIndexSpec import parse_index_spec
+        try:
+            parse_index_spec(index_spec)
+        except ValueError as e:
+            return 400, json.dumps({"message": str(e)}, ensure_ascii=False)
+        if mode != "full":
+            result = {"message": "index_spec は mode=full の場合のみ指定できます。"}
+            return 400, json.dumps(result, ensure_ascii=False)
+
+    with _lock:
+        running_id = _running.get(target)
+        if running_id is not None:
+            return 202, json.dumps(_job_view(_jobs[running_id], coalesced=True), ensure_ascii=False)
+        if rebuild_in_progress(TALENT_INDEX_DIR if target == "talent" else CASE_INDEX_DIR):
+            result = {"message": f"別のプロセスで {target} のインデックスを再作成中です。"}
+            return 409, json.dumps(result, ensure_ascii=False)
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "target": target,
+            "mode": mode,
+            "index_spec": index_spec,
+            "status": "pending",
+            "progress": {"rows_extracted": 0, "docs_embedded": 0, "vectors_written": 0},
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "status_code": None,
+            "result": None,
+        }
+        _jobs[job["job_id"]] = job
+        _running[target] = job["job_id"]
+        _prune_finished_jobs()
+        view = _job_view(job)
+
+    threading.Thread(target=_run_job, args=(job,), name=f"rebuild-{target}", daemon=True).start()
+    return 202, json.dumps(view, ensure_ascii=False)
+
+# インデックス再作成ジョブの状態を取得する
+def getRebuildJob(job_id: str) -> tuple[int, str]:
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            result = {"message": f"job_id '{job_id}' が見つかりません。"}
+            return 404, json.dumps(result, ensure_ascii=False)
+        return 200, json.dumps(_job_view(job), ensure_ascii=False)
+
+# インデックス再作成ジョブの一覧を取得する（新しい順）
+def getRebuildJobs() -> tuple[int, str]:
+    with _lock:
+        jobs = [_job_view(job) for job in reversed(list(_jobs.values()))]
+    return 200, json.dumps(jobs, ensure_ascii=False)
+
+def _run_job(job: dict) -> None:
+    job["status"] = "running"
+    job["started_at"] = _now()
+    print(f"[mdlIndexJob] インデックス再作成ジョブを開始しました: {job['job_id']} ({job['target']}, {job['mode']})")
+    try:
+        from modules import mdlVectorstore
+        status, result = mdlVectorstore.createVectorstore(job["target"], job["mode"], job["progress"], job["index_spec"])
+        job["status_code"] = status
+        job["result"] = json.loads(result)
+        job["status"] = "succeeded" if status == 200 else "failed"
+    except Exception as e:
+        print("インデックス再作成ジョブでエラーが発生しました:", e)
+        traceback.print_exc()
+        job["status_code"] = 500
+        job["result"] = {"message": "Vectorstore rebuild failed.", "details": str(e)}
+        job["status"] = "failed"
+    finally:
+        job["finished_at"] = _now()
+        with _lock:
+            if _running.get(job["target"]) == job["job_id"]:
+                del _running[job["target"]]
+        print(f"[mdlIndexJob] インデックス再作成ジョブが終了しました: {job['job_id']} ({job['status']})")
+
+def _prune_finished_jobs() -> None:
+    # ロック取得済みの前提で呼び出す
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in ("succeeded", "failed")]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
@@ -0,0 +1,190 @@
+# インデックスの起動時読み込み・準備状態管理モジュール
+#
+# 起動時に talent / case のインデックスをワーカースレッドで並列に読み込み、インデックスごとの状態を保持する。
+#   pending（未開始）→ loading（読み込み中）→ ready（検索可能）/ failed（失敗）
+# 環境変数 LAZY_INDEX_LOADING=TRUE の場合は読み込みの完了を待たずにリクエストの受け付けを開始する。
+#   - DB のみを使うエンドポイント (/allIssues, /cases, /caseDetail など) は読み込み中もそのまま応答する
+#   - 検索系のエンドポイントは require_vectorstore で読み込みの完了を INDEX_WAIT_SECONDS 秒まで待ち、
+#     間に合わない場合・読み込みに失敗した場合は 503 を返す
+# 読み込みに失敗したインデックスは /reloadVectorstore{target} でディスクから読み込み直せる（再作成は不要）。
+# ※ 状態はプロセス内のメモリに保持する（ワーカープロセス間では共有されない）
+# ※ langchain / faiss を読み込む modules.mdlVectorstore は読み込み処理の中で import する
+#   （LAZY_INDEX_LOADING=TRUE の場合、重いライブラリの読み込みもバックグラウンドで行われる）
+import os
+import json
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from fastapi import HTTPException
+import vectorstore_global
+from modules.mdlIndexVersion import TALENT_INDEX_DIR, CASE_INDEX_DIR, rebuild_lock
+
+# 対象 -> インデックスの保存先（読み込みは modules.mdlVectorstore.create_<対象>_vectorstore）
+TARGETS = {
+    "talent": TALENT_INDEX_DIR,
+    "case": CASE_INDEX_DIR,
+}
+# 検索系のエンドポイントが読み込みの完了を待つ秒数（環境変数 INDEX_WAIT_SECONDS。0 の場合は待たずに 503 を返す）
+DEFAULT_INDEX_WAIT_SECONDS = 10
+# 503 を返す際に Retry-After ヘッダで案内する秒数
+RETRY_AFTER_SECONDS = 5
+# 別のプロセスがインデックスを作成中の場合に、ファイルロックの解放を確認する間隔（秒）
+REBUILD_POLL_SECONDS = 2
+
+_states: dict[str, dict] = {
+    target: {"state": "pending", "version": None, "vectors": None, "error": None,
+             "started_at": None, "finished_at": None, "elapsed_seconds": None}
+    for target in TARGETS
+}
+_loaded = {target: threading.Event() for target in TARGETS}
+_lock = threading.Lock()
+
+def _now() -> str:
+    return datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S")
+
+def _update(target: str, **values) -> None:
+    with _lock:
+        _states[target].update(values)
+
+def lazy_index_loading() -> bool:
+    return os.getenv("LAZY_INDEX_LOADING") == "TRUE"
+
+def index_wait_seconds() -> float:
+    return float(os.getenv("INDEX_WAIT_SECONDS") or DEFAULT_INDEX_WAIT_SECONDS)
+
+@contextmanager
+def wait_rebuild_lock(target: str):
+    """
+    対象のインデックスの再作成用のファイルロックを取得する（別のプロセスが取得中の場合は解放されるまで待つ）
+    """
+    waiting = False
+    while True:
+        with rebuild_lock(TARGETS[target]) as acquired:
+            if acquired:
+                yield
+                return
+        if not waiting:
+            print(f"[mdlIndexLoader] 別のプロセスで {target} のインデックスを作成中のため、完了を待ってから読み込みます")
+            waiting = True
+        time.sleep(REBUILD_POLL_SECONDS)
+
+def load_index(target: str) -> None:
+    """
+    対象のインデックスを読み込み（無い場合は create_*_vectorstore の仕様どおり生成し）、vectorstore_global に設定する。
+    再作成ジョブと同時に実行されないよう、対象のロックを取得して読み込む。
+    インデックスが無い場合の生成を複数のプロセス（ワーカー）が同時に行わないよう、再作成用のファイルロックも取得する
+    （別のプロセスが作成中の場合は完了を待ち、作成されたインデックスを読み込む）
+    """
+    from modules import mdlVectorstore
+    create_vectorstore = getattr(mdlVectorstore, f"create_{target}_vectorstore")
+    _loaded[target].clear()
+    _update(target, state="loading", error=None, started_at=_now(), finished_at=None, elapsed_seconds=None)
+    started = time.perf_counter()
+    try:
+        with vectorstore_global.vectorstore_locks[target], wait_rebuild_lock(target):
+            vs = create_vectorstore()
+            if vs is None:
+                raise RuntimeError("インデックスを読み込めず、生成もできませんでした")
+            mdlVectorstore.set_vectorstore(target, vs)
+        _update(target, state="ready", version=vectorstore_global.loaded_versions[target], vectors=vs.index.ntotal)
+    except Exception as e:
+        print(f"[mdlIndexLoader] {target} のインデックス読み込みでエラーが発生しました:", e)
+        traceback.print_exc()
+        _update(target, state="failed", error=str(e))
+    finally:
+        elapsed = round(time.perf_counter() - started, 2)
+        _update(target, finished_at=_now(), elapsed_seconds=elapsed)
+        _loaded[target].set()
+        print(f"[mdlIndexLoader] {target} のインデックス読み込みが終了しました: {_states[target]['state']} ({elapsed}秒)")
+
+def after_load() -> None:
+    """
+    インデックスの読み込み後の処理（常駐バイト数の出力、事例→人材の類似度事前計算の読み込み・再計算）
+    """
+    from modules.mdlVectorstore import report_vectorstore_memory
+    from modules import mdlAffinity
+
+    report_vectorstore_memory()
+    try:
+        mdlAffinity.refresh_affinity()
+    except Exception as e:
+        print("事例→人材の類似度事前計算でエラーが発生しました:", e)
+        traceback.print_exc()
+
+def load_all_indexes() -> None:
+    """
+    talent / case のインデックスをワーカースレッドで並列に読み込み、両方の完了後に after_load を実行する
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(TARGETS), thread_name_prefix="index-loader") as executor:
+        list(executor.map(load_index, TARGETS))
+    print(f"[mdlIndexLoader] インデックスの読み込みが完了しました ({time.perf_counter() - started:.2f}秒)")
+    after_load()
+
+def start_background_loading() -> threading.Thread:
+    """
+    インデックスの読み込みをバックグラウンドで開始する（LAZY_INDEX_LOADING=TRUE の場合に起動時に呼び出す）
+    """
+    thread = threading.Thread(target=load_all_indexes, name="index-loader", daemon=True)
+    thread.start()
+    return thread
+
+def index_status(target: str) -> dict:
+    """
+    対象のインデックスの状態を返す。
+    再作成・ロールバックで差し替えられた場合も反映されるよう、ベクトルストアが設定済みであれば ready とし件数・バージョンは現在の値を返す。
+    バージョンはこのプロセスで稼働中のインデックスのもの（ディスクの現在のバージョンは別のプロセスが切り替えている場合がある）
+    """
+    with _lock:
+        status = dict(_states[target])
+    vs = getattr(vectorstore_global, f"{target}_vectorstore")
+    if vs is not None:
+        status.update(state="ready", version=vectorstore_global.loaded_versions[target], vectors=vs.index.ntotal, error=None)
+    return status
+
+def require_vectorstore(target: str):
+    """
+    検索系の処理で使うベクトルストアを返す。
+    読み込み中の場合は INDEX_WAIT_SECONDS 秒まで完了を待ち、間に合わない場合・失敗した場合は 503 を送出する。
+    """
+    attr = f"{target}_vectorstore"
+    vs = getattr(vectorstore_global, attr)
+    if vs is not None:
+        return vs
+    if index_status(target)["state"] in ("pending", "loading"):
+        _loaded[target].wait(index_wait_seconds())
+        vs = getattr(vectorstore_global, attr)
+        if vs is not None:
+            return vs
+
+    status = index_status(target)
+    detail = {"message": f"{attr} is not ready.", "state": status["state"], "error": status["error"]}
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+# インデックスごとの準備状態を取得する（すべて ready の場合は 200、それ以外は 503）
+def getReadiness() -> tuple[int, str]:
+    indexes = {target: index_status(target) for target in TARGETS}
+    ready = all(status["state"] == "ready" for status in indexes.values())
+    result = {"ready": ready, "indexes": indexes}
+    return (200 if ready else 503), json.dumps(result, ensure_ascii=False)
+
+# インデックスをディスクから読み込み直す（起動時の読み込みに失敗した場合の復旧用）
+def reloadVectorstore(target: str) -> tuple[int, str]:
+    if target not in TARGETS:
+        result = {"message": f"対象 '{target}' が見つかりません。"}
+        return 404, json.dumps(result, ensure_ascii=False)
+    with _lock:
+        if _states[target]["state"] == "loading":
+            return 409, json.dumps({"message": f"{target} のインデックスは読み込み中です。"}, ensure_ascii=False)
+        _states[target]["state"] = "loading"
+
+    def reload() -> None:
+        load_index(target)
+        after_load()
+
+    threading.Thread(target=reload, name=f"index-loader-{target}", daemon=True).start()
+    return 202, json.dumps(index_status(target), ensure_ascii=False)
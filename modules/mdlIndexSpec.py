@@ -0,0 +1,153 @@
+# ANN インデックス種別モジュール
+#
+# インデックス仕様は faiss.index_factory の文字列と検索パラメータを ";" で区切って指定する。
+#   "Flat"                        … 全件比較（既定。件数に比例して検索コストが増える）
+#   "IVF1024,Flat;nprobe=16"      … IVF-Flat（クラスタ単位で絞り込んでから全件比較）
+#   "HNSW32;efSearch=64"          … HNSW（グラフ探索）
+#   "IVF1024,PQ64;nprobe=32"      … IVF-PQ（直積量子化でベクトルを圧縮）
+# ベクトルの圧縮（インデックスのメモリ削減）も同じ書式で指定する。
+#   "SQfp16"                      … スカラー量子化 (float16。1/2)
+#   "SQ8"                         … スカラー量子化 (int8。1/4)
+#   "PQ64"                        … 直積量子化 (1ベクトル 64 バイト。次元数は 64 の倍数であること)
+#   "PCA256,Flat" / "PCA256,SQ8"  … PCA で 256 次元に削減してから保持する（量子化と組み合わせ可）
+#   "IVF1024,SQ8;nprobe=16"       … IVF と量子化の組み合わせ
+# 学習が必要な種別（量子化・PCA・IVF）は全件のベクトルで学習し、その際に圧縮前 (Flat) と比べた
+# メモリ削減量と再現率 (recall@k) を計測して manifest の versions[<version>]["compression"] に記録する（evaluate_compression）。
+# 検索パラメータは faiss.ParameterSpace の書式（"nprobe=16,efSearch=64"）で指定する。
+# 指定した仕様は manifest の versions[<version>]["index_spec"] に記録され、読み込み時に検索パラメータを再適用する。
+import os
+import re
+import faiss
+import numpy as np
+from typing import Optional
+
+DEFAULT_INDEX_SPEC = "Flat"
+# IVF の学習に必要なクラスタあたりの最小件数（faiss の推奨値）
+MIN_POINTS_PER_CENTROID = 39
+# 圧縮の評価で再現率を計測する上位件数と、クエリとして使うベクトル数（環境変数 COMPRESSION_EVAL_QUERIES）
+COMPRESSION_EVAL_K = 10
+DEFAULT_COMPRESSION_EVAL_QUERIES = 200
+
+def parse_index_spec(spec: Optional[str]) -> tuple[str, str]:
+    """
+    インデックス仕様を (index_factory 文字列, 検索パラメータ) に分解する。不正な場合は ValueError
+    """
+    spec = (spec or DEFAULT_INDEX_SPEC).strip()
+    factory, _, params = spec.partition(";")
+    factory, params = factory.strip(), params.strip()
+    if not factory:
+        raise ValueError(f"インデックス仕様 '{spec}' に index_factory 文字列がありません")
+    for param in filter(None, params.split(",")):
+        if not re.fullmatch(r"\s*\w+\s*=\s*[\d.]+\s*", param):
+            raise ValueError(f"インデックス仕様 '{spec}' の検索パラメータ '{param}' が不正です (例: nprobe=16)")
+    return factory, params.replace(" ", "")
+
+def supports_delete(spec: Optional[str]) -> bool:
+    """
+    削除後も FAISS の行番号が詰められる（LangChain の FAISS.delete と整合する）インデックスかどうか。
+    IVF はラベルが詰められず、HNSW は削除自体に対応しないため False
+    """
+    factory, _ = parse_index_spec(spec)
+    return "IVF" not in factory and "HNSW" not in factory and "IDMap" not in factory
+
+def requires_training(spec: Optional[str]) -> bool:
+    """
+    インデックスの作成時に学習が必要な種別 (IVF / PQ / SQ / PCA など) かどうか
+    """
+    factory, _ = parse_index_spec(spec)
+    return re.search(r"IVF|PQ|SQ|PCA|ITQ", factory) is not None
+
+def resolve_factory(factory: str, n_train: int) -> str:
+    """
+    学習データが少ない場合に学習できない構成を調整する
+      - IVF: クラスタ数 (nlist) を学習可能な数まで下げる
+      - PQ : コードブック (2^nbits 個) を学習できない場合は Flat で保持する
+      - PCA: 出力する次元数を学習データの件数まで下げる
+    """
+    def clamp(match):
+        nlist = int(match.group(1))
+        limit = max(1, n_train // MIN_POINTS_PER_CENTROID)
+        return f"IVF{min(nlist, limit)}"
+
+    def pq_or_flat(match):
+        nbits = int(match.group(2) or 8)
+        return match.group(0) if n_train >= 2 ** nbits else "Flat"
+
+    def pca_dims(match):
+        return f"{match.group(1)}{min(int(match.group(2)), max(1, n_train))}"
+
+    factory = re.sub(r"IVF(\d+)", clamp, factory)
+    factory = re.sub(r"(PCAW?R?)(\d+)", pca_dims, factory)
+    return re.sub(r"(?<![\w])PQ(\d+)(?:x(\d+))?", pq_or_flat, factory)
+
+def apply_search_params(index, spec: Optional[str]) -> None:
+    """
+    インデックス仕様の検索パラメータ (nprobe / efSearch など) をインデックスに設定する
+    """
+    _, params = parse_index_spec(spec)
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+
+def build_index(spec: Optional[str], vectors: np.ndarray):
+    """
+    インデックス仕様から空のインデックスを作成し、学習が必要な種別 (IVF / PQ) は vectors で学習する
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    factory, _ = parse_index_spec(spec)
+    resolved = resolve_factory(factory, len(vectors))
+    if resolved != factory:
+        print(f"[mdlIndexSpec] 学習データが {len(vectors)} 件のため、インデックス仕様 '{factory}' を '{resolved}' として作成します。")
+    pca = re.search(r"PCAW?R?(\d+)", resolved)
+    if pca and int(pca.group(1)) >= vectors.shape[1]:
+        raise ValueError(f"インデックス仕様 '{factory}' の PCA の次元数は埋め込みの次元数 ({vectors.shape[1]}) より小さくしてください")
+    index = faiss.index_factory(vectors.shape[1], resolved)
+    if not index.is_trained:
+        index.train(vectors)
+    apply_search_params(index, spec)
+    return index
+
+def reconstruct_rows(index, rows) -> np.ndarray:
+    """
+    指定した行番号のベクトルを復元する（IVF は direct map を作成してから復元する）
+    """
+    rows = np.asarray(rows, dtype="int64")
+    try:
+        return index.reconstruct_batch(rows)
+    except RuntimeError:
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_batch(rows)
+
+def probe_vector(index) -> np.ndarray:
+    """
+    検証用に先頭のベクトルを復元する
+    """
+    return reconstruct_rows(index, [0])[0]
+
+def evaluate_compression(index, vectors: np.ndarray) -> dict:
+    """
+    圧縮・近似したインデックスを、同じベクトルの全件比較 (Flat, float32) と比べて評価する。
+      - raw_bytes / index_bytes: 圧縮前のベクトルのバイト数と、インデックスをシリアライズしたバイト数
+      - recall_at_k: 格納したベクトルから抽出したクエリについて、全件比較の上位 k 件のうちインデックスの上位 k 件に含まれる割合の平均
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n_queries = min(len(vectors), int(os.getenv("COMPRESSION_EVAL_QUERIES") or DEFAULT_COMPRESSION_EVAL_QUERIES))
+    k = min(COMPRESSION_EVAL_K, len(vectors))
+    queries = vectors[np.random.default_rng(0).choice(len(vectors), n_queries, replace=False)]
+
+    _, expected = faiss.knn(queries, vectors, k)
+    _, actual = index.search(queries, k)
+    recall = np.mean([len(set(e) & set(a)) / k for e, a in zip(expected, actual)]) if n_queries else 1.0
+
+    raw_bytes = vectors.nbytes
+    index_bytes = len(faiss.serialize_index(index))
+    return {
+        "dimension": int(vectors.shape[1]),
+        "raw_bytes": int(raw_bytes),
+        "index_bytes": int(index_bytes),
+        "saved_bytes": int(raw_bytes - index_bytes),
+        "memory_ratio": round(index_bytes / raw_bytes, 4) if raw_bytes else None,
+        "recall_at_k": round(float(recall), 4),
+        "k": k,
+        "queries": n_queries,
+    }
+
@@ -0,0 +1,176 @@
+# インデックスのバージョン管理モジュール
+#
+# ディレクトリ構成:
+#   rag/talent_vectorstore_index/
+#     manifest.json          … 現在のバージョンと過去バージョン（ロールバック用）
+#     versions/<version>/    … バージョンごとの index.faiss / docstore (modules.mdlDocstore)
+#     index.faiss, index.pkl … 旧形式（manifest 導入前）のインデックス。バージョン名 "legacy" として扱う
+#     .rebuild.lock          … 再作成中に取得するファイルロック（rebuild_lock。同じ rag/ を共有するプロセス間で再作成を1つに限る）
+import os
+import json
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+try:
+    import fcntl
+except ImportError:
+    # Windows ではプロセス間のロックを行わない（プロセス内のロックのみ）
+    fcntl = None
+
+# インデックスの保存先
+TALENT_INDEX_DIR = "rag/talent_vectorstore_index"
+CASE_INDEX_DIR = "rag/case_vectorstore_index"
+
+MANIFEST_NAME = "manifest.json"
+VERSIONS_DIR = "versions"
+LEGACY_VERSION = "legacy"
+# 保持する過去バージョン数（ロールバック用）
+DEFAULT_KEEP_VERSIONS = 2
+REBUILD_LOCK_NAME = ".rebuild.lock"
+
+def read_manifest(base_dir: str) -> Optional[dict]:
+    """
+    manifest.json を読み込む。存在しない場合は None
+    """
+    path = os.path.join(base_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_manifest(base_dir: str, manifest: dict) -> None:
+    """
+    manifest.json を一時ファイル経由で置き換える（書き込み途中の manifest を読ませない）
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def version_dir(base_dir: str, version: str) -> str:
+    if version == LEGACY_VERSION:
+        return base_dir
+    return os.path.join(base_dir, VERSIONS_DIR, version)
+
+def current_version(base_dir: str) -> Optional[str]:
+    """
+    現在のバージョン名を返す。manifest が無く旧形式のインデックスがある場合は "legacy"
+    """
+    manifest = read_manifest(base_dir)
+    if manifest and manifest.get("current"):
+        return manifest["current"]
+    if os.path.exists(os.path.join(base_dir, "index.faiss")):
+        return LEGACY_VERSION
+    return None
+
+def current_index_dir(base_dir: str) -> Optional[str]:
+    """
+    現在のバージョンのインデックスディレクトリを返す。インデックスが無い場合は None
+    """
+    version = current_version(base_dir)
+    if version is None:
+        return None
+    path = version_dir(base_dir, version)
+    return path if os.path.exists(path) else None
+
+def new_version_dir(base_dir: str) -> tuple[str, str]:
+    """
+    新しいバージョン名とその保存先ディレクトリを返す（ディレクトリは作成しない）
+    """
+    version = datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y%m%d%H%M%S%f")
+    return version, version_dir(base_dir, version)
+
+@contextmanager
+def rebuild_lock(base_dir: str):
+    """
+    再作成中であることを示すファイルロックを取得し、取得できたかどうか (bool) を返す。
+    別のプロセスが取得中の場合は待たずに False を返す（ロックはブロックを抜けると解放される）
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(base_dir, exist_ok=True)
+    with open(os.path.join(base_dir, REBUILD_LOCK_NAME), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def rebuild_in_progress(base_dir: str) -> bool:
+    """
+    別のプロセスが再作成中（ファイルロックを取得中）かどうか
+    """
+    with rebuild_lock(base_dir) as acquired:
+        return not acquired
+
+def publish_version(base_dir: str, version: str, info: dict) -> dict:
+    """
+    検証済みのバージョンを現在のバージョンとして manifest に記録する。
+    直前のバージョンはロールバック用に previous へ残し、保持数を超えた古いバージョンは削除する。
+    """
+    manifest = read_manifest(base_dir) or {"current": None, "previous": [], "versions": {}}
+    old = manifest.get("current") or current_version(base_dir)
+
+    previous = [v for v in manifest.get("previous", []) if v != version]
+    if old and old != version:
+        previous.insert(0, old)
+
+    keep = int(os.getenv("INDEX_KEEP_VERSIONS") or DEFAULT_KEEP_VERSIONS)
+    expired = previous[keep:]
+    previous = previous[:keep]
+
+    versions = manifest.get("versions", {})
+    versions[version] = info
+    for v in expired:
+        versions.pop(v, None)
+
+    manifest = {"current": version, "previous": previous, "versions": versions}
+    write_manifest(base_dir, manifest)
+
+    for v in expired:
+        discard_version(base_dir, v)
+    return manifest
+
+def rollback_version(base_dir: str) -> Optional[str]:
+    """
+    manifest の current を直前のバージョンに戻し、戻した先のバージョン名を返す。
+    戻せるバージョンが無い場合は None
+    """
+    manifest = read_manifest(base_dir)
+    if not manifest or not manifest.get("previous"):
+        return None
+
+    previous = list(manifest["previous"])
+    target = previous.pop(0)
+    if not os.path.exists(version_dir(base_dir, target)):
+        return None
+
+    # ロールバック前のバージョンは削除せず、previous の末尾に残す
+    if manifest.get("current"):
+        previous.append(manifest["current"])
+    manifest["current"] = target
+    manifest["previous"] = previous
+    write_manifest(base_dir, manifest)
+    return target
+
+def discard_version(base_dir: str, version: str) -> None:
+    """
+    指定バージョンのディレクトリを削除する（旧形式のインデックスは削除しない）
+    """
+    if version == LEGACY_VERSION:
+        return
+    path = version_dir(base_dir, version)
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,136 @@
+# 文字 bigram の転置インデックス（BM25）モジュール
+#
+# 職種名・製品名（Salesforce など）・事例名のように、文書中の文字列とそのまま一致するクエリは
+# 埋め込みのベクトル検索より語彙の一致で探した方が速く、順位も安定する。
+# 日本語は分かち書きせず、NFKC 正規化・小文字化した文字列を記号や空白で区切り、文字 bigram を索引語とする。
+#
+# インデックスは FAISS のバージョンディレクトリに docstore と並べて保存する（行番号は FAISS の行番号と同じ）。
+#   lexical.terms.json    … 索引語の一覧（昇順）。索引語 t の位置を i とする
+#   lexical.offsets.npy   … 索引語 i のポスティングが rows / freqs の [offsets[i], offsets[i+1]) にあることを示す int64 配列
+#   lexical.rows.npy      … ポスティングの行番号 (int32)
+#   lexical.freqs.npy     … ポスティングの出現回数 (float32)
+#   lexical.lengths.npy   … 行ごとの索引語数 (float32)
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter
+import numpy as np
+
+TERMS_FILE = "lexical.terms.json"
+OFFSETS_FILE = "lexical.offsets.npy"
+ROWS_FILE = "lexical.rows.npy"
+FREQS_FILE = "lexical.freqs.npy"
+LENGTHS_FILE = "lexical.lengths.npy"
+# BM25 のパラメータ（一般的な既定値）
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 区切りとして扱う文字（空白・記号。日本語の文字は \w に含まれるため区切らない）
+_SEPARATORS = re.compile(r"[\W_]+")
+
+def tokenize(text: str) -> list[str]:
+    """
+    テキストを文字 bigram の列に分割する（1文字だけの語はその1文字を索引語とする）
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    terms = []
+    for segment in _SEPARATORS.split(text):
+        if len(segment) == 1:
+            terms.append(segment)
+        terms.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return terms
+
+def has_lexical_index(directory: str) -> bool:
+    names = (TERMS_FILE, OFFSETS_FILE, ROWS_FILE, FREQS_FILE, LENGTHS_FILE)
+    return all(os.path.exists(os.path.join(directory, name)) for name in names)
+
+class LexicalIndex:
+    """
+    行番号（FAISS の行番号）単位の文字 bigram 転置インデックス
+    """
+
+    def __init__(self, terms: list[str], offsets: np.ndarray, rows: np.ndarray, freqs: np.ndarray, lengths: np.ndarray):
+        self.terms = terms
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.freqs = freqs
+        self.lengths = lengths
+        self.n_docs = len(lengths)
+        self.avg_length = float(lengths.mean()) if self.n_docs and lengths.mean() > 0 else 1.0
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "LexicalIndex":
+        """
+        行番号順のテキストからインデックスを作成する
+        """
+        postings: dict[str, list[tuple[int, int]]] = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths[row] = len(terms)
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append((row, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        rows = np.fromiter((row for term in terms for row, _ in postings[term]), dtype=np.int32, count=int(offsets[-1]))
+        freqs = np.fromiter((count for term in terms for _, count in postings[term]), dtype=np.float32, count=int(offsets[-1]))
+        return cls(terms, offsets, rows, freqs, lengths)
+
+    @classmethod
+    def load(cls, directory: str) -> "LexicalIndex":
+        """
+        保存済みのインデックスを読み込む（配列は mmap で開く）
+        """
+        with open(os.path.join(directory, TERMS_FILE), "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        return cls(
+            terms,
+            np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, ROWS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, FREQS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, LENGTHS_FILE)),
+        )
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, TERMS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, OFFSETS_FILE), np.asarray(self.offsets))
+        np.save(os.path.join(directory, ROWS_FILE), np.asarray(self.rows))
+        np.save(os.path.join(directory, FREQS_FILE), np.asarray(self.freqs))
+        np.save(os.path.join(directory, LENGTHS_FILE), np.asarray(self.lengths))
+
+    def score(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        全行の BM25 スコアと、クエリの被覆率を返す。
+        被覆率は「その行に含まれるクエリの索引語の IDF の合計 / クエリの全索引語の IDF の合計」(0〜1)。
+        どの文書にも出てこない索引語は IDF が最大となるため、クエリに未知の語が多いほど被覆率は下がる。
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        coverage = np.zeros(self.n_docs, dtype=np.float32)
+        query_terms = set(tokenize(query))
+        if not query_terms or self.n_docs == 0:
+            return scores, coverage
+
+        total_idf = 0.0
+        for term in query_terms:
+            term_id = self._term_ids.get(term)
+            start, end = (0, 0) if term_id is None else (int(self.offsets[term_id]), int(self.offsets[term_id + 1]))
+            df = end - start
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            total_idf += idf
+            if df == 0:
+                continue
+            rows = self.rows[start:end]
+            freqs = self.freqs[start:end]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[rows] / self.avg_length)
+            scores[rows] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+            coverage[rows] += idf
+        if total_idf > 0:
+            coverage /= total_idf
+        return scores, coverage
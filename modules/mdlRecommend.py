@@ -0,0 +1,80 @@
+# 関連事例・関連人材の取得モジュール
+#
+# インデックスに格納済みの事例・人材のベクトルを復元して近傍を検索するため、埋め込み API (OpenAI) は呼び出さない。
+import json
+from typing import Final, Optional
+import vectorstore_global
+from modules.mdlVectorstore import similar_documents, documents_by_owner
+from modules.mdlTalent import candidate_from_document
+from modules.mdlDxAdvice import case_from_document
+from modules import mdlAffinity
+from modules.mdlIndexLoader import require_vectorstore
+
+# 取得件数の上限
+MAX_SIMILAR_COUNT: Final[int] = 50
+
+def _source(case_id: Optional[int], talent_id: Optional[int]):
+    """
+    case_id / talent_id のどちらか一方から、検索元の (ベクトルストア, 所有者キー, 所有者ID) を返す
+    """
+    if case_id is not None:
+        return require_vectorstore("case"), "case_id", case_id
+    return require_vectorstore("talent"), "talent_id", talent_id
+
+def _validate(case_id: Optional[int], talent_id: Optional[int], cnt: int) -> Optional[tuple[int, str]]:
+    if (case_id is None) == (talent_id is None):
+        return 400, json.dumps({"message": "case_id または talent_id のどちらか一方を指定してください。"}, ensure_ascii=False)
+    if not 1 <= cnt <= MAX_SIMILAR_COUNT:
+        return 400, json.dumps({"message": f"cnt には 1 〜 {MAX_SIMILAR_COUNT} を指定してください。"}, ensure_ascii=False)
+    return None
+
+# 事例または人材に近い事例を取得
+def getSimilarCases(case_id: Optional[int] = None, talent_id: Optional[int] = None, cnt: int = 4) -> tuple[int, str]:
+    error = _validate(case_id, talent_id, cnt)
+    if error:
+        return error
+    # 再作成による差し替え中も一貫したベクトルストアを参照するため、参照を一度だけ取得する
+    source_vs, source_key, owner_id = _source(case_id, talent_id)
+    case_vectorstore = require_vectorstore("case")
+
+    hits = similar_documents(source_vs, source_key, owner_id, case_vectorstore, "case_id", cnt)
+    if hits is None:
+        return 404, json.dumps({"message": f"{source_key} '{owner_id}' はインデックスに存在しません。"}, ensure_ascii=False)
+
+    results = []
+    for doc, score in hits:
+        case = case_from_document(doc, doc.page_content)
+        case["score"] = score
+        results.append(case)
+    return 200, json.dumps(results, ensure_ascii=False)
+
+# 事例または人材に近い人材を取得
+def getSimilarTalents(case_id: Optional[int] = None, talent_id: Optional[int] = None, cnt: int = 4) -> tuple[int, str]:
+    error = _validate(case_id, talent_id, cnt)
+    if error:
+        return error
+    source_vs, source_key, owner_id = _source(case_id, talent_id)
+    talent_vectorstore = require_vectorstore("talent")
+
+    # 事例の場合は事前計算済みの類似度（事例→人材の上位）があればそれを使う
+    # 再計算による差し替え中も talent_id と距離を同じ結果から取得するため、参照を一度だけ取得する
+    affinity = vectorstore_global.case_talent_affinity
+    talent_ids = mdlAffinity.lookup_talent_ids(case_id, cnt, affinity) if case_id is not None and affinity is not None else None
+    if talent_ids is not None:
+        distances = affinity["distances"][affinity["rows"][case_id]]
+        hits = []
+        for talent_id_, distance in zip(talent_ids, distances):
+            docs = documents_by_owner(talent_vectorstore, "talent_id", [talent_id_])
+            if docs:
+                hits.append((docs[0], float(distance)))
+    else:
+        hits = similar_documents(source_vs, source_key, owner_id, talent_vectorstore, "talent_id", cnt)
+    if hits is None:
+        return 404, json.dumps({"message": f"{source_key} '{owner_id}' はインデックスに存在しません。"}, ensure_ascii=False)
+
+    results = []
+    for doc, score in hits:
+        candidate = candidate_from_document(doc, doc.page_content)
+        candidate["score"] = score
+        results.append(candidate)
+    return 200, json.dumps(results, ensure_ascii=False)
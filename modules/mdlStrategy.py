@@ -1,10 +1,18 @@
 # ユーザ向けアクションモジュール
 import json
+import asyncio
 from models.params import  userData, strategyData
 from db_control import crud
 from fastapi import HTTPException
+from modules.mdlStrategyCache import get_strategy_cache
 import os
-import openai
+from typing import Optional
+
+# 戦略文書の生成に使用するモデル
+STRATEGY_MODEL = "gpt-4o-mini"
+# GPT の出力のうち戦略文書の本文を囲むマーカー
+START_MARKER = "<<START_STRATEGY>>"
+END_MARKER = "<<END_STRATEGY>>"
 
 def create_strategy_prompt(user: dict, detail: dict, case: dict) -> str:
     """
@@ -65,8 +73,8 @@ def create_strategy_prompt(user: dict, detail: dict, case: dict) -> str:
     
     return prompt
 
-# 戦略文書を作成する
-def createDoc(data: userData) -> tuple[int, str]:
+# 戦略文書作成のプロンプトを生成する（ユーザー・検索情報・事例が見つからない場合は 404 とメッセージの JSON を返す）
+def buildStrategyPrompt(data: userData) -> tuple[int, str]:
     # ユーザー情報を取得
     status, user_json = crud.select_m_user(data.user_id)
     if status == 404:
@@ -99,15 +107,37 @@ def createDoc(data: userData) -> tuple[int, str]:
     case_dict = json.loads(case_json)
     
     # 戦略文書作成のプロンプトを生成する。引数は全て辞書型にする
-    prompt = create_strategy_prompt(user_dict, detail_dict, case_dict)
+    return 200, create_strategy_prompt(user_dict, detail_dict, case_dict)
+
+def lookup_cached_doc(prompt: str, regenerate: bool) -> Optional[str]:
+    """
+    キャッシュ済みの戦略文書を返す（無い場合・再生成を指定した場合は None）
+    """
+    cache = get_strategy_cache()
+    if regenerate:
+        cache.bypass()
+        return None
+    return cache.get(STRATEGY_MODEL, prompt)
+
+# 戦略文書を作成する（regenerate=True の場合はキャッシュを使わずに GPT で生成し直す）
+def createDoc(data: userData, regenerate: bool = False) -> tuple[int, str]:
+    status, prompt = buildStrategyPrompt(data)
+    if status != 200:
+        return status, prompt
     strategy_doc = prompt
    
     DO_GPT = os.getenv("DO_GPT") 
-    if DO_GPT == "TRUE":
-        # GPTによる戦略文書生成
+    cached_doc = lookup_cached_doc(prompt, regenerate) if DO_GPT == "TRUE" else None
+    if cached_doc is not None:
+        # 同じ業界・企業規模・部署・テーマ・事例で生成済みの戦略文書を使う
+        print("[mdlStrategy] キャッシュ済みの戦略文書を使います")
+        strategy_doc = cached_doc
+    elif DO_GPT == "TRUE":
+        # GPTによる戦略文書生成（openai は GPT を呼び出す場合のみ読み込む）
+        import openai
         openai.api_key = os.getenv("OPEN_AI_API_KEY")
         response =  openai.chat.completions.create(
-            model="gpt-4o-mini",
+            model=STRATEGY_MODEL,
             messages=[{"role": "user", "content": prompt},],
         )
         # レスポンスを解析
@@ -115,13 +145,12 @@ def createDoc(data: userData) -> tuple[int, str]:
         # デバッグ用: GPTの出力を確認
         print("GPT Raw Output:", output_content)
         # 戦略文書部分を抽出
-        start_marker = "<<START_STRATEGY>>"
-        end_marker = "<<END_STRATEGY>>"
-        start_index = output_content.find(start_marker)
-        end_index = output_content.find(end_marker)
+        start_index = output_content.find(START_MARKER)
+        end_index = output_content.find(END_MARKER)
         if start_index != -1 and end_index != -1:
             # マーカー直後から開始、終了マーカー直前までを抽出
-            strategy_doc = output_content[start_index + len(start_marker):end_index].strip()
+            strategy_doc = output_content[start_index + len(START_MARKER):end_index].strip()
+            get_strategy_cache().put(STRATEGY_MODEL, prompt, strategy_doc)
         else:
             # マーカーが見つからなければ、全体を戦略文書とする（またはエラー処理）
             strategy_doc = output_content
@@ -139,6 +168,166 @@ def createDoc(data: userData) -> tuple[int, str]:
     
     return status, result
 
+def marker_prefix_length(text: str, marker: str) -> int:
+    """
+    text の末尾がマーカーの先頭部分と一致する文字数を返す（次のトークンでマーカーになる可能性がある部分）
+    """
+    for length in range(min(len(text), len(marker) - 1), 0, -1):
+        if text.endswith(marker[:length]):
+            return length
+    return 0
+
+class StrategyStreamFilter:
+    """
+    GPT の出力をトークンごとに受け取り、<<START_STRATEGY>> 〜 <<END_STRATEGY>> の間の本文だけを返す。
+    マーカーがトークンの境界で分割される場合に備え、マーカーの先頭と一致する末尾は次のトークンまで保留する。
+    start_marker / end_marker を指定した場合はそのマーカーの間を返す（DXアドバイスの <<START_ADVICE>> など）
+    """
+
+    def __init__(self, start_marker: str = START_MARKER, end_marker: str = END_MARKER):
+        self.start_marker = start_marker
+        self.end_marker = end_marker
+        self.raw = ""          # GPT の出力全体（デバッグ出力用）
+        self.body = ""         # 本文として返した文字列
+        self.state = "before"  # before: 開始マーカー前 / body: 本文 / after: 終了マーカー以降
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        """
+        出力の断片を受け取り、クライアントへ送ってよい本文を返す
+        """
+        self.raw += text
+        self._pending += text
+        if self.state == "before":
+            start_index = self._pending.find(self.start_marker)
+            if start_index == -1:
+                self._pending = self._pending[len(self._pending) - marker_prefix_length(self._pending, self.start_marker):]
+                return ""
+            self._pending = self._pending[start_index + len(self.start_marker):]
+            self.state = "body"
+        if self.state != "body":
+            return ""
+
+        end_index = self._pending.find(self.end_marker)
+        if end_index != -1:
+            out, self._pending = self._pending[:end_index], ""
+            self.state = "after"
+        else:
+            keep = marker_prefix_length(self._pending, self.end_marker)
+            out, self._pending = self._pending[:len(self._pending) - keep], self._pending[len(self._pending) - keep:]
+        return self._emit(out)
+
+    def finish(self) -> str:
+        """
+        出力の終了時に、保留していた本文を返す。
+        開始マーカーが無かった場合は createDoc と同様に出力全体を戦略文書とする
+        """
+        if self.state == "before":
+            self.state = "after"
+            return self._emit(self.raw)
+        out = self._pending if self.state == "body" else ""
+        self._pending = ""
+        self.state = "after"
+        return self._emit(out)
+
+    def document(self) -> str:
+        return self.body.strip()
+
+    def _emit(self, out: str) -> str:
+        # 本文の先頭の改行（マーカー直後の改行）は送らない
+        if not self.body:
+            out = out.lstrip()
+        self.body += out
+        return out
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Server-Sent Events の1イベント分の文字列を生成する（data は JSON）
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# 戦略文書を作成し、生成中の本文を Server-Sent Events で返す（prompt は buildStrategyPrompt で生成したもの）
+#   event: delta … 本文の断片 {"text": "..."}
+#   event: done  … 生成した戦略文書を t_document に登録した後 {"document_id": 1}
+#   event: error … 生成・登録に失敗した場合 {"message": "...", "details": "..."}
+#   ※ キャッシュ済みの戦略文書を使った場合は done に "cached": true を付ける（regenerate=True の場合はキャッシュを使わない）
+# クライアントの切断時は、ルーターで stream_until_disconnected を経由して生成を中断し、t_document には登録しない
+def streamDoc(data: userData, prompt: str, regenerate: bool = False):
+    try:
+        do_gpt = os.getenv("DO_GPT") == "TRUE"
+        cached_doc = lookup_cached_doc(prompt, regenerate) if do_gpt else None
+        if cached_doc is not None:
+            # キャッシュ済みの戦略文書を行単位で送る
+            strategy_doc = cached_doc
+            for line in cached_doc.splitlines(keepends=True):
+                yield sse_event("delta", {"text": line})
+        elif do_gpt:
+            # openai は GPT を呼び出す場合のみ読み込む
+            import openai
+            openai.api_key = os.getenv("OPEN_AI_API_KEY")
+            stream_filter = StrategyStreamFilter()
+            stream = openai.chat.completions.create(
+                model=STRATEGY_MODEL,
+                messages=[{"role": "user", "content": prompt},],
+                stream=True,
+            )
+            try:
+                for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    out = stream_filter.feed(text or "")
+                    if out:
+                        yield sse_event("delta", {"text": out})
+            finally:
+                stream.close()
+            print("GPT Raw Output:", stream_filter.raw)
+            if stream_filter.state == "after" and START_MARKER in stream_filter.raw:
+                # マーカーで囲まれた本文が得られた場合のみキャッシュする
+                get_strategy_cache().put(STRATEGY_MODEL, prompt, stream_filter.document())
+            out = stream_filter.finish()
+            if out:
+                yield sse_event("delta", {"text": out})
+            strategy_doc = stream_filter.document()
+        else:
+            # GPTトークン節約（createDoc と同じサンプル文書を登録し、行単位で送る）
+            strategy_doc = os.getenv("SAMPLE_DOC")
+            for line in (strategy_doc or "").splitlines(keepends=True):
+                yield sse_event("delta", {"text": line})
+
+        # 戦略文書を登録
+        status, result = crud.insert_t_document(data.search_id, data.search_id_sub, strategy_doc)
+        if status != 200:
+            yield sse_event("error", {"message": "t_document insert failed", "details": json.loads(result) if result else None})
+            return
+        done = {"document_id": json.loads(result)}
+        if cached_doc is not None:
+            done["cached"] = True
+        yield sse_event("done", done)
+    except Exception as e:
+        print("戦略文書のストリーミング生成でエラーが発生しました:", e)
+        yield sse_event("error", {"message": "strategy generation failed", "details": str(e)})
+
+async def stream_until_disconnected(request, events):
+    """
+    同期ジェネレーター events の各イベントをワーカースレッドで取得して返し、クライアントが切断した場合は
+    events を閉じて処理を中断する（GPT のストリームは streamDoc / generate_advice の finally で閉じる）
+    """
+    try:
+        while not await request.is_disconnected():
+            event = await asyncio.to_thread(next, events, None)
+            if event is None:
+                break
+            yield event
+    finally:
+        try:
+            await asyncio.to_thread(events.close)
+        except ValueError:
+            # 取得中にキャンセルされた場合（ワーカースレッドで実行中）は、実行中の処理が終わった後に破棄される
+            pass
+
+# 戦略文書の生成結果キャッシュのヒット/ミス件数を取得
+def getStrategyCacheStats() -> tuple[int, str]:
+    return 200, json.dumps(get_strategy_cache().stats(), ensure_ascii=False)
+
 # 戦略文書を取得
 def getDoc(search_id, search_id_sub, document_id) -> tuple[int, str]:
 
@@ -0,0 +1,155 @@
+# 戦略文書の生成結果キャッシュモジュール
+#
+# 戦略文書のプロンプト (mdlStrategy.create_strategy_prompt) は、検索情報の業界・企業規模・部署・テーマと
+# 事例名・事例概要だけから作られる（ユーザー情報は使わない）。同じ組み合わせで GPT を呼び出し直さないよう、
+# 生成した戦略文書を SQLite に保存し、次回以降はキャッシュした本文から t_document のレコードを作成する。
+#   - キーは「キャッシュ形式のバージョン + モデル名 + 正規化したプロンプト」の SHA-256 ハッシュ
+#     （プロンプトの正規化は NFKC・前後の空白除去・連続する空白の1文字化。プロンプトの文面を変えた場合も自動的に別のキーになる）
+#   - 有効期限 STRATEGY_CACHE_TTL_SECONDS 秒、件数上限 STRATEGY_CACHE_SIZE 件（超えた場合は最後に使われた日時の古いものから削除）
+#   - どちらかを 0 にした場合はキャッシュを使わない
+#   - GPT で生成した文書のみ保存する（DO_GPT が TRUE でない場合のサンプル文書、マーカーの無い出力は保存しない）
+# 再生成を指定したリクエスト (regenerate=true) はキャッシュを参照せずに生成し、生成結果でキャッシュを置き換える。
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Optional
+
+# キャッシュ形式のバージョン（本文の抽出方法などを変えて既存のキャッシュを使えなくなった場合に上げる）
+PROMPT_VERSION = 1
+DEFAULT_CACHE_PATH = "rag/strategy_cache.sqlite3"
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 1000
+
+_cache = None
+_lock = threading.Lock()
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    キャッシュキー用にプロンプトを正規化する（全角・半角の揺れ、空白・改行の違いを同一視する）
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", prompt)).strip()
+
+def make_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{PROMPT_VERSION}\0{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+class StrategyCache:
+    """
+    戦略文書のキャッシュ (SQLite)。有効期限と件数上限を持つ。
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_size: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS strategy_cache ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " document TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_strategy_cache_last_used ON strategy_cache (last_used_at)")
+            self._conn.commit()
+        except Exception as e:
+            # キャッシュが使えない場合も戦略文書の生成は続ける
+            print("[mdlStrategyCache] キャッシュを開けませんでした:", e)
+            self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None and self.ttl_seconds > 0 and self.max_size > 0
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = make_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT document FROM strategy_cache WHERE key = ? AND created_at > ?", (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE strategy_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, prompt: str, document: str) -> None:
+        if not self.enabled or not document:
+            return
+        key = make_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO strategy_cache (key, model, document, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, document, now, now),
+                )
+                # 期限切れのものと、件数上限を超えた分（最後に使われた日時の古いもの）を削除する
+                self._conn.execute("DELETE FROM strategy_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+                self._conn.execute(
+                    "DELETE FROM strategy_cache WHERE key IN ("
+                    " SELECT key FROM strategy_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,),
+                )
+                self._conn.commit()
+            except Exception as e:
+                print("[mdlStrategyCache] キャッシュへの書き込みに失敗しました:", e)
+
+    def bypass(self) -> None:
+        """
+        再生成の指定でキャッシュを参照しなかった件数を数える
+        """
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = None
+            if self._conn is not None:
+                entries = self._conn.execute("SELECT COUNT(*) FROM strategy_cache").fetchone()[0]
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "prompt_version": PROMPT_VERSION,
+                "path": self.path,
+            }
+
+def get_strategy_cache() -> StrategyCache:
+    """
+    プロセス内で共有する StrategyCache を返す（未作成なら作成する）
+    """
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = StrategyCache(
+                    os.getenv("STRATEGY_CACHE_PATH") or DEFAULT_CACHE_PATH,
+                    int(os.getenv("STRATEGY_CACHE_TTL_SECONDS") or DEFAULT_CACHE_TTL_SECONDS),
+                    int(os.getenv("STRATEGY_CACHE_SIZE") or DEFAULT_CACHE_SIZE),
+                )
+    return _cache
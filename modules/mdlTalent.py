@@ -3,8 +3,8 @@ import json
 import re
 from db_control import crud
 from fastapi import HTTPException
-import vectorstore_global
-from models.params import setTalentData, talentSearchData
+from modules.mdlIndexLoader import require_vectorstore
+from models.params import setTalentData, talentSearchData, talentBatchSearchData
 from typing import Final, Dict
 
 # 人材情報に対してプロンプトを実行し結果を返す
@@ -12,12 +12,14 @@ def getTalentByPrompt(prompt,cnt) -> tuple[int, str]:
 
     status = 200
 
-    if vectorstore_global.talent_vectorstore is None:
-        raise HTTPException(status_code=500, detail="Vectorstore is not initialized.")
+    # 再作成による差し替え中も一貫したベクトルストアを参照するため、参照を一度だけ取得する
+    # （起動時の読み込み中は完了を待ち、読み込めない場合は 503）
+    talent_vectorstore = require_vectorstore("talent")
 
-    # FAISSのretrieverを作成し、上位3件の関連ドキュメントを検索する例
-    retriever = vectorstore_global.talent_vectorstore.as_retriever(search_kwargs={"k": cnt})
-    results = retriever.get_relevant_documents(prompt)
+    # 語彙検索 (BM25) とベクトル検索を統合して上位 cnt 件を検索する（語彙だけで十分な場合は埋め込みを省略）
+    # （langchain / faiss は検索を行う処理でのみ読み込む。起動時・DB のみの処理の import を軽くするため）
+    from modules.mdlVectorstore import hybrid_search
+    results = hybrid_search(talent_vectorstore, prompt, cnt, "talent_id")
 
     # 検索結果の各ドキュメント内容を標準出力に出力
     print(prompt)
@@ -32,6 +34,43 @@ def getTalentByPrompt(prompt,cnt) -> tuple[int, str]:
     return status, result_texts
 
 
+# 一括検索で受け付けるプロンプト数の上限
+MAX_BATCH_QUERIES: Final[int] = 1000
+
+# 複数のプロンプトで人材情報を一括検索し、プロンプトごとの結果を返す
+def getTalentByPrompts(data: talentBatchSearchData) -> tuple[int, str]:
+    """
+    プロンプトの埋め込みは1回の API 呼び出し、FAISS の検索は1回の行列検索でまとめて行う。
+    戻り値の各要素は {"prompt", "cnt", "results": [人材情報 + score(距離)]}
+    """
+    if not data.queries:
+        return 400, json.dumps({"message": "queries が指定されていません。"}, ensure_ascii=False)
+    if len(data.queries) > MAX_BATCH_QUERIES:
+        result = {"message": f"一度に検索できるプロンプトは {MAX_BATCH_QUERIES} 件までです。"}
+        return 400, json.dumps(result, ensure_ascii=False)
+    if any(query.cnt <= 0 for query in data.queries):
+        return 400, json.dumps({"message": "cnt には 1 以上を指定してください。"}, ensure_ascii=False)
+
+    # 再作成による差し替え中も一貫したベクトルストアを参照するため、参照を一度だけ取得する
+    # （起動時の読み込み中は完了を待ち、読み込めない場合は 503）
+    talent_vectorstore = require_vectorstore("talent")
+
+    prompts = [query.prompt for query in data.queries]
+    from modules.mdlVectorstore import batch_search
+    hits = batch_search(talent_vectorstore, prompts, [query.cnt for query in data.queries], "talent_id")
+
+    results = []
+    for query, query_hits in zip(data.queries, hits):
+        candidates = []
+        for doc, score in query_hits:
+            candidate = candidate_from_document(doc, doc.page_content)
+            candidate["score"] = score
+            candidates.append(candidate)
+        results.append({"prompt": query.prompt, "cnt": query.cnt, "results": candidates})
+    print(f"[mdlTalent] 一括検索: {len(prompts)} 件のプロンプトを検索しました")
+
+    return 200, json.dumps(results, ensure_ascii=False)
+
 # 人材情報を取得
 def getTalent(search_id, search_id_sub) -> tuple[int, str]:
    
@@ -53,6 +92,7 @@ def getTalent(search_id, search_id_sub) -> tuple[int, str]:
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error parsing response: " + str(e))
     
+    job_talent_ids = None
     prompt_base = "に優れた人材を抽出してください。ID、名前、エグゼクティブサマリー、マインドセット、経歴、支援可能領域は必ず含め、足りない場合は別の人を選んでください"
     # flag の値に応じてプロンプトを作成
     if flag == 0:
@@ -63,17 +103,36 @@ def getTalent(search_id, search_id_sub) -> tuple[int, str]:
         # flag==1 の場合、m_job から取得した情報なので job_name が存在するはず
         job_name = result_data.get("job_name", "")
         prompt = f"職種: {job_name}。 {job_name}{prompt_base}"
+        # talent_job から職種を保有する人材を取得し、検索対象をその人材に絞り込む
+        status, job_result = crud.select_talent_ids_by_job(result_data.get("job_id"))
+        if status != 200:
+            raise HTTPException(status_code=status, detail=json.loads(job_result))
+        job_talent_ids = json.loads(job_result)
         #ex) ERP導入に向いている人を抽出してください。名前、エグゼクティブサマリー、経歴は必ず加えてください。
     else:
         # 万が一 flag の値が期待外れの場合は 500 エラー
         raise HTTPException(status_code=500, detail="Unexpected flag value in response")  
     
-    if vectorstore_global.talent_vectorstore is None:
-        raise HTTPException(status_code=500, detail="Vectorstore is not initialized.")
+    # 再作成による差し替え中も一貫したベクトルストアを参照するため、参照を一度だけ取得する
+    # （起動時の読み込み中は完了を待ち、読み込めない場合は 503）
+    talent_vectorstore = require_vectorstore("talent")
+    from modules.mdlVectorstore import vector_search, documents_by_owner
+    from modules import mdlAffinity
 
-    # FAISSのretrieverを作成し、上位3件の関連ドキュメントを検索する例
-    retriever = vectorstore_global.talent_vectorstore.as_retriever(search_kwargs={"k": 4})
-    results = retriever.get_relevant_documents(prompt)
+    # 事例の場合は事前計算済みの類似度（事例→人材の上位）を参照する
+    affinity_talent_ids = mdlAffinity.lookup_talent_ids(result_data["case_id"], 4) if flag == 0 else None
+
+    if affinity_talent_ids is not None:
+        results = documents_by_owner(talent_vectorstore, "talent_id", affinity_talent_ids)
+    else:
+        results = []
+        if job_talent_ids:
+            # 職種を保有する人材の中から上位4件を検索
+            results = vector_search(talent_vectorstore, prompt, 4, "talent_id", job_talent_ids)
+        if not results:
+            # 全件から上位4件を検索（事例の場合、または職種を保有する人材がいない・インデックスに含まれない場合）
+            # チャンク分割したインデックスでも同じ人材が重複しないよう、人材ごとにまとめて検索する
+            results = vector_search(talent_vectorstore, prompt, 4, "talent_id")
 
     # 検索結果の各ドキュメント内容を標準出力に出力
     print(prompt)
@@ -83,13 +142,30 @@ def getTalent(search_id, search_id_sub) -> tuple[int, str]:
         # 各候補のテキストを組み立て（ヘッダーも含む）
         candidate_text = f"----- Candidate {i+1} -----\n" + doc.page_content
         print(candidate_text)
-        parsed_candidate = parse_candidate(candidate_text)
-        parsed_results.append(parsed_candidate)
+        parsed_results.append(candidate_from_document(doc, candidate_text))
     print("----- End of Documents -----")
     
     # result_texts はリストになっているので、JSON文字列に変換して返す
     return status, json.dumps(parsed_results, ensure_ascii=False)
 
+# 人材インデックスの metadata に保持している項目（キーは parse_candidate の出力と同じ）
+CANDIDATE_FIELDS: Final[tuple] = ("name", "summary", "industry", "career", "mindset", "supportarea", "job")
+
+def candidate_from_document(doc, candidate_text: str) -> Dict[str, str]:
+    """
+    検索結果の Document から人材情報の辞書を作成する。
+    metadata に各項目を保持している場合はそのまま返し、
+    項目を持たない旧形式のインデックスの場合のみ candidate_text を解析する。
+    """
+    metadata = doc.metadata or {}
+    if "name" not in metadata:
+        return parse_candidate(candidate_text)
+
+    candidate = {"id": str(metadata.get("talent_id", ""))}
+    for key in CANDIDATE_FIELDS:
+        candidate[key] = metadata.get(key, "")
+    return candidate
+
 def parse_candidate(candidate_text: str) -> Dict[str, str]:
     """
     candidate_text から各セクションを抽出して辞書に変換する。
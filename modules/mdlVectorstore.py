@@ -1,102 +1,967 @@
 import os
-import shutil
 import traceback
 import json
+import re
+import hashlib
+import pickle
+import threading
+import weakref
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
 import vectorstore_global
-from sqlalchemy.orm import sessionmaker, joinedload
+from sqlalchemy.orm import sessionmaker, selectinload
 from sqlalchemy import asc, true
-from db_control.connect import engine
+from db_control.connect import get_engine
 from db_control.mymodels import (
-    m_talent, talent_job, m_job, talent_hashtag, m_hashtag,  # talent 関連
+    m_talent, talent_job, m_job,  # talent 関連
     m_case                                                # case モデルを追加
 )
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+import faiss
+import numpy as np
+from modules.mdlEmbedding import (
+    get_embeddings, get_base_embeddings, embed_texts_batched, checkpoint_dir_for, clear_checkpoints,
+    can_embed_documents, embedding_model_name, embedding_dimension
+)
+from modules.mdlDocstore import MmapDocstore, has_mmap_docstore, save_docstore
+from modules.mdlLexical import LexicalIndex, has_lexical_index
+from modules.mdlIndexVersion import (
+    TALENT_INDEX_DIR, CASE_INDEX_DIR, current_index_dir, current_version, version_dir, new_version_dir, publish_version, rollback_version, discard_version, read_manifest,
+    rebuild_lock
+)
+from modules.mdlIndexSpec import (
+    DEFAULT_INDEX_SPEC, parse_index_spec, supports_delete, requires_training, apply_search_params, build_index, probe_vector,
+    reconstruct_rows, evaluate_compression
+)
+
+# インデックスの読み込みモード（環境変数 VECTORSTORE_LOAD_MODE）
+#   memory: index.faiss をプロセスのヒープへ読み込む（既定）
+#   mmap  : index.faiss を読み取り専用で mmap し、同一インスタンス上のワーカー間で OS のページキャッシュを共有する
+DEFAULT_LOAD_MODE = "memory"
+# 検索方式（環境変数 RETRIEVAL_MODE）
+#   hybrid: 文字 bigram (BM25) とベクトル検索の順位を Reciprocal Rank Fusion で統合する（既定）
+#   vector: ベクトル検索のみ
+DEFAULT_RETRIEVAL_MODE = "hybrid"
+# 上位 k 件すべての語彙の被覆率がこの値以上の場合は、埋め込みを呼び出さず語彙検索の結果を返す
+# （環境変数 LEXICAL_SKIP_COVERAGE。1 より大きい値を指定すると常にベクトル検索も行う）
+DEFAULT_LEXICAL_SKIP_COVERAGE = 0.9
+# Reciprocal Rank Fusion の定数（1 / (RRF_K + 順位) を足し合わせる）
+RRF_K = 60
+# 統合前に各検索方式から取得する件数（k の倍数）
+HYBRID_FETCH_FACTOR = 4
+# チャンク分割（環境変数 TALENT_CHUNK_SIZE / CASE_CHUNK_SIZE に文字数を指定。未指定・0 の場合は分割しない）
+DEFAULT_CHUNK_OVERLAP = 150
+# 1件の人材/事例あたりのチャンク数の上限（環境変数 MAX_CHUNKS_PER_DOCUMENT）。埋め込みのコストを件数あたり一定に抑える
+DEFAULT_MAX_CHUNKS = 16
+# チャンクをまとめた所有者の順位付け（環境変数 CHUNK_SCORE）
+#   max: 最も近いチャンクの距離（既定）
+#   sum: 取得したチャンクの類似度 1 / (1 + 距離) の合計（複数のチャンクが一致する所有者を優先する）
+DEFAULT_CHUNK_SCORE = "max"
+# 所有者が k 件揃うように最初に取得するチャンク数（k の倍数。1件あたりの最大チャンク数が少ない場合はそちらを使う）
+CHUNK_FETCH_FACTOR = 4
+# インデックス作成時に DB から1回に読み込む人材/事例の件数（環境変数 EXTRACT_BATCH_SIZE）
+# 読み込み・チャンク分割・埋め込み・追加をこの件数ずつ進めるため、作成中に保持する ORM オブジェクトと埋め込み前の Document はこの件数分に限られる
+DEFAULT_EXTRACT_BATCH_SIZE = 500
+
+# ベクトルストア -> 読み込み・保存したインデックスのバージョン（load_vectorstore / publish_vectorstore で記録する）
+_index_version_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
 
+def index_version(vs) -> Optional[str]:
+    """
+    ベクトルストアを読み込んだ・保存したインデックスのバージョン（load_vectorstore / publish_vectorstore 以外で作成したものは None）
+    """
+    try:
+        return _index_version_cache.get(vs)
+    except TypeError:
+        # 弱参照できないオブジェクト
+        return None
 
-def createVectorstore(target: str) -> tuple[int, str]:
+def set_vectorstore(target: str, vs) -> None:
+    """
+    稼働中のベクトルストアを差し替え、読み込んだインデックスのバージョンを vectorstore_global に記録する
+    （/ready の version と、事例→人材の類似度事前計算がこのプロセスのインデックスから計算されたものかの判定に使う）
+    ※ 呼び出し元で対象のロックを取得していること
+    """
+    base_dir = TALENT_INDEX_DIR if target == "talent" else CASE_INDEX_DIR
+    # ディスクの現在のバージョンは、読み込んだ後に別のプロセスが切り替えている場合があるため、読み込み時に記録したものを使う
+    version = index_version(vs) or current_version(base_dir)
+    # ベクトルストアを先に差し替える（新しいバージョンが見えた時点で、ベクトルストアも新しいものになっているようにする）
+    setattr(vectorstore_global, f"{target}_vectorstore", vs)
+    vectorstore_global.loaded_versions[target] = version
+
+def createVectorstore(target: str, mode: str = "full", progress: Optional[dict] = None, index_spec: Optional[str] = None) -> tuple[int, str]:
     """
     VectorStoreを再作成する
     2025/04/05現在 talentのみ対応
+    mode:
+      - "full": 全件を再ベクトル化する
+      - "sync": DBとインデックスの差分（追加/更新/削除）のみを反映する
+    いずれも新しいバージョンのディレクトリへ保存・検証した後に差し替えるため、
+    作成中・作成失敗時も直前のインデックスで検索を継続できる。
+    progress を渡すと、進捗（rows_extracted / docs_embedded / vectors_written）を書き込む。
+    index_spec を指定すると、そのインデックス種別で全件再作成する（modules.mdlIndexSpec 参照。mode="full" のみ）
     """
 
+    if mode not in ("full", "sync"):
+        result = {"message": f"mode '{mode}' は指定できません。(full / sync)"}
+        return 400, json.dumps(result, ensure_ascii=False)
+
+    if index_spec is not None:
+        try:
+            parse_index_spec(index_spec)
+        except ValueError as e:
+            return 400, json.dumps({"message": str(e)}, ensure_ascii=False)
+        if mode != "full":
+            result = {"message": "index_spec は mode=full の場合のみ指定できます。"}
+            return 400, json.dumps(result, ensure_ascii=False)
+
+    if target not in vectorstore_global.vectorstore_locks:
+        result = {"message": f"対象 '{target}' が見つかりません。"}
+        return 404, json.dumps(result, ensure_ascii=False)
+
+    # 同一対象の再作成・差し替えは直列に実行する
+    # （プロセス内はロックで待ち、rag/ を共有する別のプロセスが再作成中の場合はファイルロックで判定して 409 を返す）
+    base_dir = TALENT_INDEX_DIR if target == "talent" else CASE_INDEX_DIR
+    with vectorstore_global.vectorstore_locks[target], rebuild_lock(base_dir) as acquired:
+        if not acquired:
+            result = {"message": f"別のプロセスで {target} のインデックスを再作成中です。"}
+            return 409, json.dumps(result, ensure_ascii=False)
+        status, result = _create_vectorstore(target, mode, progress, index_spec)
+    if status == 200:
+        refresh_affinity_after_update()
+    return status, result
+
+def _create_vectorstore(target: str, mode: str, progress: Optional[dict], index_spec: Optional[str]) -> tuple[int, str]:
+    # ※ 呼び出し元 (createVectorstore) で対象のロックを取得していること
     if target == "talent":
+        if mode == "sync":
+            return sync_talent_vectorstore(progress)
         # talent_Vectorstoreを強制的に作成する
-        vectorstore = create_talent_vectorstore(true)
+        vectorstore = create_talent_vectorstore(true, progress, index_spec)
         if vectorstore is not None:
-            vectorstore_global.talent_vectorstore = vectorstore
-            result = {"message": "Vectorstore created successfully."}
+            set_vectorstore("talent", vectorstore)
+            result = {"message": "Vectorstore created successfully.", "version": current_version(TALENT_INDEX_DIR)}
             return 200, json.dumps(result, ensure_ascii=False)
         else:
             result = {"message": "Vectorstore creation failed."}
             return 500, json.dumps(result, ensure_ascii=False)
 
-    elif target == "case":
-        vs = create_case_vectorstore(true)
+    else:
+        if mode == "sync":
+            return sync_case_vectorstore(progress)
+        vs = create_case_vectorstore(true, progress, index_spec)
         if vs is not None:
-            vectorstore_global.case_vectorstore = vs
-            return 200, json.dumps({"message": "case_vectorstore created successfully."}, ensure_ascii=False)
+            set_vectorstore("case", vs)
+            result = {"message": "case_vectorstore created successfully.", "version": current_version(CASE_INDEX_DIR)}
+            return 200, json.dumps(result, ensure_ascii=False)
         else:
             return 500, json.dumps({"message": "case_vectorstore creation failed."}, ensure_ascii=False)
-        
-    else:
+
+def rollbackVectorstore(target: str) -> tuple[int, str]:
+    """
+    VectorStoreを直前のバージョンに戻す
+    """
+    base_dirs = {"talent": TALENT_INDEX_DIR, "case": CASE_INDEX_DIR}
+    if target not in base_dirs:
         result = {"message": f"対象 '{target}' が見つかりません。"}
         return 404, json.dumps(result, ensure_ascii=False)
 
-def create_talent_vectorstore(force_recreate: bool = False):
+    attr = f"{target}_vectorstore"
+    # 再作成と同じく、rag/ を共有する別のプロセスが再作成・ロールバック中の場合は manifest を切り替えずに 409 を返す
+    with vectorstore_global.vectorstore_locks[target], rebuild_lock(base_dirs[target]) as acquired:
+        if not acquired:
+            result = {"message": f"別のプロセスで {target} のインデックスを再作成中です。"}
+            return 409, json.dumps(result, ensure_ascii=False)
+        version = rollback_version(base_dirs[target])
+        if version is None:
+            result = {"message": f"{attr} にロールバック可能なバージョンがありません。"}
+            return 404, json.dumps(result, ensure_ascii=False)
+        try:
+            vs = load_vectorstore(base_dirs[target])
+        except Exception as e:
+            print(f"{attr} ロールバック時にエラーが発生しました:", e)
+            traceback.print_exc()
+            return 500, json.dumps({"message": f"{attr} rollback failed.", "details": str(e)}, ensure_ascii=False)
+        set_vectorstore(target, vs)
+        print(f"[vectorstore.py] {attr} をバージョン '{version}' にロールバックしました。")
+    refresh_affinity_after_update()
+    return 200, json.dumps({"message": f"{attr} rolled back.", "version": version}, ensure_ascii=False)
+
+def refresh_affinity_after_update() -> None:
     """
-    m_talentテーブルを中心に、関連テーブルの情報（経歴、マインドセット、支援領域、職種情報）を取得し、
-    Document化、テキスト分割を行った後、FAISS インデックスを生成する関数です。
+    インデックスの更新・ロールバック後に、事例→人材の類似度事前計算 (modules.mdlAffinity) を作り直す
+    """
+    # mdlAffinity は本モジュールを参照するため、ここで読み込む（循環 import の回避）
+    from modules import mdlAffinity
+    try:
+        mdlAffinity.refresh_affinity()
+    except Exception as e:
+        # 事前計算に失敗しても検索は ANN 検索で継続できるため、インデックス更新自体は成功とする
+        print("事例→人材の類似度事前計算でエラーが発生しました:", e)
+        traceback.print_exc()
 
-    パラメータ force_recreate が True の場合、既存のインデックス保存ディレクトリがあれば削除して再生成します。
-    また、環境変数 DO_GPT が "TRUE" の場合のみ OpenAI API を利用してベクトル化を行います。
+def getVectorstoreMemory() -> tuple[int, str]:
+    """
+    読み込み中のインデックスごとの常駐バイト数（mmap 分の RSS / PSS、ヒープの推定値）と、
+    インデックス仕様・圧縮の評価（圧縮前と比べたメモリ削減量と再現率。manifest の記録）を返す
     """
-    index_dir = "rag/talent_vectorstore_index"
-    DO_GPT = os.getenv("DO_GPT")
-    OPENAI_API_KEY = os.getenv("OPEN_AI_API_KEY")
+    return 200, json.dumps(report_vectorstore_memory(), ensure_ascii=False)
 
-    # 強制再生成の場合、既存のインデックスディレクトリを削除
-    if force_recreate and os.path.exists(index_dir):
-        shutil.rmtree(index_dir)
-        print(f"[vectorstore.py] force_recreate=True のため、既存のインデックスディレクトリ '{index_dir}' を削除しました。")
+def report_vectorstore_memory() -> dict:
+    """
+    各インデックスの常駐バイト数を集計して標準出力に出力する（起動時のインスタンスサイズ見積もり用）
+    """
+    reports = {}
+    for target, base_dir in (("talent", TALENT_INDEX_DIR), ("case", CASE_INDEX_DIR)):
+        vs = getattr(vectorstore_global, f"{target}_vectorstore")
+        index_dir = current_index_dir(base_dir)
+        if vs is None or index_dir is None:
+            continue
+        report = memory_report(index_dir)
+        info = version_info(base_dir)
+        report.update({
+            "load_mode": load_mode(), "vectors": vs.index.ntotal, "dimension": vs.index.d,
+            "index_spec": info.get("index_spec") or DEFAULT_INDEX_SPEC, "compression": info.get("compression"),
+        })
+        reports[target] = report
+        print(
+            f"[vectorstore.py] {target}_vectorstore: mode={report['load_mode']} vectors={report['vectors']} "
+            f"mapped_rss={report['mapped_rss_bytes']} mapped_pss={report['mapped_pss_bytes']} heap_estimate={report['heap_bytes_estimate']} (bytes)"
+        )
+    return reports
 
-    # インデックスが既に存在する場合はロードを試みる
-    if os.path.exists(index_dir):
-        try:
-            embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-            talent_vectorstore = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
-            print(f"[vectorstore.py] ディスクから talent_vectorstore をロードしました (ディレクトリ: '{index_dir}')")
-            return talent_vectorstore
-        except Exception as e:
-            print("ディスクからの talent_vectorstore ロード時にエラーが発生しました:", e)
-            traceback.print_exc()
-            # ロードに失敗した場合は再生成を試みる
+def content_hash(content: str) -> str:
+    """
+    Document 本文のハッシュ値（差分判定用）
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
-    #  新規生成
-    Session = sessionmaker(bind=engine)
-    session = Session()
+def make_document_ids(docs: list[Document], owner_key: str) -> list[str]:
+    """
+    docstore の ID を「talent:12:0」のように 所有者ID + 連番 で採番する。
+    （1件の人材/事例が複数の Document に分割された場合も一意になる）
+    """
+    prefix = owner_key.removesuffix("_id")
+    counters: dict = {}
+    ids = []
+    for doc in docs:
+        owner = doc.metadata[owner_key]
+        n = counters.get(owner, 0)
+        counters[owner] = n + 1
+        ids.append(f"{prefix}:{owner}:{n}")
+    return ids
+
+def parse_owner_id(page_content: str):
+    """
+    metadata を持たない旧形式のインデックス向けに、本文の【ID】から所有者IDを取り出す。
+    """
+    match = re.search(r"【ID】\s*(\d+)", page_content)
+    return int(match.group(1)) if match else None
+
+def indexed_owner_map(vs, owner_key: str) -> tuple[dict, list[str]]:
+    """
+    インデックス内の Document を所有者ID(talent_id / case_id)ごとにまとめる。
+    戻り値:
+      ({所有者ID: {"ids": [docstore ID...], "hash": content_hash, "metadata": metadata}}, 所有者不明の docstore ID リスト)
+    """
+    owners: dict = {}
+    orphans: list[str] = []
+    for _, doc_id in sorted(vs.index_to_docstore_id.items()):
+        doc = vs.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            orphans.append(doc_id)
+            continue
+        owner = doc.metadata.get(owner_key)
+        if owner is None:
+            owner = parse_owner_id(doc.page_content)
+        if owner is None:
+            orphans.append(doc_id)
+            continue
+        entry = owners.setdefault(owner, {"ids": [], "hash": None, "metadata": None})
+        entry["ids"].append(doc_id)
+        entry["hash"] = doc.metadata.get("content_hash") or content_hash(doc.page_content)
+        entry["metadata"] = doc.metadata
+    return owners, orphans
+
+# ベクトルストアごとの 所有者ID -> FAISS 行番号 の対応（フィルタ検索用。差し替え後の新しいベクトルストアでは作り直す）
+_owner_rows_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_row_owner_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_owner_rows_lock = threading.Lock()
+
+def owner_rows(vs, owner_key: str) -> dict:
+    """
+    所有者ID(talent_id / case_id) ごとの FAISS 行番号のリストを返す。
+    docstore ID が「talent:12:0」形式の場合は ID から求め、旧形式の ID の場合のみ Document を読み込む。
+    """
+    with _owner_rows_lock:
+        cached = _owner_rows_cache.get(vs)
+    if cached is not None:
+        return cached
+
+    prefix = owner_key.removesuffix("_id")
+    pattern = re.compile(rf"^{prefix}:(\d+):\d+$")
+    rows: dict = {}
+    for row, doc_id in vs.index_to_docstore_id.items():
+        match = pattern.match(doc_id)
+        if match:
+            owner = int(match.group(1))
+        else:
+            doc = vs.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            owner = doc.metadata.get(owner_key) or parse_owner_id(doc.page_content)
+        if owner is not None:
+            rows.setdefault(owner, []).append(row)
+
+    with _owner_rows_lock:
+        _owner_rows_cache[vs] = rows
+    return rows
+
+def row_owners(vs, owner_key: str) -> dict:
+    """
+    FAISS 行番号 -> 所有者ID の対応を返す（owner_rows の逆引き）
+    """
+    with _owner_rows_lock:
+        cached = _row_owner_cache.get(vs)
+    if cached is not None:
+        return cached
+    owners = {row: owner for owner, rows in owner_rows(vs, owner_key).items() for row in rows}
+    with _owner_rows_lock:
+        _row_owner_cache[vs] = owners
+    return owners
+
+def documents_by_owner(vs, owner_key: str, owner_ids) -> list[Document]:
+    """
+    所有者IDの順に、各所有者の先頭の Document を返す（インデックスに無い所有者は除く）
+    """
+    rows_by_owner = owner_rows(vs, owner_key)
+    docs = []
+    for owner in owner_ids:
+        rows = rows_by_owner.get(owner)
+        if not rows:
+            continue
+        doc = vs.docstore.search(vs.index_to_docstore_id[rows[0]])
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+def similar_documents(source_vs, source_key: str, owner_id: int, target_vs, target_key: str, k: int) -> Optional[list]:
+    """
+    source_vs に格納済みの所有者 owner_id のベクトルを復元し、target_vs から近い所有者の Document を上位 k 件返す。
+    埋め込み API は呼び出さない。source と target が同じ種別の場合は owner_id 自身を除外する。
+    戻り値: [(Document, 距離)]（所有者ごとに最も近い Document）。owner_id が source_vs に無い場合は None
+    """
+    rows = owner_rows(source_vs, source_key).get(owner_id)
+    if not rows:
+        return None
+    vectors = reconstruct_rows(source_vs.index, rows)
+    exclude = owner_id if source_key == target_key else None
+    row_owner = row_owners(target_vs, target_key)
+
+    # 1件の所有者が複数の Document を持つ場合に備え、所有者が k 件揃うまで取得件数を増やす
+    fetch = k + len(rows)
+    while True:
+        fetch = min(fetch, target_vs.index.ntotal)
+        distances, labels = target_vs.index.search(vectors, fetch)
+        best: dict = {}
+        for row, distance in zip(labels.ravel(), distances.ravel()):
+            owner = row_owner.get(int(row))
+            if owner is None or owner == exclude:
+                continue
+            if owner not in best or distance < best[owner][1]:
+                best[owner] = (int(row), float(distance))
+        if len(best) >= k or fetch >= target_vs.index.ntotal:
+            break
+        fetch *= 2
+
+    hits = []
+    for owner, (row, distance) in sorted(best.items(), key=lambda item: item[1][1])[:k]:
+        doc = target_vs.docstore.search(target_vs.index_to_docstore_id[row])
+        if isinstance(doc, Document):
+            hits.append((doc, distance))
+    return hits
+
+def search_parameters(index, selector):
+    """
+    インデックス種別に応じた検索パラメータ (ID セレクタ付き) を作成する。nprobe / efSearch は現在の値を引き継ぐ
+    """
+    if isinstance(index, faiss.IndexPreTransform):
+        # PCA などの前処理付きの場合は、内側のインデックスの検索パラメータを包む
+        return faiss.SearchParametersPreTransform(index_params=search_parameters(faiss.downcast_index(index.index), selector))
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def supports_selector(index) -> bool:
+    """
+    ID セレクタで検索対象の行を絞り込めるインデックスかどうか（IndexPQ は対応しない）
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        return supports_selector(index.index)
+    return not isinstance(index, faiss.IndexPQ)
+
+def chunk_score() -> str:
+    mode = (os.getenv("CHUNK_SCORE") or DEFAULT_CHUNK_SCORE).lower()
+    return mode if mode in ("max", "sum") else DEFAULT_CHUNK_SCORE
+
+def search_owners(vs, vectors: np.ndarray, k: int, owner_key: str, rows: Optional[list] = None) -> list[list[tuple[int, float]]]:
+    """
+    クエリベクトルごとに、所有者(talent_id / case_id)が重複しない上位 k 件の (FAISS 行番号, 距離) を返す。
+    1件の所有者が複数のチャンクを持つ場合は k より多く取得して所有者ごとにまとめ、所有者が k 件揃うまで取得件数を増やす。
+    順位は CHUNK_SCORE に従い、行番号・距離は所有者の中で最も近いチャンクのもの。
+    rows を指定した場合は FAISS の ID セレクタでその行だけを対象に検索する（全件検索してから除外しない）。
+    """
+    index = faiss.downcast_index(vs.index)
+    limit = index.ntotal if rows is None else len(rows)
+    if k <= 0 or limit == 0:
+        return [[] for _ in range(len(vectors))]
+    params = None
+    row_map = None
+    if rows is not None and supports_selector(index):
+        params = search_parameters(index, faiss.IDSelectorBatch(np.array(rows, dtype="int64")))
+    elif rows is not None:
+        # ID セレクタに対応しないインデックスは、対象の行のベクトルを復元して全件比較する（行番号は元の行番号に戻す）
+        row_map = np.array(rows, dtype="int64")
+        subset = faiss.IndexFlatL2(index.d)
+        subset.add(reconstruct_rows(index, row_map))
+        index = subset
+    row_owner = row_owners(vs, owner_key)
+    max_chunks = max((len(chunk_rows) for chunk_rows in owner_rows(vs, owner_key).values()), default=1)
+    rank_key = (lambda entry: entry[1]) if chunk_score() == "max" else (lambda entry: -entry[2])
+
+    results: list = [None] * len(vectors)
+    pending = list(range(len(vectors)))
+    fetch = k * min(max_chunks, CHUNK_FETCH_FACTOR)
+    while pending:
+        fetch = min(fetch, limit)
+        distances, labels = index.search(vectors[pending], fetch, params=params)
+        if row_map is not None:
+            labels = np.where(labels >= 0, row_map[np.maximum(labels, 0)], -1)
+        retry = []
+        for i, row_distances, row_labels in zip(pending, distances, labels):
+            # 所有者ID -> [最も近い行番号, その距離, 類似度の合計]
+            owners: dict = {}
+            for row, distance in zip(row_labels, row_distances):
+                owner = row_owner.get(int(row)) if row != -1 else None
+                if owner is None:
+                    continue
+                entry = owners.setdefault(owner, [int(row), float(distance), 0.0])
+                entry[2] += 1 / (1 + max(float(distance), 0.0))
+            if len(owners) < k and fetch < limit:
+                retry.append(i)
+                continue
+            results[i] = [(row, distance) for row, distance, _ in sorted(owners.values(), key=rank_key)[:k]]
+        pending = retry
+        fetch *= 2
+    return results
+
+def rows_of_owners(vs, owner_key: str, owner_ids) -> Optional[list]:
+    """
+    所有者IDのリストを FAISS 行番号のリストに変換する（owner_ids が None の場合は None = 全件）
+    """
+    if owner_ids is None:
+        return None
+    rows_by_owner = owner_rows(vs, owner_key)
+    return [row for owner in owner_ids for row in rows_by_owner.get(owner, [])]
+
+def vector_search(vs, query: str, k: int, owner_key: str, owner_ids=None) -> list[Document]:
+    """
+    クエリを埋め込んでベクトル検索し、所有者が重複しない上位 k 件の Document を返す。
+    owner_ids を指定した場合はその所有者の Document だけを対象にする。
+    """
+    rows = rows_of_owners(vs, owner_key, owner_ids)
+    if rows is not None and not rows:
+        return []
+    query_vector = np.array([vs.embedding_function.embed_query(query)], dtype="float32")
+    return documents_at_rows(vs, [row for row, _ in search_owners(vs, query_vector, k, owner_key, rows)[0]])
+
+def documents_at_rows(vs, rows) -> list[Document]:
+    docs = []
+    for row in rows:
+        doc = vs.docstore.search(vs.index_to_docstore_id[int(row)])
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+# ベクトルストアごとの語彙インデックス（保存・読み込み時に登録し、無い場合は docstore から作成する）
+_lexical_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_lexical_lock = threading.Lock()
+
+def build_lexical_index(vs) -> LexicalIndex:
+    """
+    docstore の本文から FAISS の行番号順に語彙インデックスを作成し、ベクトルストアに対応付ける
+    """
+    texts = []
+    for row in range(vs.index.ntotal):
+        doc = vs.docstore.search(vs.index_to_docstore_id.get(row, ""))
+        texts.append(doc.page_content if isinstance(doc, Document) else "")
+    lexical = LexicalIndex.build(texts)
+    with _lexical_lock:
+        _lexical_cache[vs] = lexical
+    return lexical
+
+def lexical_index(vs) -> LexicalIndex:
+    """
+    ベクトルストアの語彙インデックスを返す。語彙インデックスを保存していない旧形式のインデックスは初回に作成する
+    """
+    with _lexical_lock:
+        cached = _lexical_cache.get(vs)
+    return cached if cached is not None else build_lexical_index(vs)
+
+def retrieval_mode() -> str:
+    mode = (os.getenv("RETRIEVAL_MODE") or DEFAULT_RETRIEVAL_MODE).lower()
+    return mode if mode in ("hybrid", "vector") else DEFAULT_RETRIEVAL_MODE
+
+def lexical_skip_coverage() -> float:
+    return float(os.getenv("LEXICAL_SKIP_COVERAGE") or DEFAULT_LEXICAL_SKIP_COVERAGE)
+
+def rank_by_owner(rows, row_owner: dict, limit: int) -> list[tuple]:
+    """
+    行番号のリスト（良い順）を所有者ごとの先頭の行にまとめ、上位 limit 件の (所有者ID, 行番号) を返す
+    """
+    ranked = []
+    seen = set()
+    for row in rows:
+        owner = row_owner.get(int(row))
+        if owner is None or owner in seen:
+            continue
+        seen.add(owner)
+        ranked.append((owner, int(row)))
+        if len(ranked) >= limit:
+            break
+    return ranked
+
+def hybrid_search(vs, query: str, k: int, owner_key: str, owner_ids=None, lexical_query: Optional[str] = None) -> list[Document]:
+    """
+    文字 bigram の語彙検索 (BM25) とベクトル検索の結果を Reciprocal Rank Fusion で統合し、所有者ごとに上位 k 件の Document を返す。
+    語彙検索の上位 k 件すべてがクエリの索引語を十分に含む（被覆率 >= LEXICAL_SKIP_COVERAGE）場合は、
+    埋め込みを呼び出さずに語彙検索の結果をそのまま返す。
+    owner_ids を指定した場合はその所有者の Document だけを対象にする。RETRIEVAL_MODE=vector の場合はベクトル検索のみ。
+    lexical_query を指定した場合は語彙検索にその文字列を使う（query は埋め込みにのみ使う。
+    GPT 向けの指示文などを含むプロンプトでは、指示文の語が事例の本文と一致して順位を乱すため）
+    """
+    if lexical_query is None:
+        lexical_query = query
+    allowed = rows_of_owners(vs, owner_key, owner_ids)
+    if allowed is not None and not allowed:
+        return []
+    if retrieval_mode() == "vector":
+        return vector_search(vs, query, k, owner_key, owner_ids)
+    row_owner = row_owners(vs, owner_key)
+    fetch = k * HYBRID_FETCH_FACTOR
+
+    scores, coverage = lexical_index(vs).score(lexical_query)
+    if allowed is not None:
+        mask = np.zeros(len(scores), dtype=bool)
+        mask[allowed] = True
+        scores = np.where(mask, scores, 0)
+    matched = np.flatnonzero(scores > 0)
+    lexical = rank_by_owner(matched[np.argsort(-scores[matched], kind="stable")], row_owner, fetch)
+
+    threshold = lexical_skip_coverage()
+    if len(lexical) >= k and all(coverage[row] >= threshold for _, row in lexical[:k]):
+        print(f"[vectorstore.py] 語彙検索の被覆率が {threshold} 以上のため、埋め込みを省略しました: {lexical_query[:50]}")
+        return documents_at_rows(vs, [row for _, row in lexical[:k]])
+
+    query_vector = np.array([vs.embedding_function.embed_query(query)], dtype="float32")
+    vector = [(row_owner[row], row) for row, _ in search_owners(vs, query_vector, fetch, owner_key, allowed)[0]]
+    fused: dict = {}
+    for ranked in (vector, lexical):
+        for rank, (owner, row) in enumerate(ranked, start=1):
+            entry = fused.setdefault(owner, {"score": 0.0, "row": row})
+            entry["score"] += 1 / (RRF_K + rank)
+    # 同点の場合はベクトル検索の順位を優先する（dict はベクトル検索の結果から順に登録している）
+    best = sorted(fused.values(), key=lambda entry: -entry["score"])[:k]
+    return documents_at_rows(vs, [entry["row"] for entry in best])
+
+def batch_search(vs, queries: list[str], ks: list[int], owner_key: str) -> list[list[tuple[Document, float]]]:
+    """
+    複数のクエリをまとめて検索する。
+    クエリの埋め込みは1回の embed_documents 呼び出し（重複は除外）、FAISS の検索は行列検索でまとめて行い、
+    クエリごとに所有者が重複しない上位 k 件の (Document, 距離) を返す。
+    """
+    if not queries:
+        return []
+    unique = list(dict.fromkeys(queries))
+    vectors = vs.embedding_function.embed_documents(unique)
+    positions = {query: i for i, query in enumerate(unique)}
+    matrix = np.array([vectors[positions[query]] for query in queries], dtype="float32")
+
+    owner_hits = search_owners(vs, matrix, max(ks), owner_key)
+
+    results = []
+    for k, query_hits in zip(ks, owner_hits):
+        hits = []
+        for row, distance in query_hits[:k]:
+            doc = vs.docstore.search(vs.index_to_docstore_id[row])
+            if isinstance(doc, Document):
+                hits.append((doc, distance))
+        results.append(hits)
+    return results
+
+def update_progress(progress: Optional[dict], **counters) -> None:
+    """
+    インデックス作成ジョブの進捗カウンタを更新する（progress が None の場合は何もしない）
+    """
+    if progress is not None:
+        progress.update(counters)
+
+def embed_documents_to_vectorstore(
+    docs: list[Document], ids: list[str], target: str, progress: Optional[dict] = None, vs=None, index_spec: Optional[str] = None
+):
+    """
+    Document をバッチ埋め込み（トークン数でのバッチ化・並列実行・再試行・チェックポイント）し、
+    vs が None の場合は index_spec の種別で新しい FAISS ベクトルストアを生成、指定された場合はそこへ追加する。
+    """
+    texts = [doc.page_content for doc in docs]
+    vectors = embed_texts_batched(texts, get_base_embeddings(), checkpoint_dir_for(target), progress)
+    text_embeddings = list(zip(texts, vectors))
+    metadatas = [doc.metadata for doc in docs]
+    if vs is None:
+        vs = new_vectorstore(index_spec, np.array(vectors, dtype="float32"))
+    vs.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vs
+
+def new_vectorstore(index_spec: Optional[str], vectors: np.ndarray):
+    """
+    index_spec の種別で空の FAISS ベクトルストアを生成する（学習が必要な種別は vectors で学習する）
+    """
+    return FAISS(get_embeddings(), build_index(index_spec, vectors), InMemoryDocstore(), {})
+
+def extract_batch_size() -> int:
+    return max(1, int(os.getenv("EXTRACT_BATCH_SIZE") or DEFAULT_EXTRACT_BATCH_SIZE))
+
+def iter_pages(items, size: int):
+    """
+    イテラブルを size 件ずつのリストに区切って返すジェネレータ
+    """
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+def add_embedded_batches(vs, batches: list[tuple]) -> None:
+    """
+    埋め込み済みのバッチ (texts, vectors, metadatas, ids) をベクトルストアへ追加する
+    """
+    for texts, vectors, metadatas, ids in batches:
+        vs.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+
+def stream_documents_to_vectorstore(
+    docs, target: str, owner_key: str, progress: Optional[dict] = None, index_spec: Optional[str] = None
+) -> tuple:
+    """
+    Document のイテラブル（iter_*_documents のジェネレータ）を EXTRACT_BATCH_SIZE 件ずつ
+    チャンク分割 → 埋め込み → ベクトルストアへの追加 の順に処理し、新しい FAISS ベクトルストアを生成する。
+      - 1件の人材/事例のチャンクは同じバッチに入るため、docstore ID の連番はバッチごとに採番してよい
+      - 学習が不要なインデックス種別 (Flat / HNSW) は最初のバッチでインデックスを作成し、以降のバッチは埋め込み次第追加する
+      - 学習が必要な種別 (量子化 / PCA / IVF) は全件のベクトルで学習するため、インデックスの作成まで埋め込み済みのベクトルを保持し、
+        作成後に圧縮前 (Flat) と比べたメモリ削減量と再現率を計測する（modules.mdlIndexSpec.evaluate_compression）
+    progress の rows_extracted は DB から読み込んだ件数分だけ加算する。
+    戻り値: (ベクトルストア, manifest に記録する情報 {"documents": 追加した Document の件数, "compression": 評価結果})。
+    Document が無い場合は ValueError
+    """
+    vs = None
+    pending: list[tuple] = []
+    extracted, documents = 0, 0
+    deferred = requires_training(index_spec)
+    for page in iter_pages(docs, extract_batch_size()):
+        extracted += len(page)
+        update_progress(progress, rows_extracted=extracted)
+        # テキスト分割（長いテキストへの対応。<対象>_CHUNK_SIZE が指定された場合のみ）
+        chunks = split_documents(page, target)
+        if not chunks:
+            continue
+        texts = [doc.page_content for doc in chunks]
+        vectors = embed_texts_batched(texts, get_base_embeddings(), checkpoint_dir_for(target), progress)
+        pending.append((texts, vectors, [doc.metadata for doc in chunks], make_document_ids(chunks, owner_key)))
+        documents += len(chunks)
+        if not deferred:
+            if vs is None:
+                vs = new_vectorstore(index_spec, np.array(vectors, dtype="float32"))
+            add_embedded_batches(vs, pending)
+            pending = []
+
+    info = {"documents": documents}
+    if pending:
+        vectors = np.array([vector for _, batch_vectors, _, _ in pending for vector in batch_vectors], dtype="float32")
+        vs = new_vectorstore(index_spec, vectors)
+        add_embedded_batches(vs, pending)
+        info["compression"] = evaluate_compression(vs.index, vectors)
+        print(f"[vectorstore.py] {target}: インデックス仕様 '{index_spec}' の圧縮前 (Flat) との比較: {info['compression']}")
+    if vs is None:
+        raise ValueError(f"{target} のベクトル化の対象となる Document がありません")
+    return vs, info
+
+def load_vectorstore(base_dir: str, writable: bool = False):
+    """
+    manifest が指す現在のバージョンのインデックスを読み込む。インデックスが無い場合は None
+    writable=True の場合は読み込みモードに関わらずヒープへ読み込む（差分更新でインデックスを変更する場合）
+    """
+    version = current_version(base_dir)
+    index_dir = version_dir(base_dir, version) if version is not None else None
+    if index_dir is None or not os.path.exists(index_dir):
+        return None
+    # 別の埋め込みモデルで作成されたインデックスはクエリのベクトルと比較できないため読み込まない
+    base_embeddings = get_base_embeddings()
+    indexed_model = version_info(base_dir).get("embedding_model")
+    current_model = embedding_model_name(base_embeddings)
+    if indexed_model is not None and indexed_model != current_model:
+        raise ValueError(f"インデックスの埋め込みモデル '{indexed_model}' が現在の設定 '{current_model}' と異なります")
+    vs = open_vectorstore(index_dir, writable)
+    # manifest に埋め込みモデルの記録が無いインデックス（旧形式など）も、次元数が異なる場合は読み込まない
+    dimension = embedding_dimension(base_embeddings)
+    if dimension is not None and vs.index.d != dimension:
+        raise ValueError(
+            f"インデックスの次元数 {vs.index.d} が現在の埋め込み '{current_model}' の次元数 {dimension} と異なります"
+        )
+    apply_search_params(vs.index, indexed_spec(base_dir))
+    _index_version_cache[vs] = version
+    return vs
+
+def version_info(base_dir: str) -> dict:
+    """
+    manifest に記録された現在のバージョンの情報（作成日時・件数・インデックス仕様・埋め込みモデルなど）を返す
+    """
+    manifest = read_manifest(base_dir) or {}
+    return manifest.get("versions", {}).get(current_version(base_dir)) or {}
+
+def indexed_spec(base_dir: str) -> Optional[str]:
+    """
+    現在のバージョンの作成時に指定されたインデックス仕様を manifest から取得する（記録が無い場合は None）
+    """
+    return version_info(base_dir).get("index_spec")
+
+def resolve_index_spec(target: str, base_dir: str, index_spec: Optional[str] = None) -> str:
+    """
+    インデックス仕様を決定する: 引数 → 環境変数 (TALENT_INDEX_SPEC / CASE_INDEX_SPEC) → 現在のバージョン → 既定値 (Flat)
+    """
+    return index_spec or os.getenv(f"{target.upper()}_INDEX_SPEC") or indexed_spec(base_dir) or DEFAULT_INDEX_SPEC
+
+def load_mode() -> str:
+    mode = (os.getenv("VECTORSTORE_LOAD_MODE") or DEFAULT_LOAD_MODE).lower()
+    return mode if mode in ("memory", "mmap") else DEFAULT_LOAD_MODE
+
+def read_faiss_index(path: str, writable: bool = False):
+    """
+    index.faiss を読み込む。読み込みモードが mmap の場合は読み取り専用で mmap する。
+    ※ IVF 系は転置リストが mmap される。Flat 系のベクトル本体は IO_FLAG_MMAP_IFC (faiss 1.11 以降) がある場合のみ mmap される
+    """
+    if writable or load_mode() != "mmap":
+        return faiss.read_index(path)
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return faiss.read_index(path, flags)
+
+def open_vectorstore(index_dir: str, writable: bool = False):
+    """
+    インデックスディレクトリを開く。
+      - mmap 形式の docstore がある場合: Document は検索でヒットした分だけ遅延デコードする
+      - 旧形式 (index.pkl) の場合: pickle から全 Document を読み込む
+    """
+    index = read_faiss_index(os.path.join(index_dir, "index.faiss"), writable)
+    if has_mmap_docstore(index_dir):
+        docstore = MmapDocstore(index_dir)
+        index_to_docstore_id = {row: doc_id for row, doc_id in enumerate(docstore.ids)}
+    else:
+        # FAISS.load_local と同じ形式の index.pkl (リポジトリ内で生成したファイルのみを読み込む)
+        with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    vs = FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
+    if has_lexical_index(index_dir):
+        with _lexical_lock:
+            _lexical_cache[vs] = LexicalIndex.load(index_dir)
+    return vs
+
+def memory_report(index_dir: str) -> dict:
+    """
+    インデックスディレクトリ内のファイルについて、このプロセスで mmap されている分の常駐バイト数 (RSS / PSS) と、
+    mmap されずヒープに読み込まれている index.faiss の推定バイト数を返す。
+    PSS は同じファイルをマップしている他のワーカーと按分した値で、インスタンス全体のメモリ見積もりに使う。
+    """
+    report = {"index_dir": index_dir, "mapped_files": {}, "mapped_rss_bytes": 0, "mapped_pss_bytes": 0, "heap_bytes_estimate": 0}
+    directory = os.path.abspath(index_dir)
+    path = None
     try:
-        # m_talent と関連テーブルをまとめて取得
-        talents = (
-            session.query(m_talent)
-            .options(
-                joinedload(m_talent.careers),
-                joinedload(m_talent.mindsets),
-                joinedload(m_talent.supportareas),
-                joinedload(m_talent.jobs).joinedload(talent_job.job),
-                # 追加: talent_hashtag -> m_hashtag をロード
-                joinedload(m_talent.hashtags).joinedload(talent_hashtag.hashtag)
-            )
-            .filter(m_talent.is_visible == True)
-            .order_by(asc(m_talent.display_order))
-            .all()
+        with open("/proc/self/smaps", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if "-" in fields[0] and len(fields) >= 5:
+                    # マッピングのヘッダ行 (アドレス 権限 オフセット デバイス inode [パス])
+                    path = fields[5] if len(fields) >= 6 and os.path.dirname(fields[5]) == directory else None
+                elif path and fields[0] in ("Rss:", "Pss:"):
+                    size = int(fields[1]) * 1024
+                    key = "mapped_rss_bytes" if fields[0] == "Rss:" else "mapped_pss_bytes"
+                    report[key] += size
+                    name = os.path.basename(path)
+                    report["mapped_files"].setdefault(name, {"rss_bytes": 0, "pss_bytes": 0})
+                    report["mapped_files"][name][key.replace("mapped_", "")] += size
+    except OSError:
+        # /proc が無い環境（Linux 以外）では mmap 分は計測しない
+        report["mapped_files"] = None
+
+    index_path = os.path.join(index_dir, "index.faiss")
+    if report["mapped_files"] is not None and "index.faiss" not in report["mapped_files"] and os.path.exists(index_path):
+        report["heap_bytes_estimate"] = os.path.getsize(index_path)
+    return report
+
+def save_vectorstore(vs, index_dir: str) -> None:
+    """
+    FAISS インデックス (index.faiss)、mmap 形式の docstore、語彙インデックスを保存する（pickle は使用しない）
+    語彙インデックスは差分更新後の行番号と一致させるため、保存のたびに作り直す。
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    faiss.write_index(vs.index, os.path.join(index_dir, "index.faiss"))
+    save_docstore(index_dir, vs.docstore, vs.index_to_docstore_id)
+    build_lexical_index(vs).save(index_dir)
+
+def validate_vectorstore(index_dir: str, expected_vectors: int) -> None:
+    """
+    保存したインデックスを読み直し、件数の一致と検索できることを確認する。問題があれば例外を送出する
+    """
+    loaded = open_vectorstore(index_dir, writable=True)
+    if expected_vectors <= 0:
+        raise ValueError("インデックスが空です")
+    if loaded.index.ntotal != expected_vectors or len(loaded.index_to_docstore_id) != expected_vectors:
+        raise ValueError(
+            f"件数が一致しません (index: {loaded.index.ntotal}, docstore: {len(loaded.index_to_docstore_id)}, expected: {expected_vectors})"
         )
+    # 先頭ベクトル自身で検索し、Document が取得できることを確認
+    vector = probe_vector(loaded.index)
+    hits = loaded.similarity_search_with_score_by_vector(vector.tolist(), k=1)
+    if not hits:
+        raise ValueError("検証用の検索で結果が得られませんでした")
+
+def publish_vectorstore(vs, base_dir: str, info: dict) -> str:
+    """
+    ベクトルストアを新しいバージョンのディレクトリへ保存・検証し、manifest の current を切り替える。
+    検証に失敗した場合は新しいディレクトリを削除して例外を送出する（現在のバージョンはそのまま）。
+    """
+    version, index_dir = new_version_dir(base_dir)
+    try:
+        save_vectorstore(vs, index_dir)
+        validate_vectorstore(index_dir, vs.index.ntotal)
+    except Exception:
+        discard_version(base_dir, version)
+        raise
+
+    info = {
+        "created_at": datetime.now(ZoneInfo("Asia/Tokyo")).strftime("%Y-%m-%d %H:%M:%S"),
+        "vectors": vs.index.ntotal,
+        "embedding_model": embedding_model_name(get_base_embeddings()),
+        **info,
+    }
+    publish_version(base_dir, version, info)
+    _index_version_cache[vs] = version
+    return version
+
+def bullet_section(values: list) -> str:
+    """
+    「- 値」の箇条書きを生成する。値が無い場合は「なし」
+    """
+    lines = [f"- {value}\n" for value in values]
+    return "".join(lines) if lines else "なし\n"
+
+def chunk_size(target: str) -> int:
+    """
+    チャンク分割の文字数（環境変数 TALENT_CHUNK_SIZE / CASE_CHUNK_SIZE）。0 の場合は分割しない
+    """
+    return max(0, int(os.getenv(f"{target.upper()}_CHUNK_SIZE") or 0))
+
+def split_documents(docs: list[Document], target: str) -> list[Document]:
+    """
+    チャンク分割が有効な場合、chunk_size を超える Document を見出し（【】）の区切りを優先してチャンクに分割する。
+      - 各チャンクの先頭には【ID】と名前/事例名を付け、チャンク単体でも誰の情報か分かるようにする
+      - metadata は元の Document と同じ（所有者IDでまとめて検索し、content_hash で差分更新を判定する）
+      - 1件あたり MAX_CHUNKS_PER_DOCUMENT を超えるチャンクは埋め込まない（埋め込みのコストを件数あたり一定に抑える）
+    """
+    size = chunk_size(target)
+    if size <= 0:
+        return docs
+    overlap = min(int(os.getenv("CHUNK_OVERLAP") or DEFAULT_CHUNK_OVERLAP), size // 2)
+    max_chunks = int(os.getenv("MAX_CHUNKS_PER_DOCUMENT") or DEFAULT_MAX_CHUNKS)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=size, chunk_overlap=overlap, separators=["\n\n【", "\n\n", "\n", "。", ""]
+    )
+
+    chunks = []
+    truncated = 0
+    for doc in docs:
+        if len(doc.page_content) <= size:
+            chunks.append(doc)
+            continue
+        header = "\n\n".join(doc.page_content.split("\n\n")[:2])
+        # 見出しだけのチャンク（次の節が長く結合できなかった場合）は埋め込まない
+        texts = [text for text in splitter.split_text(doc.page_content) if text != header]
+        if max_chunks > 0 and len(texts) > max_chunks:
+            texts = texts[:max_chunks]
+            truncated += 1
+        for text in texts:
+            if not text.startswith(header):
+                text = f"{header}\n\n{text}"
+            chunks.append(Document(page_content=text, metadata=dict(doc.metadata)))
+    print(f"[vectorstore.py] {target}: {len(docs)} 件を {len(chunks)} チャンクに分割しました (chunk_size={size}, overlap={overlap})")
+    if truncated:
+        print(f"[vectorstore.py] {target}: {truncated} 件はチャンク数が上限 ({max_chunks}) を超えたため、超過分を埋め込みませんでした")
+    return chunks
+
+def iter_visible_rows(session, model, id_column, options: tuple = ()):
+    """
+    is_visible の行を display_order 順に EXTRACT_BATCH_SIZE 件ずつ読み込み、1行ずつ返すジェネレータ。
+      - 先に表示対象の ID だけを取得し、ID のページごとに本体を読み込む
+      - 関連テーブルは options の selectinload で、コレクションごとに1回の IN 検索でまとめて読み込む
+        （joinedload のように 行 × 各コレクションの件数 の直積を読み込まない。DB の往復はページあたり 1 + コレクション数）
+      - 読み込んだページは処理後に Session から切り離し、保持する ORM オブジェクトを1ページ分に抑える
+    ※ yield_per（サーバーサイドカーソル）は読み込みの途中で selectinload の追加クエリを同じ接続で発行できない
+      ドライバ (PyMySQL の SSCursor など) があるため使用しない
+    """
+    ids = [row[0] for row in session.query(id_column).filter(model.is_visible == True).order_by(asc(model.display_order))]
+    for page_ids in iter_pages(ids, extract_batch_size()):
+        rows = session.query(model).options(*options).filter(id_column.in_(page_ids)).all()
+        by_id = {getattr(row, id_column.key): row for row in rows}
+        for row_id in page_ids:
+            # ID の取得後に削除された行は読み飛ばす
+            if row_id in by_id:
+                yield by_id[row_id]
+        session.expunge_all()
+
+def iter_talent_documents(session):
+    """
+    m_talent と関連テーブル（経歴、マインドセット、支援領域、職種情報）から Document を1件ずつ生成するジェネレータ。
+    metadata には検索結果としてそのまま返せる各項目（name, summary, career など）と、
+    差分更新に利用する talent_id・本文のハッシュ(content_hash)を保持する。
+    """
+    # 関連テーブルはコレクションごとにページ単位でまとめて取得
+    # （ハッシュタグは本文に含めていないため読み込まない。本文に戻す場合は selectinload(m_talent.hashtags) を追加する）
+    talents = iter_visible_rows(
+        session, m_talent, m_talent.talent_id,
+        (
+            selectinload(m_talent.careers),
+            selectinload(m_talent.mindsets),
+            selectinload(m_talent.supportareas),
+            selectinload(m_talent.jobs).selectinload(talent_job.job),
+        ),
+    )
+
+    for talent in talents:
+        # 各セクションの本文（page_content と metadata の両方で利用する）
+        careers = bullet_section([career.career_description for career in talent.careers])
+        mindsets = bullet_section([mindset.mindset_description for mindset in talent.mindsets])
+        supportareas = bullet_section([supportarea.supportarea_detail for supportarea in talent.supportareas])
+        # 保有職種 (talent_job 経由で m_job.job_name を取得)
+        jobs = bullet_section([tjob.job.job_name for tjob in talent.jobs if tjob.job])
 
-        docs = []
-        for talent in talents:
-            content = f"""\
+        content = f"""\
 
 【ID】
 {talent.talent_id}
@@ -110,125 +975,52 @@ def create_talent_vectorstore(force_recreate: bool = False):
 【業界情報】
 {talent.industry}
 """
-            # 経歴
-            content += "\n【経歴】\n"
-            if talent.careers:
-                career_lines = [f"- {career.career_description}\n" for career in talent.careers ]
-                if career_lines:
-                    content += "".join(career_lines)
-                else:
-                    content += "なし\n"
-            else:
-                content += "なし\n"
-
-            # マインドセット
-            content += "\n【マインドセット】\n"
-            if talent.mindsets:
-                mindset_lines = [f"- {mindset.mindset_description}\n" for mindset in talent.mindsets ]
-                if mindset_lines:
-                    content += "".join(mindset_lines)
-                else:
-                    content += "なし\n"
-            else:
-                content += "なし\n"
-
-            # 支援領域
-            content += "\n【支援領域】\n"
-            if talent.supportareas:
-                supportarea_lines = [f"- {supportarea.supportarea_detail}\n" for supportarea in talent.supportareas ]
-                if supportarea_lines:
-                    content += "".join(supportarea_lines)
-                else:
-                    content += "なし\n"
-            else:
-                content += "なし\n"
-
-            # 保有職種 (talent_job 経由で m_job.job_name を取得)
-            content += "\n【保有職種】\n"
-            if talent.jobs:
-                job_lines = [f"- {tjob.job.job_name}\n" for tjob in talent.jobs if tjob.job]
-                if job_lines:
-                    content += "".join(job_lines)
-                else:
-                    content += "なし\n"
-            else:
-                content += "なし\n"
-
-            # ハッシュタグ (talent_hashtag 経由で m_hashtag.hashtag_name を取得)
-            # content += "\n【ハッシュタグ】\n"
-            # if talent.hashtags:
-            #     hashtag_lines = [f"- {th.hashtag.hashtag_name}\n" for th in talent.hashtags if th.hashtag]
-            #     if hashtag_lines:
-            #         content += "".join(hashtag_lines)
-            #     else:
-            #         content += "なし\n"
-            # else:
-            #     content += "なし\n"
-
-            docs.append(Document(page_content=content.strip()))
-
-        # テキスト分割（長いテキストへの対応）
-        # text_splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=150)
-        # split_docs = text_splitter.split_documents(docs)
-
-        # テスト(テキスト分割を割愛)
-        split_docs = docs
-
-        if DO_GPT == "TRUE":
-            embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-            talent_vectorstore = FAISS.from_documents(split_docs, embeddings)
-            # 生成したインデックスをディスクに保存
-            talent_vectorstore.save_local(index_dir)
-            print(f"[vectorstore.py] 新規に talent_vectorstore を生成し、ディスクに保存しました (ディレクトリ: '{index_dir}')。 件数: {len(split_docs)}")
-            return talent_vectorstore
-        else:
-            print("[vectorstore.py] DO_GPT が TRUE ではないため、OpenAI API を使用したベクトルストア生成をスキップしました。")
-            return None
-    except Exception as e:
-        print("talent_vectorstore 生成時にエラーが発生しました:", e)
-        traceback.print_exc()
-        return None
-    finally:
-        session.close()
-
-def create_case_vectorstore(force_recreate: bool = False):
-    """
-    m_case テーブルの主要フィールドから FAISS インデックスを生成する関数。
-    """
-    index_dir = "rag/case_vectorstore_index"
-    DO_GPT = os.getenv("DO_GPT")
-    OPENAI_API_KEY = os.getenv("OPEN_AI_API_KEY")
-
-    # 強制再生成
-    if force_recreate and os.path.exists(index_dir):
-        shutil.rmtree(index_dir)
-        print(f"[vectorstore.py] force_recreate=True のため、'{index_dir}' を削除しました。")
+        # 経歴
+        content += "\n【経歴】\n" + careers
+        # マインドセット
+        content += "\n【マインドセット】\n" + mindsets
+        # 支援領域
+        content += "\n【支援領域】\n" + supportareas
+        # 保有職種
+        content += "\n【保有職種】\n" + jobs
 
-    # 既存インデックスのロード
-    if os.path.exists(index_dir):
-        try:
-            embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-            vs = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
-            print(f"[vectorstore.py] ディスクから case_vectorstore をロードしました (ディレクトリ: '{index_dir}')")
-            return vs
-        except Exception as e:
-            print("case_vectorstore ロード時エラー:", e)
-            traceback.print_exc()
+        # ハッシュタグ (talent_hashtag 経由で m_hashtag.hashtag_name を取得)
+        # content += "\n【ハッシュタグ】\n"
+        # if talent.hashtags:
+        #     hashtag_lines = [f"- {th.hashtag.hashtag_name}\n" for th in talent.hashtags if th.hashtag]
+        #     if hashtag_lines:
+        #         content += "".join(hashtag_lines)
+        #     else:
+        #         content += "なし\n"
+        # else:
+        #     content += "なし\n"
 
-    # 新規生成
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    try:
-        cases = (
-            session.query(m_case)
-            .filter(m_case.is_visible == True)
-            .order_by(asc(m_case.display_order))
-            .all()
+        content = content.strip()
+        yield Document(
+            page_content=content,
+            metadata={
+                "talent_id": talent.talent_id,
+                "name": f"{talent.name}".strip(),
+                "summary": f"{talent.summary}".strip(),
+                "industry": f"{talent.industry}".strip(),
+                "career": careers.strip(),
+                "mindset": mindsets.strip(),
+                "supportarea": supportareas.strip(),
+                "job": jobs.strip(),
+                "content_hash": content_hash(content),
+            },
         )
 
-        docs: list[Document] = []
-        for c in cases:
-            content = f"""
+def iter_case_documents(session):
+    """
+    m_case テーブルの主要フィールドから Document を1件ずつ生成するジェネレータ。
+    metadata には検索結果としてそのまま返せる各項目（title, summary など）と、
+    差分更新に利用する case_id・本文のハッシュ(content_hash)を保持する。
+    """
+    cases = iter_visible_rows(session, m_case, m_case.case_id)
+
+    for c in cases:
+        content = f"""
 【ID】
 {c.case_id}
 
@@ -250,21 +1042,108 @@ def create_case_vectorstore(force_recreate: bool = False):
 【解決方法】
 {c.solution_method}
 """.strip()
-            docs.append(Document(page_content=content))
-
-        # 必要に応じてテキスト分割
-        # splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=150)
-        # split_docs = splitter.split_documents(docs)
-        split_docs = docs
-
-        if DO_GPT == "TRUE":
-            embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-            vs = FAISS.from_documents(split_docs, embeddings)
-            vs.save_local(index_dir)
-            print(f"[vectorstore.py] 新規に case_vectorstore を生成し、保存しました: {index_dir} (件数: {len(split_docs)})")
+        yield Document(
+            page_content=content,
+            metadata={
+                "case_id": c.case_id,
+                "title": f"{c.case_name}".strip(),
+                "summary": f"{c.case_summary}".strip(),
+                "company_summary": f"{c.company_summary}".strip(),
+                "initiative_summary": f"{c.initiative_summary}".strip(),
+                "issue_background": f"{c.issue_background}".strip(),
+                "solution_method": f"{c.solution_method}".strip(),
+                "content_hash": content_hash(content),
+            },
+        )
+
+def create_talent_vectorstore(force_recreate: bool = False, progress: Optional[dict] = None, index_spec: Optional[str] = None):
+    """
+    m_talentテーブルを中心に、関連テーブルの情報（経歴、マインドセット、支援領域、職種情報）を取得し、
+    Document化、テキスト分割を行った後、FAISS インデックスを生成する関数です。
+
+    パラメータ force_recreate が True の場合、既存のインデックスを読み込まずに再生成します。
+    再生成したインデックスは新しいバージョンとして保存し、検証後に manifest を切り替えます（既存のインデックスは削除しません）。
+    また、環境変数 DO_GPT が "TRUE" の場合のみ OpenAI API を利用してベクトル化を行います。
+    （EMBEDDING_PROVIDER=local の場合は DO_GPT に関わらずローカルの埋め込みでベクトル化します）
+    index_spec でインデックス種別（Flat / IVF / HNSW / PQ など）を指定でき、manifest に記録します。
+    """
+    base_dir = TALENT_INDEX_DIR
+
+    # インデックスが既に存在する場合はロードを試みる
+    if not force_recreate:
+        try:
+            talent_vectorstore = load_vectorstore(base_dir)
+            if talent_vectorstore is not None:
+                print(f"[vectorstore.py] ディスクから talent_vectorstore をロードしました (バージョン: '{current_version(base_dir)}')")
+                return talent_vectorstore
+        except Exception as e:
+            print("ディスクからの talent_vectorstore ロード時にエラーが発生しました:", e)
+            traceback.print_exc()
+            # ロードに失敗した場合は再生成を試みる
+
+    #  新規生成
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+    try:
+        if can_embed_documents():
+            index_spec = resolve_index_spec("talent", base_dir, index_spec)
+            # DB からの読み込み・テキスト分割・埋め込みを EXTRACT_BATCH_SIZE 件ずつ進める
+            talent_vectorstore, info = stream_documents_to_vectorstore(
+                iter_talent_documents(session), "talent", "talent_id", progress, index_spec
+            )
+            # 生成したインデックスを新しいバージョンとしてディスクに保存
+            version = publish_vectorstore(
+                talent_vectorstore, base_dir, {"mode": "full", **info, "index_spec": index_spec, "chunk_size": chunk_size("talent")}
+            )
+            clear_checkpoints(checkpoint_dir_for("talent"))
+            update_progress(progress, vectors_written=talent_vectorstore.index.ntotal)
+            print(f"[vectorstore.py] 新規に talent_vectorstore を生成し、ディスクに保存しました (バージョン: '{version}')。 件数: {info['documents']}")
+            return talent_vectorstore
+        else:
+            print("[vectorstore.py] DO_GPT が TRUE ではなく EMBEDDING_PROVIDER も local ではないため、ベクトルストア生成をスキップしました。")
+            return None
+    except Exception as e:
+        print("talent_vectorstore 生成時にエラーが発生しました:", e)
+        traceback.print_exc()
+        return None
+    finally:
+        session.close()
+
+def create_case_vectorstore(force_recreate: bool = False, progress: Optional[dict] = None, index_spec: Optional[str] = None):
+    """
+    m_case テーブルの主要フィールドから FAISS インデックスを生成する関数。
+    force_recreate が True の場合は既存インデックスを読み込まず、新しいバージョンとして再生成する。
+    index_spec でインデックス種別を指定できる（create_talent_vectorstore と同様）。
+    """
+    base_dir = CASE_INDEX_DIR
+
+    # 既存インデックスのロード
+    if not force_recreate:
+        try:
+            vs = load_vectorstore(base_dir)
+            if vs is not None:
+                print(f"[vectorstore.py] ディスクから case_vectorstore をロードしました (バージョン: '{current_version(base_dir)}')")
+                return vs
+        except Exception as e:
+            print("case_vectorstore ロード時エラー:", e)
+            traceback.print_exc()
+
+    # 新規生成
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+    try:
+        if can_embed_documents():
+            index_spec = resolve_index_spec("case", base_dir, index_spec)
+            vs, info = stream_documents_to_vectorstore(iter_case_documents(session), "case", "case_id", progress, index_spec)
+            version = publish_vectorstore(
+                vs, base_dir, {"mode": "full", **info, "index_spec": index_spec, "chunk_size": chunk_size("case")}
+            )
+            clear_checkpoints(checkpoint_dir_for("case"))
+            update_progress(progress, vectors_written=vs.index.ntotal)
+            print(f"[vectorstore.py] 新規に case_vectorstore を生成し、保存しました: バージョン '{version}' (件数: {info['documents']})")
             return vs
         else:
-            print("[vectorstore.py] DO_GPT!=TRUE のため、生成をスキップしました。")
+            print("[vectorstore.py] DO_GPT!=TRUE かつ EMBEDDING_PROVIDER!=local のため、生成をスキップしました。")
             return None
 
     except Exception as e:
@@ -272,4 +1151,141 @@ def create_case_vectorstore(force_recreate: bool = False):
         traceback.print_exc()
         return None
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+def sync_talent_vectorstore(progress: Optional[dict] = None) -> tuple[int, str]:
+    """
+    m_talent とインデックスの差分のみを talent_vectorstore に反映する
+    """
+    return _sync_vectorstore("talent", TALENT_INDEX_DIR, "talent_id", iter_talent_documents, create_talent_vectorstore, progress)
+
+def sync_case_vectorstore(progress: Optional[dict] = None) -> tuple[int, str]:
+    """
+    m_case とインデックスの差分のみを case_vectorstore に反映する
+    """
+    return _sync_vectorstore("case", CASE_INDEX_DIR, "case_id", iter_case_documents, create_case_vectorstore, progress)
+
+def _sync_vectorstore(
+    target: str, base_dir: str, owner_key: str, iter_documents, create_vectorstore, progress: Optional[dict] = None
+) -> tuple[int, str]:
+    """
+    DB の現在の内容とインデックスを 所有者ID + content_hash で比較し、
+    追加・更新・削除があった Document だけを再ベクトル化してインデックスへ反映、新しいバージョンとして保存する。
+      - インデックスが存在しない場合・埋め込みモデルやチャンク分割の設定が異なる場合は全件生成にフォールバックする
+      - 本文が同じで metadata だけが異なる場合（旧形式のインデックスなど）は、ベクトルはそのままで docstore の Document のみ差し替える
+      - 削除に対応しないインデックス種別 (IVF / HNSW) で削除・更新がある場合は、同じ種別で全件生成にフォールバックする
+      - 稼働中のベクトルストアは直接変更せず、ディスクから読み込んだ複製に反映・検証してから差し替える
+    ※ 呼び出し元 (createVectorstore) で対象のロックを取得していること
+    """
+    attr = f"{target}_vectorstore"
+
+    rebuild_reason = None
+    indexed_model = version_info(base_dir).get("embedding_model")
+    if current_index_dir(base_dir) is None:
+        rebuild_reason = f"'{base_dir}' にインデックスが存在しない"
+    elif indexed_model is not None and indexed_model != embedding_model_name(get_base_embeddings()):
+        rebuild_reason = f"インデックスの埋め込みモデル '{indexed_model}' が現在の設定と異なる"
+    elif version_info(base_dir).get("chunk_size", 0) != chunk_size(target):
+        rebuild_reason = f"インデックスのチャンク分割 (chunk_size={version_info(base_dir).get('chunk_size', 0)}) が現在の設定と異なる"
+    if rebuild_reason:
+        print(f"[vectorstore.py] {rebuild_reason}ため、{attr} を全件生成します。")
+        vs = create_vectorstore(true, progress)
+        if vs is None:
+            return 500, json.dumps({"message": f"{attr} creation failed."}, ensure_ascii=False)
+        set_vectorstore(target, vs)
+        return 200, json.dumps({"message": f"{attr} created successfully.", "mode": "full"}, ensure_ascii=False)
+
+    Session = sessionmaker(bind=get_engine())
+    session = Session()
+    try:
+        vs = load_vectorstore(base_dir, writable=True)
+        indexed, orphans = indexed_owner_map(vs, owner_key)
+
+        # 差分の判定（DB の Document は EXTRACT_BATCH_SIZE 件ずつ読み込んで比較し、差分のあった Document だけを保持する）
+        ids_to_delete = list(orphans)
+        docs_to_add: list[Document] = []
+        docs_to_refresh: dict[str, Document] = {}
+        seen = set()
+        added, updated, deleted, unchanged = 0, 0, 0, 0
+        extracted, documents = 0, 0
+        for page in iter_pages(iter_documents(session), extract_batch_size()):
+            extracted += len(page)
+            update_progress(progress, rows_extracted=extracted)
+            chunks = split_documents(page, target)
+            documents += len(chunks)
+            current = {}
+            for doc in chunks:
+                current.setdefault(doc.metadata[owner_key], []).append(doc)
+            for owner, owner_docs in current.items():
+                seen.add(owner)
+                entry = indexed.get(owner)
+                if entry is None:
+                    docs_to_add += owner_docs
+                    added += 1
+                elif owner_docs[0].metadata["content_hash"] != entry["hash"]:
+                    ids_to_delete += entry["ids"]
+                    docs_to_add += owner_docs
+                    updated += 1
+                else:
+                    if owner_docs[0].metadata != entry["metadata"] and len(owner_docs) == len(entry["ids"]):
+                        docs_to_refresh.update(zip(entry["ids"], owner_docs))
+                    unchanged += 1
+        for owner, entry in indexed.items():
+            if owner not in seen:
+                ids_to_delete += entry["ids"]
+                deleted += 1
+
+        if docs_to_add and not can_embed_documents():
+            print("[vectorstore.py] DO_GPT が TRUE ではなく EMBEDDING_PROVIDER も local ではないため、差分のベクトル化をスキップしました。")
+            return 500, json.dumps({"message": f"{attr} sync skipped (DO_GPT is not TRUE)."}, ensure_ascii=False)
+
+        index_spec = indexed_spec(base_dir) or DEFAULT_INDEX_SPEC
+        if ids_to_delete and not supports_delete(index_spec):
+            print(f"[vectorstore.py] インデックス種別 '{index_spec}' は削除に対応しないため、{attr} を全件生成します。")
+            vs = create_vectorstore(true, progress, index_spec)
+            if vs is None:
+                return 500, json.dumps({"message": f"{attr} creation failed."}, ensure_ascii=False)
+            set_vectorstore(target, vs)
+            result = {"message": f"{attr} created successfully.", "mode": "full", "version": current_version(base_dir)}
+            return 200, json.dumps(result, ensure_ascii=False)
+
+        # 差分の反映（削除 → 追加の順）
+        if ids_to_delete:
+            vs.delete(ids_to_delete)
+        if docs_to_add:
+            embed_documents_to_vectorstore(docs_to_add, make_document_ids(docs_to_add, owner_key), target, progress, vs)
+        if docs_to_refresh:
+            # FAISS の行と docstore ID の対応は変えずに、Document (metadata) のみ差し替える
+            vs.docstore.delete(list(docs_to_refresh))
+            vs.docstore.add(docs_to_refresh)
+        version = current_version(base_dir)
+        if ids_to_delete or docs_to_add or docs_to_refresh:
+            info = {"mode": "sync", "documents": documents, "index_spec": index_spec, "chunk_size": chunk_size(target)}
+            # 圧縮の評価は全件生成時の計測値を引き継ぐ（差分更新ではインデックスを学習し直さない）
+            if version_info(base_dir).get("compression"):
+                info["compression"] = version_info(base_dir)["compression"]
+            version = publish_vectorstore(vs, base_dir, info)
+            clear_checkpoints(checkpoint_dir_for(target))
+            update_progress(progress, vectors_written=vs.index.ntotal)
+            set_vectorstore(target, vs)
+
+        result = {
+            "message": f"{attr} synced successfully.",
+            "mode": "sync",
+            "added": added,
+            "updated": updated,
+            "deleted": deleted,
+            "unchanged": unchanged,
+            "metadata_refreshed": len(docs_to_refresh),
+            "embedded_documents": len(docs_to_add),
+            "total_vectors": vs.index.ntotal,
+            "version": version,
+        }
+        print(f"[vectorstore.py] {attr} を差分更新しました: {result}")
+        return 200, json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        print(f"{attr} 差分更新時にエラーが発生しました:", e)
+        traceback.print_exc()
+        return 500, json.dumps({"message": f"{attr} sync failed.", "details": str(e)}, ensure_ascii=False)
+    finally:
+        session.close()
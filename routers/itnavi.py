@@ -1,10 +1,13 @@
 from fastapi import FastAPI,HTTPException,APIRouter,Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from db_control import crud, mymodels
-from models.params import caseSearchData, dxAdviceData, setCaseData, userEntryData, userData, strategyData, talentSearchData, setTalentData
+from models.params import caseSearchData, dxAdviceData, setCaseData, userEntryData, userData, strategyData, talentSearchData, setTalentData, talentBatchSearchData
 import json
-from modules import mdlCommon, mdlSearchCase, mdlUserAction, mdlStrategy, mdlTalent, mdlVectorstore,mdlDxAdvice
+from typing import Optional
+from modules import mdlCommon, mdlSearchCase, mdlUserAction, mdlStrategy, mdlTalent, mdlDxAdvice,mdlIndexJob,mdlIndexLoader,mdlDocumentJob,mdlEmbeddingCache
+# mdlVectorstore / mdlAffinity / mdlRecommend は langchain・faiss を読み込むため、利用するエンドポイントの中で import する
+# （起動時間を短くし、DB のみを使うエンドポイントではこれらを読み込まない）
 
 router = APIRouter()
 
@@ -54,6 +57,20 @@ def select_case_detail(search_id: int, search_id_sub: int):
     status, result = mdlSearchCase.getCaseDetail(search_id, search_id_sub)
     return JSONResponse(content=json.loads(result), status_code=status)
 
+@router.get("/similarCases")
+def select_similar_cases(case_id: Optional[int] = None, talent_id: Optional[int] = None, cnt: int = 4):
+    # 事例または人材に近い事例を取得（格納済みのベクトルを利用し、埋め込み API は呼び出さない）
+    from modules import mdlRecommend
+    status, result = mdlRecommend.getSimilarCases(case_id, talent_id, cnt)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/similarTalents")
+def select_similar_talents(case_id: Optional[int] = None, talent_id: Optional[int] = None, cnt: int = 4):
+    # 事例または人材に近い人材を取得（格納済みのベクトルを利用し、埋め込み API は呼び出さない）
+    from modules import mdlRecommend
+    status, result = mdlRecommend.getSimilarTalents(case_id, talent_id, cnt)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
 @router.get("/job")
 def get_job():
     # 職種情報の取得
@@ -92,15 +109,42 @@ def create_agent_support(data:userData):
     return JSONResponse(content=json.loads(result), status_code=status)
 
 @router.post("/strategy")
-def create_strategy(data:userData):
+def create_strategy(data:userData, wait: bool = False, regenerate: bool = False):
     # 戦略文書を作成
-    status, result = mdlStrategy.createDoc(data)
+    # 通常は作成ジョブを登録して job_id を返す（状態は GET /strategy?job_id=... で確認）。wait=true の場合は作成まで待ち document_id を返す
+    # 同じ業界・企業規模・部署・テーマ・事例の戦略文書は生成結果のキャッシュから作成する。regenerate=true の場合は GPT で生成し直す
+    if wait:
+        status, result = mdlStrategy.createDoc(data, regenerate)
+    else:
+        status, result = mdlDocumentJob.submitDoc(data, regenerate)
     return JSONResponse(content=json.loads(result), status_code=status)
 
+@router.post("/strategy/stream")
+def create_strategy_stream(data:userData, request: Request, regenerate: bool = False):
+    # 戦略文書を作成し、生成中の本文を Server-Sent Events で返す（完了時に document_id を返す）
+    # クライアントが切断した場合は GPT のストリームを閉じて生成を中断する（t_document には登録しない）
+    status, result = mdlStrategy.buildStrategyPrompt(data)
+    if status != 200:
+        return JSONResponse(content=json.loads(result), status_code=status)
+    return StreamingResponse(
+        mdlStrategy.stream_until_disconnected(request, mdlStrategy.streamDoc(data, result, regenerate)), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/strategy")
-def select_strategy(search_id: int, search_id_sub: int, document_id: int):
+def select_strategy(search_id: int, search_id_sub: int, document_id: Optional[int] = None, job_id: Optional[int] = None):
     # 戦略文書を取得
-    status, result = mdlStrategy.getDoc(search_id, search_id_sub, document_id)
+    # job_id を指定した場合は作成ジョブの状態 (pending / running / ready / failed) を返す（ready の場合は戦略文書も返す）
+    if job_id is not None:
+        status, result = mdlDocumentJob.getDocJob(search_id, search_id_sub, job_id)
+    else:
+        status, result = mdlStrategy.getDoc(search_id, search_id_sub, document_id)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/strategyCacheStats")
+def get_strategy_cache_stats():
+    # 戦略文書の生成結果キャッシュのヒット/ミス件数を取得
+    status, result = mdlStrategy.getStrategyCacheStats()
     return JSONResponse(content=json.loads(result), status_code=status)
 
 @router.post("/strategy/dl")
@@ -110,9 +154,50 @@ def create_strategy(data:strategyData):
     return JSONResponse(content=json.loads(result), status_code=status)
 
 @router.post("/createVecrorstore{target}")
-def create_vector_store(target:str):
-    # FAISSインデックスの再作成
-    status, result = mdlVectorstore.createVectorstore(target)
+def create_vector_store(target:str, mode: str = "full", wait: bool = False, index_spec: Optional[str] = None):
+    # FAISSインデックスの再作成 (mode=sync の場合は差分のみ反映)
+    # 通常はバックグラウンドジョブとして登録し job_id を返す。wait=true の場合は完了まで待つ
+    # 同じ対象を別のワーカープロセスが再作成中の場合は 409（ジョブ情報はプロセスごとに保持し、/vectorstoreJob は受け付けたプロセスでのみ参照できる）
+    # index_spec でインデックス種別を指定できる (例: "HNSW32;efSearch=64", "IVF1024,Flat;nprobe=16")
+    # ベクトルの圧縮も index_spec で指定する (例: "SQfp16", "SQ8", "PQ64", "PCA256,SQ8")。評価結果は /vectorstoreMemory で確認できる
+    if wait:
+        from modules import mdlVectorstore
+        status, result = mdlVectorstore.createVectorstore(target, mode, index_spec=index_spec)
+    else:
+        status, result = mdlIndexJob.submitRebuild(target, mode, index_spec)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/vectorstoreJob")
+def get_vector_store_job(job_id: str):
+    # FAISSインデックス再作成ジョブの状態・進捗を取得
+    # ※ ジョブ情報はプロセス内のメモリに保持するため、複数のワーカープロセスではジョブを受け付けたプロセス以外は 404 を返す
+    status, result = mdlIndexJob.getRebuildJob(job_id)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/vectorstoreJobs")
+def get_vector_store_jobs():
+    # FAISSインデックス再作成ジョブの一覧を取得
+    status, result = mdlIndexJob.getRebuildJobs()
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.post("/rollbackVectorstore{target}")
+def rollback_vector_store(target:str):
+    # FAISSインデックスを直前のバージョンに戻す
+    from modules import mdlVectorstore
+    status, result = mdlVectorstore.rollbackVectorstore(target)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.post("/reloadVectorstore{target}")
+def reload_vector_store(target:str):
+    # FAISSインデックスをディスクから読み込み直す（起動時の読み込みに失敗した場合の復旧用）
+    status, result = mdlIndexLoader.reloadVectorstore(target)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/ready")
+def get_readiness():
+    # インデックスごとの準備状態 (pending / loading / ready / failed, バージョン, 件数) を取得
+    # すべて ready の場合は 200、それ以外は 503 (ロードバランサのヘルスチェック用)
+    status, result = mdlIndexLoader.getReadiness()
     return JSONResponse(content=json.loads(result), status_code=status)
 
 @router.get("/searchTalentByPrompt{prompt,cnt}")
@@ -121,6 +206,12 @@ def get_talent_by_prompt(prompt: str, cnt:int):
     status, result = mdlTalent.getTalentByPrompt(prompt,cnt)
     return JSONResponse(content=result, status_code=status)
 
+@router.post("/searchTalentByPrompts")
+def get_talent_by_prompts(data: talentBatchSearchData):
+    # 複数のプロンプトで人材情報を一括取得
+    status, result = mdlTalent.getTalentByPrompts(data)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
 @router.get("/industry")
 def get_industry():
     # 業界情報の取得
@@ -146,7 +237,57 @@ def get_theme():
     return JSONResponse(content=json.loads(result), status_code=status)
 
 @router.post("/dxAdvice")
-def create_strategy(data:dxAdviceData):
+def create_strategy(data:dxAdviceData, defer_advice: bool = False):
     # DXアドバイスを取得
-    status, result = mdlDxAdvice.getAdviceCase(data)
-    return JSONResponse(content=json.loads(result), status_code=status)
\ No newline at end of file
+    # defer_advice=true の場合はアドバイスの生成を待たずに search_id / search_id_sub / cases を返す
+    # （アドバイスは GET /dxAdvice または GET /dxAdvice/stream で取得する）
+    status, result = mdlDxAdvice.getAdviceCase(data, defer_advice)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/dxAdvice")
+def select_dx_advice(search_id: int, search_id_sub: int):
+    # defer_advice=true で生成中・生成済みのアドバイスを取得
+    status, result = mdlDxAdvice.getAdvice(search_id, search_id_sub)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/dxAdvice/stream")
+def select_dx_advice_stream(search_id: int, search_id_sub: int):
+    # defer_advice=true で生成中のアドバイスの本文を Server-Sent Events で返す（完了時にアドバイス・プロンプトを返す）
+    if mdlDxAdvice.find_advice(search_id, search_id_sub) is None:
+        return JSONResponse(content={"message": "advice not found"}, status_code=404)
+    return StreamingResponse(
+        mdlDxAdvice.streamAdvice(search_id, search_id_sub), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/dxAdviceCacheStats")
+def get_dx_advice_cache_stats():
+    # DXアドバイスの回答キャッシュのヒット/ミス件数（完全一致・類似一致）を取得
+    status, result = mdlDxAdvice.getAdviceCacheStats()
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.post("/clearDxAdviceCache")
+def clear_dx_advice_cache(timing: Optional[str] = None, domain: Optional[str] = None):
+    # DXアドバイスの回答キャッシュを削除（timing / domain を指定した場合はその組み合わせのみ）
+    status, result = mdlDxAdvice.clearAdviceCache(timing, domain)
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.post("/refreshAffinity")
+def refresh_affinity():
+    # 事例→人材の類似度事前計算を再実行
+    from modules import mdlAffinity
+    status, result = mdlAffinity.refreshAffinity()
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/vectorstoreMemory")
+def get_vectorstore_memory():
+    # インデックスごとの常駐バイト数を取得
+    from modules import mdlVectorstore
+    status, result = mdlVectorstore.getVectorstoreMemory()
+    return JSONResponse(content=json.loads(result), status_code=status)
+
+@router.get("/embeddingCacheStats")
+def get_embedding_cache_stats():
+    # クエリ埋め込みキャッシュのヒット/ミス件数を取得
+    status, result = mdlEmbeddingCache.getEmbeddingCacheStats()
+    return JSONResponse(content=json.loads(result), status_code=status)
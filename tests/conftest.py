@@ -0,0 +1,41 @@
+# テスト共通の設定
+#
+# DB・OpenAI に接続せずに実行できるよう、アプリのモジュールを import する前に環境変数を設定する。
+#   - DB はメモリ上の SQLite（Azure の接続設定を要求しないようにする）
+#   - キャッシュ・チェックポイントはテスト用の一時ディレクトリに作成する
+#   - インデックスを作成するテストは fake_embeddings で OpenAI の代わりに決定的な埋め込みを使う
+# 実行例（リポジトリの直下で実行）:
+#   python -m pytest -q
+import os
+import sys
+import tempfile
+import pytest
+
+_TMP_DIR = tempfile.mkdtemp(prefix="itnavi-test-")
+os.environ.update(
+    CONNECT_MODE="local",
+    DB="sqlite://",
+    OPEN_AI_API_KEY="test",
+    EMBEDDING_CACHE_PATH=os.path.join(_TMP_DIR, "embedding_cache.sqlite3"),
+    EMBED_CHECKPOINT_DIR=os.path.join(_TMP_DIR, "checkpoints"),
+    STRATEGY_CACHE_PATH=os.path.join(_TMP_DIR, "strategy_cache.sqlite3"),
+    ADVICE_CACHE_PATH=os.path.join(_TMP_DIR, "advice_cache.sqlite3"),
+)
+os.environ.pop("DO_GPT", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    """
+    インデックスの作成・検索で使う埋め込みを DeterministicFakeEmbedding に置き換える
+    （トークン数は tiktoken のエンコーディングを取得せず文字数で数える）
+    """
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from modules import mdlEmbedding, mdlVectorstore
+
+    embeddings = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(mdlVectorstore, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(mdlVectorstore, "get_base_embeddings", lambda: embeddings)
+    monkeypatch.setattr(mdlEmbedding, "_token_counter", lambda model_name: len)
+    return embeddings
@@ -0,0 +1,80 @@
+# DXアドバイスの回答キャッシュ (modules.mdlAdviceCache) のテスト
+import pytest
+from modules import mdlAdviceCache
+from modules.mdlAdviceCache import AdviceCache, exact_key, group_key
+
+MODEL = "gpt-4o"
+
+@pytest.fixture(autouse=True)
+def local_embeddings(monkeypatch):
+    # 類似一致のフリーワードの埋め込みは LocalHashEmbeddings で行う（OpenAI を呼び出さない）
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "local")
+
+@pytest.fixture
+def cache(tmp_path):
+    return AdviceCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=600, max_size=10, similarity=0.8)
+
+def test_keys_are_normalized():
+    assert exact_key(MODEL, "検討中", "営業", "ＤＸを\u3000 進めたい\n") == exact_key(MODEL, " 検討中", "営業", "DXを 進めたい")
+    assert group_key(MODEL, "検討中", "営業") == group_key(MODEL, "検討中 ", "営業")
+    assert group_key(MODEL, "検討中", "営業") != group_key(MODEL, "検討中", "人事")
+    assert exact_key(MODEL, "検討中", "営業", "a") != exact_key(MODEL, "検討中", "営業", "b")
+    assert exact_key(MODEL, None, None, None) == exact_key(MODEL, "", "", "")
+
+def test_exact_hit(cache):
+    cache.put(MODEL, "検討中", "営業", "営業のDXを進めたい", "助言", "プロンプト")
+    hit = cache.get(MODEL, "検討中", "営業", " 営業のＤＸを進めたい ")
+    assert hit == {"advice": "助言", "prompt": "プロンプト", "cache": "exact", "similarity": 1.0}
+
+def test_semantic_hit_within_same_group(cache):
+    cache.put(MODEL, "検討中", "営業", "営業部門のDXを進めたい", "助言", "プロンプト")
+    hit = cache.get(MODEL, "検討中", "営業", "営業部門のDXを進めたいです")
+    assert hit["cache"] == "semantic"
+    assert 0.8 <= hit["similarity"] < 1
+    # タイミング・課題が異なる入力の回答は使わない
+    assert cache.get(MODEL, "検討中", "人事", "営業部門のDXを進めたいです") is None
+    assert cache.get(MODEL, "検討中", "営業", "会計システムを刷新したい") is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (0, 1, 2)
+
+def test_semantic_match_disabled_above_one(tmp_path):
+    cache = AdviceCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=600, max_size=10, similarity=1.1)
+    cache.put(MODEL, "検討中", "営業", "営業部門のDXを進めたい", "助言", "プロンプト")
+    assert cache.get(MODEL, "検討中", "営業", "営業部門のDXを進めたいです") is None
+    assert cache.get(MODEL, "検討中", "営業", "営業部門のDXを進めたい")["cache"] == "exact"
+
+def test_size_limit_evicts_least_recently_used(tmp_path, monkeypatch):
+    cache = AdviceCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=600, max_size=2, similarity=1.1)
+    clock = iter(range(1_000_000, 1_000_100))
+    monkeypatch.setattr(mdlAdviceCache.time, "time", lambda: float(next(clock)))
+    cache.put(MODEL, "検討中", "営業", "a", "A", "p")
+    cache.put(MODEL, "検討中", "営業", "b", "B", "p")
+    assert cache.get(MODEL, "検討中", "営業", "a")["advice"] == "A"
+    cache.put(MODEL, "検討中", "営業", "c", "C", "p")
+    assert cache.get(MODEL, "検討中", "営業", "b") is None
+    assert cache.stats()["entries"] == 2
+
+def test_expired_entries_are_not_returned(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(mdlAdviceCache.time, "time", lambda: now)
+    cache.put(MODEL, "検討中", "営業", "営業部門のDXを進めたい", "助言", "プロンプト")
+    now += 601
+    assert cache.get(MODEL, "検討中", "営業", "営業部門のDXを進めたい") is None
+    assert cache.get(MODEL, "検討中", "営業", "営業部門のDXを進めたいです") is None
+
+def test_invalidate(cache):
+    cache.put(MODEL, "検討中", "営業", "営業部門のDXを進めたい", "助言", "プロンプト")
+    cache.put(MODEL, "検討中", "人事", "人事制度を見直したい", "助言", "プロンプト")
+    assert cache.invalidate(MODEL, "検討中", "営業") == 1
+    assert cache.get(MODEL, "検討中", "営業", "営業部門のDXを進めたいです") is None
+    assert cache.get(MODEL, "検討中", "人事", "人事制度を見直したい") is not None
+    assert cache.invalidate(MODEL) == 1
+    assert cache.stats()["entries"] == 0
+
+def test_clear_advice_cache_endpoint(cache, monkeypatch):
+    from modules import mdlDxAdvice
+    monkeypatch.setattr(mdlDxAdvice, "get_advice_cache", lambda: cache)
+    cache.put(mdlDxAdvice.ADVICE_MODEL, "検討中", "営業", "営業部門のDXを進めたい", "助言", "プロンプト")
+    cache.put(mdlDxAdvice.ADVICE_MODEL, "検討中", "人事", "人事制度を見直したい", "助言", "プロンプト")
+    assert mdlDxAdvice.clearAdviceCache("検討中", "営業") == (200, '{"deleted": 1}')
+    assert mdlDxAdvice.clearAdviceCache() == (200, '{"deleted": 1}')
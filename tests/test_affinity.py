@@ -0,0 +1,145 @@
+# 事例→人材の類似度事前計算 (modules.mdlAffinity) のテスト
+import threading
+import numpy as np
+import pytest
+import vectorstore_global
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlAffinity, mdlVectorstore
+from modules.mdlVectorstore import documents_by_owner, make_document_ids
+
+def owner_document(owner_key: str, owner_id: int, text: str) -> Document:
+    return Document(page_content=f"【ID】{owner_id}\n{text}", metadata={owner_key: owner_id})
+
+TALENT_DOCS = [
+    owner_document("talent_id", 1, "営業改革の経験があります"),
+    owner_document("talent_id", 2, "データ分析基盤を構築しました"),
+    owner_document("talent_id", 3, "人事制度の設計を担当しました"),
+    owner_document("talent_id", 4, "製造業の DX を推進しました"),
+]
+CASE_DOCS = [
+    owner_document("case_id", 10, "営業組織の改革事例"),
+    owner_document("case_id", 20, "データ活用の事例"),
+    owner_document("case_id", 30, "人事評価の見直し事例"),
+]
+
+def build(docs, owner_key, embeddings):
+    return FAISS.from_documents(docs, embeddings, ids=make_document_ids(docs, owner_key))
+
+def brute_force(case_vs, talent_vs, case_id, top_n):
+    """事例ごとの上位を素朴に計算した期待値（所有者単位の最小距離）"""
+    talent_vectors = talent_vs.index.reconstruct_n(0, talent_vs.index.ntotal)
+    case_vectors = case_vs.index.reconstruct_n(0, case_vs.index.ntotal)
+    talent_rows = mdlVectorstore.owner_rows(talent_vs, "talent_id")
+    case_rows = mdlVectorstore.owner_rows(case_vs, "case_id")
+    distances = {
+        talent_id: min(
+            float(((case_vectors[c] - talent_vectors[t]) ** 2).sum())
+            for c in case_rows[case_id] for t in rows
+        )
+        for talent_id, rows in talent_rows.items()
+    }
+    return sorted(distances, key=distances.get)[:top_n]
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch, fake_embeddings):
+    monkeypatch.setattr(mdlAffinity, "AFFINITY_DIR", str(tmp_path / "affinity"))
+    talent_vs = build(TALENT_DOCS, "talent_id", fake_embeddings)
+    case_vs = build(CASE_DOCS, "case_id", fake_embeddings)
+    mdlVectorstore.publish_vectorstore(talent_vs, str(tmp_path / "talent"), {"mode": "full"})
+    mdlVectorstore.publish_vectorstore(case_vs, str(tmp_path / "case"), {"mode": "full"})
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", talent_vs)
+    monkeypatch.setattr(vectorstore_global, "case_vectorstore", case_vs)
+    monkeypatch.setattr(vectorstore_global, "case_talent_affinity", None)
+    # このプロセスで稼働中のインデックスのバージョン
+    monkeypatch.setattr(vectorstore_global, "loaded_versions", {
+        "talent": mdlVectorstore.current_version(str(tmp_path / "talent")),
+        "case": mdlVectorstore.current_version(str(tmp_path / "case")),
+    })
+    return talent_vs, case_vs
+
+def test_compute_affinity_matches_brute_force(stores):
+    talent_vs, case_vs = stores
+    case_ids, talent_ids, distances = mdlAffinity.compute_affinity(case_vs, talent_vs, 3)
+
+    assert case_ids.tolist() == [10, 20, 30]
+    assert talent_ids.shape == (3, 3)
+    for row, case_id in enumerate(case_ids):
+        assert talent_ids[row].tolist() == brute_force(case_vs, talent_vs, int(case_id), 3)
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+def test_compute_affinity_aggregates_chunked_owners(fake_embeddings):
+    # 1件の事例・人材が複数の Document に分かれている場合は最小距離で集約する
+    talent_docs = TALENT_DOCS + [Document(page_content=CASE_DOCS[0].page_content, metadata={"talent_id": 4})]
+    case_docs = CASE_DOCS + [Document(page_content=TALENT_DOCS[2].page_content, metadata={"case_id": 20})]
+    talent_vs = build(talent_docs, "talent_id", fake_embeddings)
+    case_vs = build(case_docs, "case_id", fake_embeddings)
+
+    case_ids, talent_ids, distances = mdlAffinity.compute_affinity(case_vs, talent_vs, 2)
+
+    assert case_ids.tolist() == [10, 20, 30]
+    # 事例10 の本文は人材4 の2件目の Document と一致し、事例20 の2件目は人材3 の本文と一致する
+    assert talent_ids[0][0] == 4 and distances[0][0] == pytest.approx(0, abs=1e-4)
+    assert talent_ids[1][0] == 3 and distances[1][0] == pytest.approx(0, abs=1e-4)
+    for row, case_id in enumerate(case_ids):
+        assert talent_ids[row].tolist() == brute_force(case_vs, talent_vs, int(case_id), 2)
+
+def test_refresh_and_lookup(stores):
+    talent_vs, case_vs = stores
+    affinity = mdlAffinity.refresh_affinity()
+
+    assert affinity["info"]["cases"] == 3
+    assert mdlAffinity.lookup_talent_ids(20, 2) == brute_force(case_vs, talent_vs, 20, 2)
+    # 保持数を超える件数・未知の事例は ANN 検索へフォールバックさせる
+    assert mdlAffinity.lookup_talent_ids(20, mdlAffinity.DEFAULT_TOP_N + 1) is None
+    assert mdlAffinity.lookup_talent_ids(99, 2) is None
+
+    # 計算済みの場合は再計算しない
+    version = mdlVectorstore.current_version(mdlAffinity.AFFINITY_DIR)
+    mdlAffinity.refresh_affinity()
+    assert mdlVectorstore.current_version(mdlAffinity.AFFINITY_DIR) == version
+
+def test_lookup_ignores_stale_affinity(stores):
+    talent_vs, _ = stores
+    mdlAffinity.refresh_affinity()
+    # 稼働中の人材インデックスが差し替わると、再計算されるまで参照しない
+    vectorstore_global.loaded_versions["talent"] = "20990101000000"
+    assert mdlAffinity.lookup_talent_ids(10, 2) is None
+
+    mdlAffinity.refresh_affinity()
+    assert mdlAffinity.lookup_talent_ids(10, 2) is not None
+
+def test_refresh_skipped_without_both_indexes(stores, monkeypatch):
+    monkeypatch.setattr(vectorstore_global, "case_vectorstore", None)
+    assert mdlAffinity.refresh_affinity() is None
+    status, _ = mdlAffinity.refreshAffinity()
+    assert status == 409
+
+def test_documents_by_owner_keeps_order(fake_embeddings):
+    talent_vs = build(TALENT_DOCS, "talent_id", fake_embeddings)
+    docs = documents_by_owner(talent_vs, "talent_id", [3, 99, 1])
+    assert [doc.metadata["talent_id"] for doc in docs] == [3, 1]
+
+def test_refresh_waits_for_other_process_and_loads_its_result(stores, monkeypatch):
+    monkeypatch.setattr(mdlAffinity, "REFRESH_POLL_SECONDS", 0.05)
+    published = mdlAffinity.refresh_affinity()
+    # このプロセスでは未読み込み（別のプロセスが計算・保存した状態）
+    monkeypatch.setattr(vectorstore_global, "case_talent_affinity", None)
+
+    def fail(*args, **kwargs):
+        pytest.fail("別のプロセスが計算した結果があるのに再計算しました")
+    monkeypatch.setattr(mdlAffinity, "compute_affinity", fail)
+
+    results = []
+    with mdlAffinity.rebuild_lock(mdlAffinity.AFFINITY_DIR) as acquired:
+        assert acquired
+        thread = threading.Thread(target=lambda: results.append(mdlAffinity.refresh_affinity(force=True)))
+        thread.start()
+        thread.join(0.3)
+        # 計算中のプロセスがファイルロックを解放するまで待つ
+        assert thread.is_alive()
+    thread.join(5)
+
+    (affinity,) = results
+    assert affinity["info"] == published["info"]
+    assert mdlAffinity.lookup_talent_ids(10, 2) is not None
@@ -0,0 +1,83 @@
+# 複数プロンプトの一括検索 (modules.mdlVectorstore.batch_search / mdlTalent.getTalentByPrompts) のテスト
+import json
+import vectorstore_global
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from models.params import talentBatchSearchData
+from modules import mdlTalent
+from modules.mdlVectorstore import batch_search, make_document_ids
+
+DOCS = [
+    Document(page_content=f"【ID】{talent_id}\n【経歴】{text}", metadata={"talent_id": talent_id})
+    for talent_id, text in [
+        (1, "営業改革の経験があります"),
+        (2, "データ分析基盤を構築しました"),
+        (3, "人事制度の設計を担当しました"),
+    ]
+]
+
+class RecordingEmbeddings:
+    """embed_documents に渡されたテキストを記録する埋め込み"""
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+def test_batch_search_embeds_unique_queries_once(fake_embeddings):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    recording = RecordingEmbeddings(fake_embeddings)
+    vs.embedding_function = recording
+
+    queries = [DOCS[0].page_content, DOCS[1].page_content, DOCS[0].page_content]
+    results = batch_search(vs, queries, [1, 2, 3], "talent_id")
+
+    assert recording.calls == [[DOCS[0].page_content, DOCS[1].page_content]]
+    assert [len(hits) for hits in results] == [1, 2, 3]
+    # 本文と同じプロンプトでは、その文書が距離 0 で先頭に来る
+    assert results[0][0][0].metadata["talent_id"] == 1
+    assert results[0][0][1] == 0.0
+    assert results[1][0][0].metadata["talent_id"] == 2
+    assert [doc.metadata["talent_id"] for doc, _ in results[2]] == [
+        doc.metadata["talent_id"] for doc, _ in results[0] + results[2][1:]
+    ]
+
+def test_batch_search_caps_k_at_index_size(fake_embeddings):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    assert [len(hits) for hits in batch_search(vs, ["営業"], [10], "talent_id")] == [3]
+    assert batch_search(vs, [], [], "talent_id") == []
+
+def test_get_talent_by_prompts_groups_results(fake_embeddings, monkeypatch):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", vs)
+
+    data = talentBatchSearchData(queries=[
+        {"prompt": DOCS[2].page_content, "cnt": 1},
+        {"prompt": "営業", "cnt": 2},
+    ])
+    status, result = mdlTalent.getTalentByPrompts(data)
+
+    assert status == 200
+    result = json.loads(result)
+    assert [(entry["prompt"], entry["cnt"], len(entry["results"])) for entry in result] == [
+        (DOCS[2].page_content, 1, 1),
+        ("営業", 2, 2),
+    ]
+    assert result[0]["results"][0]["id"] == "3"
+    assert result[0]["results"][0]["score"] == 0.0
+
+def test_get_talent_by_prompts_rejects_invalid_requests(monkeypatch):
+    monkeypatch.setattr(mdlTalent, "MAX_BATCH_QUERIES", 2)
+    cases = [
+        [],
+        [{"prompt": "a", "cnt": 1}] * 3,
+        [{"prompt": "a", "cnt": 0}],
+    ]
+    for queries in cases:
+        status, _ = mdlTalent.getTalentByPrompts(talentBatchSearchData(queries=queries))
+        assert status == 400
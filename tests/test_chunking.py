@@ -0,0 +1,90 @@
+# チャンク分割 (modules.mdlVectorstore.split_documents) と所有者単位の検索結果の集約 (search_owners) のテスト
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlVectorstore
+from modules.mdlVectorstore import make_document_ids, search_owners, split_documents, vector_search
+
+LONG_TEXT = "【ID】1\n\n【名前】山田\n\n" + "\n\n".join(
+    f"【経歴{i}】" + "営業改革の経験があります。" * 5 for i in range(6)
+)
+
+@pytest.fixture(autouse=True)
+def chunk_env(monkeypatch):
+    for name in ("TALENT_CHUNK_SIZE", "CHUNK_OVERLAP", "MAX_CHUNKS_PER_DOCUMENT", "CHUNK_SCORE"):
+        monkeypatch.delenv(name, raising=False)
+
+def test_split_documents_disabled_by_default():
+    docs = [Document(page_content=LONG_TEXT, metadata={"talent_id": 1})]
+    assert split_documents(docs, "talent") is docs
+
+def test_split_documents_prefixes_header_and_keeps_metadata(monkeypatch):
+    monkeypatch.setenv("TALENT_CHUNK_SIZE", "120")
+    short = Document(page_content="【ID】2\n\n【名前】佐藤", metadata={"talent_id": 2})
+    chunks = split_documents([Document(page_content=LONG_TEXT, metadata={"talent_id": 1, "name": "山田"}), short], "talent")
+
+    owned = [chunk for chunk in chunks if chunk.metadata["talent_id"] == 1]
+    assert len(owned) > 1
+    assert all(chunk.page_content.startswith("【ID】1\n\n【名前】山田") for chunk in owned)
+    assert all(chunk.metadata == {"talent_id": 1, "name": "山田"} for chunk in owned)
+    # chunk_size 以下の Document はそのまま
+    assert chunks[-1] is short
+
+def test_split_documents_caps_chunks_per_document(monkeypatch):
+    monkeypatch.setenv("TALENT_CHUNK_SIZE", "120")
+    monkeypatch.setenv("MAX_CHUNKS_PER_DOCUMENT", "2")
+    chunks = split_documents([Document(page_content=LONG_TEXT, metadata={"talent_id": 1})], "talent")
+    assert len(chunks) == 2
+
+def chunked_store(embeddings):
+    # 人材1 は3チャンク、人材2・3 は1チャンク
+    docs = [
+        Document(page_content="営業改革", metadata={"talent_id": 1}),
+        Document(page_content="営業改革の経験", metadata={"talent_id": 1}),
+        Document(page_content="営業改革の実績", metadata={"talent_id": 1}),
+        Document(page_content="人事制度", metadata={"talent_id": 2}),
+        Document(page_content="データ分析", metadata={"talent_id": 3}),
+    ]
+    return FAISS.from_documents(docs, embeddings, ids=make_document_ids(docs, "talent_id"))
+
+def test_search_owners_returns_distinct_owners(fake_embeddings):
+    vs = chunked_store(fake_embeddings)
+    query = np.array([fake_embeddings.embed_query("営業改革")], dtype="float32")
+
+    hits = search_owners(vs, query, 3, "talent_id")[0]
+    owners = [mdlVectorstore.row_owners(vs, "talent_id")[row] for row, _ in hits]
+    assert owners[0] == 1
+    assert sorted(owners) == [1, 2, 3]
+    # 行番号・距離は所有者の中で最も近いチャンクのもの
+    assert hits[0] == (0, pytest.approx(0, abs=1e-4))
+
+def test_search_owners_restricted_to_rows(fake_embeddings):
+    vs = chunked_store(fake_embeddings)
+    query = np.array([fake_embeddings.embed_query("営業改革")], dtype="float32")
+    hits = search_owners(vs, query, 3, "talent_id", rows=[3, 4])[0]
+    assert sorted(row for row, _ in hits) == [3, 4]
+
+def test_sum_score_adds_similarity_of_all_chunks(fake_embeddings, monkeypatch):
+    vs = chunked_store(fake_embeddings)
+    owner_of_row = {0: 1, 1: 1, 2: 1, 3: 2, 4: 3}
+    query = np.array([fake_embeddings.embed_query("人事制度")], dtype="float32")
+
+    # max: 最も近いチャンクの人材2 が先頭
+    assert search_owners(vs, query, 3, "talent_id")[0][0][0] == 3
+
+    # sum: 取得したチャンクの類似度 1 / (1 + 距離) の合計の順
+    monkeypatch.setenv("CHUNK_SCORE", "sum")
+    hits = search_owners(vs, query, 3, "talent_id")[0]
+    similarities = {}
+    distances, labels = vs.index.search(query, vs.index.ntotal)
+    for row, distance in zip(labels[0], distances[0]):
+        owner = owner_of_row[int(row)]
+        similarities[owner] = similarities.get(owner, 0) + 1 / (1 + distance)
+    assert [owner_of_row[row] for row, _ in hits] == sorted(similarities, key=lambda owner: -similarities[owner])
+
+def test_vector_search_dedupes_chunks(fake_embeddings):
+    vs = chunked_store(fake_embeddings)
+    docs = vector_search(vs, "営業改革", 2, "talent_id")
+    assert len({doc.metadata["talent_id"] for doc in docs}) == 2
+    assert vector_search(vs, "営業改革", 2, "talent_id", owner_ids=[99]) == []
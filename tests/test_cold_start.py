@@ -0,0 +1,45 @@
+# 起動時の遅延読み込み (db_control.connect.get_engine / 重いライブラリの遅延 import) のテスト
+import os
+import subprocess
+import sys
+import threading
+from db_control import connect
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_get_engine_creates_engine_once(monkeypatch):
+    created = []
+
+    def create_db_engine():
+        created.append(threading.current_thread().name)
+        return object()
+    monkeypatch.setattr(connect, "_engine", None)
+    monkeypatch.setattr(connect, "create_db_engine", create_db_engine)
+
+    threads = [threading.Thread(target=connect.get_engine) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine = connect.get_engine()
+
+    assert len(created) == 1
+    assert connect.get_engine() is engine
+
+def test_importing_app_defers_heavy_modules_and_engine():
+    # 新しいプロセスで app を import し、重いライブラリとエンジンが読み込まれていないことを確認する
+    code = (
+        "import sys, app\n"
+        "from db_control import connect\n"
+        "heavy = ('langchain', 'langchain_openai', 'openai', 'faiss', 'numpy', 'pandas')\n"
+        "print('loaded=' + ','.join(name for name in heavy if name in sys.modules))\n"
+        "print('engine_deferred=' + str(connect._engine is None))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, env=os.environ.copy(),
+        capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert "loaded=" in lines
+    assert "engine_deferred=True" in lines
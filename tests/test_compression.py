@@ -0,0 +1,66 @@
+# 圧縮インデックス (SQ / PQ / PCA) の作成・評価と絞り込み検索のテスト
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from modules import mdlVectorstore
+from modules.mdlIndexSpec import build_index, evaluate_compression
+from modules.mdlVectorstore import content_hash, stream_documents_to_vectorstore, vector_search
+
+def case_documents(count: int) -> list[Document]:
+    docs = []
+    for i in range(1, count + 1):
+        page_content = f"【ID】{i}\n事例{i} の本文"
+        docs.append(Document(page_content=page_content, metadata={"case_id": i, "content_hash": content_hash(page_content)}))
+    return docs
+
+@pytest.fixture(autouse=True)
+def compression_env(monkeypatch):
+    monkeypatch.delenv("CASE_CHUNK_SIZE", raising=False)
+    monkeypatch.setenv("EXTRACT_BATCH_SIZE", "50")
+
+def test_evaluate_compression_reports_memory_and_recall():
+    vectors = np.random.default_rng(0).random((300, 32), dtype=np.float32)
+    flat = build_index("Flat", vectors)
+    flat.add(vectors)
+    report = evaluate_compression(flat, vectors)
+    assert report["recall_at_k"] == 1.0
+    assert report["raw_bytes"] == vectors.nbytes
+
+    sq8 = build_index("SQ8", vectors)
+    sq8.add(vectors)
+    report = evaluate_compression(sq8, vectors)
+    assert report["index_bytes"] < report["raw_bytes"] / 2
+    assert report["saved_bytes"] > 0
+    assert 0.5 < report["recall_at_k"] <= 1.0
+    assert report["dimension"] == 32
+
+def test_pca_dimension_must_be_smaller_than_embedding():
+    vectors = np.random.default_rng(0).random((50, 16), dtype=np.float32)
+    with pytest.raises(ValueError):
+        build_index("PCA16,Flat", vectors)
+
+@pytest.mark.parametrize("index_spec", ["SQ8", "PQ4x4", "PCA8,Flat"])
+def test_stream_records_compression_and_supports_filtered_search(fake_embeddings, index_spec):
+    docs = case_documents(120)
+    vs, info = stream_documents_to_vectorstore(iter(docs), "case", "case_id", index_spec=index_spec)
+
+    assert info["documents"] == 120
+    assert info["compression"]["raw_bytes"] == 120 * 16 * 4
+    assert vs.index.ntotal == 120
+
+    # ID セレクタに対応しない種別 (PQ) や PCA の前処理付きでも、指定した事例だけを返す
+    results = vector_search(vs, docs[10].page_content, 3, "case_id", owner_ids=[11, 50, 90])
+    assert {doc.metadata["case_id"] for doc in results} == {11, 50, 90}
+
+def test_sync_keeps_compression_report(tmp_path, monkeypatch, fake_embeddings):
+    monkeypatch.setenv("DO_GPT", "TRUE")
+    base_dir = str(tmp_path / "case")
+    docs = case_documents(60)
+    vs, info = stream_documents_to_vectorstore(iter(docs), "case", "case_id", index_spec="SQ8")
+    mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full", **info, "index_spec": "SQ8"})
+
+    status, _ = mdlVectorstore._sync_vectorstore(
+        "case", base_dir, "case_id", lambda session: docs[:-1], lambda *args, **kwargs: pytest.fail("全件生成しました")
+    )
+    assert status == 200
+    assert mdlVectorstore.version_info(base_dir)["compression"] == info["compression"]
@@ -0,0 +1,68 @@
+# メモリマップ型 Docstore (modules.mdlDocstore) のテスト
+import os
+import pytest
+from langchain.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from modules import mdlVectorstore
+from modules.mdlDocstore import MmapDocstore, save_docstore, has_mmap_docstore
+
+DOCS = {
+    "talent:1:0": Document(page_content="【ID】1\n\n営業改革", metadata={"talent_id": 1, "name": "山田"}),
+    "talent:2:0": Document(page_content="【ID】2\n\n人事制度", metadata={"talent_id": 2, "name": "佐藤"}),
+}
+
+@pytest.fixture
+def directory(tmp_path):
+    save_docstore(str(tmp_path), InMemoryDocstore(dict(DOCS)), {1: "talent:2:0", 0: "talent:1:0"})
+    return str(tmp_path)
+
+def test_save_and_search(directory):
+    assert has_mmap_docstore(directory)
+    docstore = MmapDocstore(directory)
+    # 行番号順に保存される
+    assert docstore.ids == ["talent:1:0", "talent:2:0"]
+    doc = docstore.search("talent:2:0")
+    assert doc.page_content == DOCS["talent:2:0"].page_content
+    assert doc.metadata == {"talent_id": 2, "name": "佐藤"}
+    assert not isinstance(docstore.search("talent:9:0"), Document)
+
+def test_add_and_delete_are_kept_until_saved(directory, tmp_path):
+    docstore = MmapDocstore(directory)
+    docstore.delete(["talent:1:0"])
+    docstore.add({"talent:3:0": Document(page_content="物流", metadata={"talent_id": 3})})
+    assert "talent:1:0" not in docstore
+    assert not isinstance(docstore.search("talent:1:0"), Document)
+    assert docstore.search("talent:3:0").page_content == "物流"
+    with pytest.raises(ValueError):
+        docstore.add({"talent:2:0": Document(page_content="重複")})
+    with pytest.raises(ValueError):
+        docstore.delete(["talent:9:0"])
+
+    # 差分を含めて別のディレクトリへ書き出す
+    saved = str(tmp_path / "saved")
+    save_docstore(saved, docstore, {0: "talent:2:0", 1: "talent:3:0"})
+    assert MmapDocstore(saved).ids == ["talent:2:0", "talent:3:0"]
+    assert MmapDocstore(saved).search("talent:3:0").metadata == {"talent_id": 3}
+
+def test_save_rejects_missing_documents(tmp_path):
+    with pytest.raises(ValueError):
+        save_docstore(str(tmp_path), InMemoryDocstore(dict(DOCS)), {0: "talent:1:0", 1: "talent:9:0"})
+
+def test_vectorstore_round_trip_without_pickle(tmp_path, fake_embeddings):
+    docs = list(DOCS.values())
+    vs = FAISS.from_documents(docs, fake_embeddings, ids=list(DOCS))
+    mdlVectorstore.save_vectorstore(vs, str(tmp_path))
+    assert not os.path.exists(tmp_path / "index.pkl")
+
+    loaded = mdlVectorstore.open_vectorstore(str(tmp_path))
+    assert isinstance(loaded.docstore, MmapDocstore)
+    hits = loaded.similarity_search(docs[1].page_content, k=1)
+    assert hits[0].metadata["talent_id"] == 2
+
+def test_legacy_pickle_index_still_loads(tmp_path, fake_embeddings):
+    vs = FAISS.from_documents(list(DOCS.values()), fake_embeddings, ids=list(DOCS))
+    vs.save_local(str(tmp_path))
+    loaded = mdlVectorstore.open_vectorstore(str(tmp_path))
+    assert loaded.index.ntotal == 2
+    assert loaded.docstore.search("talent:1:0").metadata["name"] == "山田"
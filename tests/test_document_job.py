@@ -0,0 +1,180 @@
+# 戦略文書作成ジョブ (modules.mdlDocumentJob / crud の t_document_job) のテスト
+# ワーカー・プロセス間で同じテーブルを共有する前提のため、SQLite のファイル DB で確認する
+import json
+import threading
+import pytest
+from sqlalchemy import create_engine
+from db_control import crud
+from db_control.mymodels import Base, t_document_job
+from models.params import userData
+from modules import mdlDocumentJob, mdlStrategy
+
+@pytest.fixture(autouse=True)
+def job_db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(engine, tables=[t_document_job.__table__])
+    monkeypatch.setattr(crud, "get_engine", lambda: engine)
+    monkeypatch.setenv("DOCUMENT_JOB_MAX_ATTEMPTS", "3")
+    monkeypatch.setenv("DOCUMENT_JOB_RETRY_SECONDS", "0")
+    # ワーカースレッドは起動しない（テストで claim / run_job を直接呼び出す）
+    monkeypatch.setattr(mdlDocumentJob, "start_workers", lambda: [])
+    return engine
+
+def submit(search_id: int = 1) -> int:
+    status, job_id = crud.insert_t_document_job(userData(search_id=search_id, search_id_sub=1, user_id="u1"))
+    assert status == 200
+    return int(job_id)
+
+def job(job_id: int) -> dict:
+    status, result = crud.select_t_document_job(job_id)
+    assert status == 200
+    return json.loads(result)
+
+def test_claim_marks_job_running():
+    job_id = submit()
+    status, result = crud.claim_t_document_job("worker-a", 600, 3)
+    assert status == 200
+    claimed = json.loads(result)
+    assert (claimed["job_id"], claimed["status"], claimed["attempts"]) == (job_id, "running", 1)
+    # 実行中のジョブは他のワーカーが取得できない
+    assert crud.claim_t_document_job("worker-b", 600, 3)[0] == 404
+
+def test_expired_lease_is_reclaimed_and_stale_worker_cannot_update():
+    job_id = submit()
+    # リース期限切れ（ワーカーの停止）を再現する
+    assert crud.claim_t_document_job("worker-a", -1, 3)[0] == 200
+    status, result = crud.claim_t_document_job("worker-b", 600, 3)
+    assert status == 200 and json.loads(result)["attempts"] == 2
+
+    # 再取得された後は、元のワーカーの結果を登録しない
+    assert crud.update_t_document_job(job_id, "worker-a", "ready", document_id=1)[0] == 409
+    assert crud.update_t_document_job(job_id, "worker-b", "ready", document_id=2)[0] == 200
+    assert (job(job_id)["status"], job(job_id)["document_id"]) == ("ready", 2)
+
+def test_expired_job_fails_after_max_attempts():
+    job_id = submit()
+    assert crud.claim_t_document_job("worker-a", -1, 1)[0] == 200
+    assert crud.claim_t_document_job("worker-b", 600, 1)[0] == 404
+    assert job(job_id)["status"] == "failed"
+
+@pytest.mark.parametrize("create_doc, attempts, expected", [
+    (lambda data, regenerate: (200, "42"), 1, "ready"),
+    (lambda data, regenerate: (404, json.dumps({"message": "not found"})), 1, "failed"),
+    (lambda data, regenerate: (500, json.dumps({"message": "error"})), 1, "pending"),
+    (lambda data, regenerate: (500, json.dumps({"message": "error"})), 3, "failed"),
+])
+def test_run_job_records_result(monkeypatch, create_doc, attempts, expected):
+    monkeypatch.setattr(mdlStrategy, "createDoc", create_doc)
+    job_id = submit()
+    for attempt in range(attempts):
+        status, result = crud.claim_t_document_job("worker-a", 600, 3)
+        assert status == 200
+        mdlDocumentJob.run_job(json.loads(result), "worker-a")
+
+    assert job(job_id)["status"] == expected
+    if expected == "ready":
+        assert job(job_id)["document_id"] == 42
+
+def test_run_job_retries_after_exception(monkeypatch):
+    def create_doc(data, regenerate):
+        raise RuntimeError("OpenAI timeout")
+    monkeypatch.setattr(mdlStrategy, "createDoc", create_doc)
+    job_id = submit()
+    mdlDocumentJob.run_job(json.loads(crud.claim_t_document_job("worker-a", 600, 3)[1]), "worker-a")
+    assert job(job_id)["status"] == "pending"
+    assert "OpenAI timeout" in job(job_id)["error"]
+
+def test_get_doc_job_checks_search_ids():
+    job_id = submit()
+    status, result = mdlDocumentJob.getDocJob(1, 1, job_id)
+    assert status == 200 and json.loads(result)["status"] == "pending"
+    assert mdlDocumentJob.getDocJob(2, 1, job_id)[0] == 404
+    assert mdlDocumentJob.getDocJob(1, 1, job_id + 1)[0] == 404
+
+def test_workers_start_on_boot_by_default(monkeypatch):
+    monkeypatch.delenv("DOCUMENT_JOB_START_ON_BOOT", raising=False)
+    assert mdlDocumentJob.start_on_boot()
+    monkeypatch.setenv("DOCUMENT_JOB_START_ON_BOOT", "FALSE")
+    assert not mdlDocumentJob.start_on_boot()
+
+def test_get_doc_job_starts_workers_for_remaining_jobs(monkeypatch):
+    started = []
+    monkeypatch.setattr(mdlDocumentJob, "start_workers", lambda: started.append(True) or [])
+    job_id = submit()
+    # 実行待ちのジョブを参照した場合は、このプロセスのワーカーを起動する
+    assert mdlDocumentJob.getDocJob(1, 1, job_id)[0] == 200
+    assert started == [True]
+
+    claimed = json.loads(crud.claim_t_document_job("worker-a", 600, 3)[1])
+    crud.update_t_document_job(claimed["job_id"], "worker-a", "failed", error="error")
+    assert mdlDocumentJob.getDocJob(1, 1, job_id)[0] == 200
+    assert started == [True]
+
+def test_renew_extends_lease_of_owner_only():
+    job_id = submit()
+    assert crud.claim_t_document_job("worker-a", -1, 3)[0] == 200
+    # 期限切れ前に延長したジョブは、他のワーカーが再取得しない
+    assert crud.renew_t_document_job(job_id, "worker-a", 600)[0] == 200
+    assert crud.claim_t_document_job("worker-b", 600, 3)[0] == 404
+    assert crud.renew_t_document_job(job_id, "worker-b", 600)[0] == 409
+
+def test_run_job_renews_lease_while_running(monkeypatch):
+    monkeypatch.setenv("DOCUMENT_JOB_LEASE_SECONDS", "1")
+    renewed = threading.Event()
+    original_renew = crud.renew_t_document_job
+
+    def renew_t_document_job(job_id, worker_id, lease_seconds):
+        result = original_renew(job_id, worker_id, lease_seconds)
+        renewed.set()
+        return result
+    monkeypatch.setattr(crud, "renew_t_document_job", renew_t_document_job)
+
+    def create_doc(data, regenerate):
+        # 生成がリース期間より長くかかる場合
+        assert renewed.wait(5)
+        assert crud.claim_t_document_job("worker-b", 600, 3)[0] == 404
+        return 200, "42"
+    monkeypatch.setattr(mdlStrategy, "createDoc", create_doc)
+    job_id = submit()
+    mdlDocumentJob.run_job(json.loads(crud.claim_t_document_job("worker-a", 1, 3)[1]), "worker-a")
+    assert (job(job_id)["status"], job(job_id)["document_id"]) == ("ready", 42)
+
+def test_run_job_keeps_result_of_worker_that_reclaimed(monkeypatch, capsys):
+    def create_doc(data, regenerate):
+        # 実行中に中断とみなされ、別のワーカーが再取得した場合
+        assert crud.claim_t_document_job("worker-b", 600, 3)[0] == 200
+        return 200, "42"
+    monkeypatch.setattr(mdlStrategy, "createDoc", create_doc)
+    job_id = submit()
+    mdlDocumentJob.run_job(json.loads(crud.claim_t_document_job("worker-a", -1, 3)[1]), "worker-a")
+
+    assert (job(job_id)["status"], job(job_id)["attempts"], job(job_id)["document_id"]) == ("running", 2, None)
+    assert crud.update_t_document_job(job_id, "worker-b", "ready", document_id=43)[0] == 200
+    assert "結果を登録しませんでした" in capsys.readouterr().out
+
+def test_concurrent_workers_claim_each_job_once():
+    job_ids = [submit(search_id) for search_id in range(1, 4)]
+    barrier = threading.Barrier(6)
+    claimed = []
+    errors = []
+
+    def worker(worker_id: str) -> None:
+        barrier.wait()
+        while True:
+            status, result = crud.claim_t_document_job(worker_id, 600, 3)
+            if status != 200:
+                if status != 404:
+                    errors.append(result)
+                return
+            claimed.append(json.loads(result)["job_id"])
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # 同じジョブを複数のワーカーが取得しない
+    assert sorted(claimed) == job_ids
+    assert all(job(job_id)["attempts"] == 1 for job_id in job_ids)
@@ -0,0 +1,36 @@
+# 検索結果の Document から人材・事例情報を作成する処理のテスト
+from langchain_core.documents import Document
+from modules.mdlTalent import candidate_from_document
+from modules.mdlDxAdvice import case_from_document
+
+LEGACY_TALENT_TEXT = (
+    "【ID】12\n\n【名前】山田 太郎\n\n【エグゼクティブサマリー】営業改革の専門家\n\n【業界情報】製造業\n\n"
+    "【経歴】\n- 営業部長\n\n【マインドセット】\nなし\n\n【支援領域】\n- 営業DX\n\n【保有職種】\n- コンサルタント\n"
+)
+
+def test_candidate_from_metadata():
+    metadata = {
+        "talent_id": 12, "name": "山田 太郎", "summary": "営業改革の専門家", "industry": "製造業",
+        "career": "- 営業部長", "mindset": "なし", "supportarea": "- 営業DX", "job": "- コンサルタント",
+        "content_hash": "x",
+    }
+    candidate = candidate_from_document(Document(page_content="本文は使わない", metadata=metadata), "本文は使わない")
+    assert candidate == {
+        "id": "12", "name": "山田 太郎", "summary": "営業改革の専門家", "industry": "製造業",
+        "career": "- 営業部長", "mindset": "なし", "supportarea": "- 営業DX", "job": "- コンサルタント",
+    }
+
+def test_candidate_from_legacy_document_parses_text():
+    doc = Document(page_content=LEGACY_TALENT_TEXT, metadata={"talent_id": 12})
+    candidate = candidate_from_document(doc, LEGACY_TALENT_TEXT)
+    assert candidate["id"] == "12"
+    assert candidate["name"] == "山田 太郎"
+    assert candidate["supportarea"] == "- 営業DX"
+
+def test_case_from_metadata_and_legacy_text():
+    doc = Document(page_content="本文", metadata={"case_id": 5, "title": "営業改革", "summary": "受注率の改善"})
+    assert case_from_document(doc, "本文") == {"id": "5", "title": "営業改革", "summary": "受注率の改善"}
+
+    text = "【ID】5\n\n【事例名】営業改革\n\n【事例概要】受注率の改善\n"
+    legacy = case_from_document(Document(page_content=text, metadata={"case_id": 5}), text)
+    assert (legacy["id"], legacy["title"], legacy["summary"]) == ("5", "営業改革", "受注率の改善")
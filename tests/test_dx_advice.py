@@ -0,0 +1,277 @@
+# DXアドバイス (modules.mdlDxAdvice.getAdviceCase / 生成を待たないアドバイスの取得) のテスト
+import json
+import sys
+import threading
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine
+from db_control import crud
+from db_control.mymodels import Base, t_dx_advice
+from models.params import dxAdviceData
+from modules import mdlDxAdvice
+
+CASES = [{"id": "1", "title": "事例1", "summary": "概要1"}]
+
+@pytest.fixture(autouse=True)
+def advice_env(monkeypatch):
+    monkeypatch.delenv("DO_GPT", raising=False)
+    monkeypatch.setattr(mdlDxAdvice, "_advice_jobs", {})
+    monkeypatch.setattr(mdlDxAdvice, "require_vectorstore", lambda target: object())
+    monkeypatch.setattr(mdlDxAdvice, "retrieve_cases", lambda data, vs, prompt: CASES)
+    search_ids = iter(range(1, 100))
+    monkeypatch.setattr(mdlDxAdvice, "register_search", lambda data: (
+        200, json.dumps({"search_id": next(search_ids), "search_id_sub": 1})
+    ))
+
+@pytest.fixture
+def advice_db(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'advice.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(engine, tables=[t_dx_advice.__table__])
+    monkeypatch.setattr(crud, "get_engine", lambda: engine)
+    return engine
+
+def advice_data() -> dxAdviceData:
+    return dxAdviceData(timing="中期計画の策定", domain="業務効率化", free_word="受発注の属人化")
+
+def gate_generate_advice(monkeypatch) -> threading.Event:
+    """
+    release を set するまでアドバイスの生成を止める（生成中の本文は先に1回だけ渡す）
+    """
+    release = threading.Event()
+
+    def generate_advice(data, prompt, on_delta=None, cancel=None):
+        if on_delta is not None:
+            on_delta("前半")
+        release.wait(5)
+        if on_delta is not None:
+            on_delta("後半")
+        return "前半後半", "検索用プロンプト"
+    monkeypatch.setattr(mdlDxAdvice, "generate_advice", generate_advice)
+    return release
+
+def parse_events(chunks) -> list[tuple[str, dict]]:
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            continue
+        lines = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_get_advice_case_returns_advice_and_cases():
+    status, result = mdlDxAdvice.getAdviceCase(advice_data())
+    result = json.loads(result)
+    assert status == 200
+    assert (result["search_id"], result["search_id_sub"]) == (1, 1)
+    assert result["advice"] == "アドバイス(Sample)"
+    assert result["cases"] == CASES
+    # 生成を待つ場合は、アドバイスを保持しない
+    assert mdlDxAdvice.find_advice(1, 1) is None
+
+def test_get_advice_case_runs_steps_concurrently(monkeypatch):
+    # 検索データの登録が終わる前に、アドバイスの生成・事例の検索が始まっている
+    started = threading.Barrier(3, timeout=5)
+
+    def register_search(data):
+        started.wait()
+        return 200, json.dumps({"search_id": 1, "search_id_sub": 1})
+
+    def generate_advice(data, prompt, on_delta=None, cancel=None):
+        started.wait()
+        return "アドバイス", "プロンプト"
+
+    def retrieve_cases(data, vs, prompt):
+        started.wait()
+        return CASES
+    monkeypatch.setattr(mdlDxAdvice, "register_search", register_search)
+    monkeypatch.setattr(mdlDxAdvice, "generate_advice", generate_advice)
+    monkeypatch.setattr(mdlDxAdvice, "retrieve_cases", retrieve_cases)
+
+    status, result = mdlDxAdvice.getAdviceCase(advice_data())
+    assert status == 200 and json.loads(result)["advice"] == "アドバイス"
+
+def test_get_advice_case_returns_search_error(monkeypatch):
+    monkeypatch.setattr(mdlDxAdvice, "register_search", lambda data: (
+        500, json.dumps({"message": "Search creation failed"})
+    ))
+    status, result = mdlDxAdvice.getAdviceCase(advice_data(), defer_advice=True)
+    assert status == 500
+    assert json.loads(result)["message"] == "Search creation failed"
+    # DB 登録に失敗した場合はアドバイスを生成しない
+    assert mdlDxAdvice._advice_jobs == {}
+
+def test_get_advice_case_does_not_wait_for_advice_after_search_error(monkeypatch):
+    release = gate_generate_advice(monkeypatch)
+    monkeypatch.setattr(mdlDxAdvice, "register_search", lambda data: (
+        404, json.dumps({"message": "not found"})
+    ))
+    try:
+        assert mdlDxAdvice.getAdviceCase(advice_data())[0] == 404
+        assert not release.is_set()
+    finally:
+        release.set()
+
+def test_deferred_advice_is_available_after_generation(monkeypatch):
+    release = gate_generate_advice(monkeypatch)
+    status, result = mdlDxAdvice.getAdviceCase(advice_data(), defer_advice=True)
+    result = json.loads(result)
+    assert status == 200
+    assert result["advice_state"] == "running" and "advice" not in result
+    assert result["cases"] == CASES
+
+    status, job = mdlDxAdvice.getAdvice(1, 1)
+    assert status == 200 and json.loads(job)["state"] == "running"
+
+    events = []
+    stream = mdlDxAdvice.streamAdvice(1, 1)
+    events.append(next(stream))
+    release.set()
+    events.extend(stream)
+
+    # 接続前に生成済みの本文も送り、完了時にアドバイス・プロンプトを送る
+    events = parse_events(events)
+    assert events[0] == ("delta", {"text": "前半"})
+    assert "".join(data["text"] for event, data in events if event == "delta") == "前半後半"
+    assert events[-1] == ("done", {"search_id": 1, "search_id_sub": 1, "advice": "前半後半", "prompt": "検索用プロンプト"})
+
+    job = json.loads(mdlDxAdvice.getAdvice(1, 1)[1])
+    assert (job["state"], job["advice"], job["text"]) == ("ready", "前半後半", "前半後半")
+
+def test_deferred_advice_failure_is_reported(monkeypatch):
+    def generate_advice(data, prompt, on_delta=None, cancel=None):
+        raise RuntimeError("OpenAI timeout")
+    monkeypatch.setattr(mdlDxAdvice, "generate_advice", generate_advice)
+    assert mdlDxAdvice.getAdviceCase(advice_data(), defer_advice=True)[0] == 200
+
+    events = parse_events(mdlDxAdvice.streamAdvice(1, 1))
+    assert events == [("error", {"message": "advice generation failed", "details": "OpenAI timeout"})]
+    assert json.loads(mdlDxAdvice.getAdvice(1, 1)[1])["state"] == "failed"
+
+def test_get_advice_unknown_search():
+    assert mdlDxAdvice.getAdvice(1, 1)[0] == 404
+
+def test_finished_jobs_are_evicted(monkeypatch):
+    monkeypatch.setattr(mdlDxAdvice, "MAX_ADVICE_JOBS", 2)
+    release = gate_generate_advice(monkeypatch)
+    assert mdlDxAdvice.getAdviceCase(advice_data(), defer_advice=True)[0] == 200
+    with mdlDxAdvice._advice_changed:
+        for search_id in (2, 3):
+            mdlDxAdvice._advice_jobs[(search_id, 1)] = {"state": "ready"}
+    mdlDxAdvice.start_advice_job(4, 1, advice_data(), "prompt")
+
+    # 生成中のものは残し、生成済みのものから古い順に削除する
+    assert sorted(mdlDxAdvice._advice_jobs) == [(1, 1), (4, 1)]
+    release.set()
+
+def test_deferred_advice_is_saved_for_other_processes(monkeypatch, advice_db):
+    assert mdlDxAdvice.getAdviceCase(advice_data(), defer_advice=True)[0] == 200
+    for _ in range(50):
+        if mdlDxAdvice._advice_jobs == {}:
+            break
+        threading.Event().wait(0.1)
+    # 保存後はメモリから削除し、t_dx_advice から返す（別のワーカー・再起動後と同じ）
+    assert mdlDxAdvice._advice_jobs == {}
+    view = json.loads(mdlDxAdvice.getAdvice(1, 1)[1])
+    assert (view["state"], view["advice"], view["text"]) == ("ready", "アドバイス(Sample)", "アドバイス(Sample)")
+
+    events = parse_events(mdlDxAdvice.streamAdvice(1, 1))
+    assert events[0] == ("delta", {"text": "アドバイス(Sample)"})
+    assert events[-1][0] == "done" and events[-1][1]["advice"] == "アドバイス(Sample)"
+
+def test_stale_running_advice_is_reported_as_failed(monkeypatch, advice_db):
+    assert crud.upsert_t_dx_advice(1, 1, "running", None, None, None)[0] == 200
+    assert json.loads(mdlDxAdvice.getAdvice(1, 1)[1])["state"] == "running"
+    monkeypatch.setattr(mdlDxAdvice, "ADVICE_STALE_SECONDS", -1)
+    assert json.loads(mdlDxAdvice.getAdvice(1, 1)[1])["state"] == "failed"
+    events = parse_events(mdlDxAdvice.streamAdvice(1, 1))
+    assert events[0][0] == "error"
+
+class FakeStream:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.closed = False
+
+    def __iter__(self):
+        for text in self.texts:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+    def close(self):
+        self.closed = True
+
+class FakeAdviceCache:
+    def __init__(self):
+        self.saved = []
+
+    def get(self, *args):
+        return None
+
+    def put(self, *args):
+        self.saved.append(args)
+
+@pytest.fixture
+def fake_gpt(monkeypatch):
+    """
+    GPT の出力を texts の断片としてストリーミングで返す openai の代わり
+    """
+    monkeypatch.setenv("DO_GPT", "TRUE")
+    cache = FakeAdviceCache()
+    monkeypatch.setattr(mdlDxAdvice, "get_advice_cache", lambda: cache)
+    streams = []
+
+    def use(texts: list[str]) -> FakeAdviceCache:
+        def create(**kwargs):
+            assert kwargs["stream"] is True
+            streams.append(FakeStream(texts))
+            return streams[-1]
+        monkeypatch.setitem(sys.modules, "openai", SimpleNamespace(api_key=None, chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+        return cache
+    use.streams = streams
+    return use
+
+def test_generate_advice_streams_advice_body(fake_gpt):
+    output = "前置き<<START_ADVICE>>\nまずは業務の棚卸しから<<END_ADVICE>>\n<<START_PROMPT>>受発注の効率化<<END_PROMPT>>"
+    cache = fake_gpt([output[i:i + 3] for i in range(0, len(output), 3)])
+    deltas = []
+    advice, prompt_rag = mdlDxAdvice.generate_advice(advice_data(), "prompt", deltas.append)
+
+    assert (advice, prompt_rag) == ("まずは業務の棚卸しから", "受発注の効率化")
+    assert "".join(deltas) == advice
+    assert len(cache.saved) == 1
+    assert fake_gpt.streams[0].closed
+
+def test_generate_advice_flushes_text_held_back_for_end_marker(fake_gpt):
+    # 終了マーカーの先頭と一致する末尾 ("<<") は保留され、出力の終了時に渡す
+    cache = fake_gpt(["<<START_ADVICE>>助言です<", "<"])
+    deltas = []
+    advice, _ = mdlDxAdvice.generate_advice(advice_data(), "prompt", deltas.append)
+
+    assert deltas == ["助言です", "<<"]
+    assert advice == "助言です<<"
+    assert cache.saved == []
+
+def test_generate_advice_stops_when_cancelled(fake_gpt):
+    cache = fake_gpt(["<<START_ADVICE>>助言<<END_ADVICE>>", "<<START_PROMPT>>検索<<END_PROMPT>>"])
+    cancel = threading.Event()
+    cancel.set()
+    assert mdlDxAdvice.generate_advice(advice_data(), "prompt", cancel=cancel) == ("アドバイス(Sample)", "いい感じの事例を抽出してください")
+    assert cache.saved == []
+    assert fake_gpt.streams[0].closed
+
+def test_get_advice_case_cancels_advice_after_search_error(monkeypatch):
+    started = threading.Event()
+    cancelled = threading.Event()
+
+    def generate_advice(data, prompt, on_delta=None, cancel=None):
+        started.set()
+        if cancel.wait(5):
+            cancelled.set()
+        return "アドバイス", "プロンプト"
+
+    def register_search(data):
+        # アドバイスの生成（GPT の出力の受信）が始まった後に DB 登録が失敗する
+        assert started.wait(5)
+        return 500, json.dumps({"message": "Search creation failed"})
+    monkeypatch.setattr(mdlDxAdvice, "generate_advice", generate_advice)
+    monkeypatch.setattr(mdlDxAdvice, "register_search", register_search)
+    assert mdlDxAdvice.getAdviceCase(advice_data())[0] == 500
+    assert cancelled.wait(5)
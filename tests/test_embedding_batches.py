@@ -0,0 +1,78 @@
+# インデックス作成時のバッチ埋め込み (modules.mdlEmbedding.embed_texts_batched) のテスト
+import os
+import threading
+import pytest
+from modules import mdlEmbedding
+from modules.mdlEmbedding import pack_batches, embed_texts_batched
+
+class RecordingEmbeddings:
+    """
+    embed_documents の呼び出し（バッチ）を記録するスタブ。fail_times 回までは例外を送出する
+    """
+    model = "recording"
+
+    def __init__(self, fail_times: int = 0):
+        self.batches = []
+        self.fail_times = fail_times
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise RuntimeError("rate limited")
+            self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+@pytest.fixture(autouse=True)
+def offline_token_counter(monkeypatch):
+    monkeypatch.setattr(mdlEmbedding, "_token_counter", lambda model_name: len)
+    monkeypatch.setattr(mdlEmbedding.time, "sleep", lambda seconds: None)
+
+def test_pack_batches_respects_token_and_item_limits():
+    assert pack_batches([3, 3, 3, 3], max_tokens=6, max_items=10) == [[0, 1], [2, 3]]
+    assert pack_batches([1, 1, 1, 1, 1], max_tokens=100, max_items=2) == [[0, 1], [2, 3], [4]]
+    # 上限を超える1件はそれだけで1バッチにする
+    assert pack_batches([10, 1, 1], max_tokens=5, max_items=10) == [[0], [1, 2]]
+    assert pack_batches([], max_tokens=5, max_items=10) == []
+
+def test_vectors_keep_input_order_across_concurrent_batches(monkeypatch):
+    monkeypatch.setenv("EMBED_BATCH_SIZE", "2")
+    monkeypatch.setenv("EMBED_CONCURRENCY", "3")
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    embeddings = RecordingEmbeddings()
+    progress = {}
+    vectors = embed_texts_batched(texts, embeddings, progress=progress)
+    assert vectors == [[float(len(text)), 1.0] for text in texts]
+    assert sorted(map(len, embeddings.batches)) == [1, 2, 2]
+    assert progress["docs_embedded"] == 5
+
+def test_failed_batches_are_retried(monkeypatch):
+    monkeypatch.setenv("EMBED_MAX_RETRIES", "2")
+    embeddings = RecordingEmbeddings(fail_times=2)
+    assert embed_texts_batched(["営業"], embeddings) == [[2.0, 1.0]]
+
+    monkeypatch.setenv("EMBED_MAX_RETRIES", "1")
+    with pytest.raises(RuntimeError):
+        embed_texts_batched(["営業"], RecordingEmbeddings(fail_times=2))
+
+def test_checkpoints_are_reused_after_interruption(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBED_BATCH_SIZE", "1")
+    monkeypatch.setenv("EMBED_CONCURRENCY", "1")
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    texts = ["営業改革", "人事制度", "物流"]
+
+    first = RecordingEmbeddings()
+    embed_texts_batched(texts[:2], first, checkpoint_dir)
+    assert len(os.listdir(checkpoint_dir)) == 2
+
+    # 中断後の再実行では、チェックポイントの無いバッチだけを埋め込む
+    second = RecordingEmbeddings()
+    progress = {}
+    vectors = embed_texts_batched(texts, second, checkpoint_dir, progress)
+    assert second.batches == [["物流"]]
+    assert vectors == [[4.0, 1.0], [4.0, 1.0], [2.0, 1.0]]
+    assert progress["docs_embedded"] == 3
+
+    mdlEmbedding.clear_checkpoints(checkpoint_dir)
+    assert not os.path.exists(checkpoint_dir)
@@ -0,0 +1,86 @@
+# クエリ埋め込みキャッシュ (modules.mdlEmbedding) のテスト
+from modules.mdlEmbedding import EmbeddingCache, CachedEmbeddings
+
+def test_key_distinguishes_model_and_text():
+    key = EmbeddingCache.make_key("model-a", "営業 DX")
+    assert key == EmbeddingCache.make_key("model-a", "営業 DX")
+    assert key != EmbeddingCache.make_key("model-b", "営業 DX")
+    assert key != EmbeddingCache.make_key("model-a", "営業  DX")
+
+def test_put_and_get(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_size=10)
+    assert cache.get("m", "text") is None
+    cache.put("m", "text", [0.5, 0.25])
+    assert cache.get("m", "text") == [0.5, 0.25]
+    assert cache.get("other", "text") is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"]) == (1, 2)
+
+def test_memory_lru_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_size=2)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]
+    cache.put("m", "c", [3.0])
+    assert cache.stats()["memory_entries"] == 2
+
+    # メモリから追い出された b はディスクから読み込まれる
+    assert cache.get("m", "b") == [2.0]
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["disk_entries"] == 3
+
+def test_disk_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(path, max_size=10).put("m", "text", [0.125])
+    cache = EmbeddingCache(path, max_size=10)
+    assert cache.get("m", "text") == [0.125]
+    assert cache.stats()["disk_hits"] == 1
+
+class CountingEmbeddings:
+    """
+    埋め込みの呼び出し回数を数えるスタブ（テキストの長さをベクトルとする）
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text: str) -> list[float]:
+        self.calls.append([text])
+        return [float(len(text))]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+def test_cached_embeddings_compute_only_missing_texts(tmp_path):
+    base = CountingEmbeddings()
+    embeddings = CachedEmbeddings(base, EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_size=10), "m")
+    assert embeddings.embed_query("営業") == [2.0]
+    assert embeddings.embed_query("営業") == [2.0]
+    assert embeddings.embed_documents(["営業", "人事制度", "営業"]) == [[2.0], [4.0], [2.0]]
+    assert base.calls == [["営業"], ["人事制度"]]
+
+def test_get_embedding_cache_creates_one_cache(monkeypatch):
+    import threading
+    import time
+    import vectorstore_global
+    from modules import mdlEmbeddingCache
+    created = []
+
+    class SlowCache:
+        def __init__(self, path, max_size):
+            created.append(path)
+            time.sleep(0.05)
+    monkeypatch.setattr(vectorstore_global, "embedding_cache", None)
+    monkeypatch.setattr(mdlEmbeddingCache, "EmbeddingCache", SlowCache)
+
+    caches = []
+    threads = [threading.Thread(target=lambda: caches.append(mdlEmbeddingCache.get_embedding_cache())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(cache is caches[0] for cache in caches)
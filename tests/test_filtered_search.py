@@ -0,0 +1,58 @@
+# 所有者IDで絞り込んだベクトル検索 (modules.mdlVectorstore.vector_search) のテスト
+import faiss
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlVectorstore
+from modules.mdlVectorstore import vector_search, make_document_ids, owner_rows
+
+def talent_document(talent_id: int, text: str) -> Document:
+    return Document(page_content=f"【ID】{talent_id}\n\n{text}", metadata={"talent_id": talent_id})
+
+DOCS = [
+    talent_document(1, "営業改革の経験があります"),
+    talent_document(2, "データ分析基盤を構築しました"),
+    talent_document(3, "人事制度の設計を担当しました"),
+    talent_document(4, "製造業の DX を推進しました"),
+]
+
+def test_owner_rows_from_document_ids(fake_embeddings):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    rows = owner_rows(vs, "talent_id")
+    assert sorted(rows) == [1, 2, 3, 4]
+    assert all(len(owner_row_list) == 1 for owner_row_list in rows.values())
+    # 同じベクトルストアに対してはキャッシュを返す
+    assert owner_rows(vs, "talent_id") is rows
+
+def test_owner_rows_for_legacy_ids(fake_embeddings):
+    # 旧形式 (UUID) の docstore ID の場合は metadata / 本文の【ID】から所有者を求める
+    legacy_docs = [Document(page_content=doc.page_content) for doc in DOCS]
+    vs = FAISS.from_documents(legacy_docs, fake_embeddings)
+    assert sorted(owner_rows(vs, "talent_id")) == [1, 2, 3, 4]
+
+def test_vector_search_only_returns_selected_owners(fake_embeddings):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    results = vector_search(vs, DOCS[0].page_content, 4, "talent_id", [2, 3])
+    assert {doc.metadata["talent_id"] for doc in results} == {2, 3}
+
+    # 対象が1件なら、クエリに最も近い文書が対象外でもその1件だけを返す
+    results = vector_search(vs, DOCS[0].page_content, 4, "talent_id", [4])
+    assert [doc.metadata["talent_id"] for doc in results] == [4]
+
+def test_vector_search_without_matching_owner(fake_embeddings):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    assert vector_search(vs, "営業", 4, "talent_id", [99]) == []
+    assert vector_search(vs, "営業", 4, "talent_id", []) == []
+
+def test_vector_search_on_hnsw_index(fake_embeddings):
+    vs = FAISS.from_documents(DOCS, fake_embeddings, ids=make_document_ids(DOCS, "talent_id"))
+    hnsw = faiss.IndexHNSWFlat(vs.index.d, 8)
+    hnsw.add(vs.index.reconstruct_n(0, vs.index.ntotal))
+    hnsw.hnsw.efSearch = 32
+    vs.index = hnsw
+
+    params = mdlVectorstore.search_parameters(faiss.downcast_index(vs.index), None)
+    assert isinstance(params, faiss.SearchParametersHNSW)
+    assert params.efSearch == 32
+
+    results = vector_search(vs, DOCS[0].page_content, 2, "talent_id", [1, 4])
+    assert {doc.metadata["talent_id"] for doc in results} == {1, 4}
@@ -0,0 +1,94 @@
+# インデックス再作成ジョブ (modules.mdlIndexJob) のテスト
+import json
+import threading
+import time
+import pytest
+from modules import mdlIndexJob, mdlVectorstore
+
+def wait_for_status(job_id: str, statuses: tuple, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, result = mdlIndexJob.getRebuildJob(job_id)
+        job = json.loads(result)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    pytest.fail(f"ジョブ {job_id} が {statuses} になりませんでした")
+
+@pytest.fixture(autouse=True)
+def empty_jobs(monkeypatch):
+    monkeypatch.setattr(mdlIndexJob, "_jobs", {})
+    monkeypatch.setattr(mdlIndexJob, "_running", {})
+
+@pytest.fixture
+def blocking_rebuild(monkeypatch):
+    """
+    release がセットされるまで終わらない再作成（進捗を書き込んでから待つ）
+    """
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def create_vectorstore(target, mode="full", progress=None, index_spec=None):
+        calls.append((target, mode, index_spec))
+        progress.update(rows_extracted=10, docs_embedded=4)
+        started.set()
+        release.wait(5)
+        progress.update(vectors_written=4)
+        return 200, json.dumps({"message": "ok"})
+
+    monkeypatch.setattr(mdlVectorstore, "createVectorstore", create_vectorstore)
+    return started, release, calls
+
+def test_job_reports_progress_and_result(blocking_rebuild):
+    started, release, calls = blocking_rebuild
+    status, result = mdlIndexJob.submitRebuild("talent", "full", "HNSW32;efSearch=64")
+    job = json.loads(result)
+    assert status == 202 and job["status"] in ("pending", "running")
+
+    assert started.wait(5)
+    running = wait_for_status(job["job_id"], ("running",))
+    assert running["progress"]["rows_extracted"] == 10
+
+    release.set()
+    finished = wait_for_status(job["job_id"], ("succeeded", "failed"))
+    assert finished["status"] == "succeeded"
+    assert finished["status_code"] == 200
+    assert finished["progress"] == {"rows_extracted": 10, "docs_embedded": 4, "vectors_written": 4}
+    assert calls == [("talent", "full", "HNSW32;efSearch=64")]
+    assert finished["index_spec"] == "HNSW32;efSearch=64"
+
+def test_requests_coalesce_onto_running_job(blocking_rebuild):
+    started, release, calls = blocking_rebuild
+    _, first = mdlIndexJob.submitRebuild("talent")
+    assert started.wait(5)
+    _, second = mdlIndexJob.submitRebuild("talent")
+    assert json.loads(second)["job_id"] == json.loads(first)["job_id"]
+    assert json.loads(second)["coalesced"] is True
+
+    release.set()
+    wait_for_status(json.loads(first)["job_id"], ("succeeded",))
+    # 終了後の要求は新しいジョブになる
+    _, third = mdlIndexJob.submitRebuild("talent")
+    assert json.loads(third)["job_id"] != json.loads(first)["job_id"]
+    wait_for_status(json.loads(third)["job_id"], ("succeeded",))
+    assert len(calls) == 2
+
+def test_failed_rebuild_is_reported(monkeypatch):
+    def create_vectorstore(target, mode="full", progress=None, index_spec=None):
+        raise RuntimeError("DB に接続できません")
+    monkeypatch.setattr(mdlVectorstore, "createVectorstore", create_vectorstore)
+
+    _, result = mdlIndexJob.submitRebuild("case")
+    job = wait_for_status(json.loads(result)["job_id"], ("succeeded", "failed"))
+    assert job["status"] == "failed"
+    assert job["status_code"] == 500
+    assert "DB に接続できません" in job["result"]["details"]
+
+def test_invalid_requests():
+    assert mdlIndexJob.submitRebuild("unknown")[0] == 404
+    assert mdlIndexJob.submitRebuild("talent", "partial")[0] == 400
+    assert mdlIndexJob.submitRebuild("talent", "full", "IVF64,Flat;nprobe")[0] == 400
+    # index_spec は全件再作成の場合のみ指定できる
+    assert mdlIndexJob.submitRebuild("talent", "sync", "HNSW32")[0] == 400
+    assert mdlIndexJob.getRebuildJob("missing")[0] == 404
@@ -0,0 +1,160 @@
+# インデックスの起動時読み込み・準備状態 (modules.mdlIndexLoader) のテスト
+import json
+import threading
+import pytest
+import vectorstore_global
+from fastapi import HTTPException
+from modules import mdlIndexLoader, mdlVectorstore
+
+class FakeIndex:
+    ntotal = 3
+
+class FakeVectorstore:
+    index = FakeIndex()
+
+@pytest.fixture(autouse=True)
+def loader_state(monkeypatch, tmp_path):
+    for target in mdlIndexLoader.TARGETS:
+        monkeypatch.setitem(mdlIndexLoader.TARGETS, target, str(tmp_path / target))
+    states = {
+        target: {"state": "pending", "version": None, "vectors": None, "error": None,
+                 "started_at": None, "finished_at": None, "elapsed_seconds": None}
+        for target in mdlIndexLoader.TARGETS
+    }
+    monkeypatch.setattr(mdlIndexLoader, "_states", states)
+    monkeypatch.setattr(mdlIndexLoader, "_loaded", {target: threading.Event() for target in mdlIndexLoader.TARGETS})
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", None)
+    monkeypatch.setattr(vectorstore_global, "case_vectorstore", None)
+    monkeypatch.setattr(vectorstore_global, "loaded_versions", {"talent": None, "case": None})
+    monkeypatch.setattr(mdlIndexLoader, "after_load", lambda: None)
+    monkeypatch.setenv("INDEX_WAIT_SECONDS", "0")
+
+def set_loader(monkeypatch, target: str, create_vectorstore) -> None:
+    monkeypatch.setattr(mdlVectorstore, f"create_{target}_vectorstore", create_vectorstore)
+
+def test_load_index_sets_vectorstore_and_state(monkeypatch):
+    vs = FakeVectorstore()
+    set_loader(monkeypatch, "talent", lambda: vs)
+    mdlIndexLoader.load_index("talent")
+
+    assert vectorstore_global.talent_vectorstore is vs
+    status = mdlIndexLoader.index_status("talent")
+    assert status["state"] == "ready" and status["vectors"] == 3
+    assert mdlIndexLoader.require_vectorstore("talent") is vs
+
+def test_load_index_failure_is_reported(monkeypatch):
+    def fail():
+        raise OSError("index.faiss が壊れています")
+    set_loader(monkeypatch, "case", fail)
+    mdlIndexLoader.load_index("case")
+
+    status = mdlIndexLoader.index_status("case")
+    assert status["state"] == "failed"
+    assert "壊れています" in status["error"]
+    with pytest.raises(HTTPException) as error:
+        mdlIndexLoader.require_vectorstore("case")
+    assert error.value.status_code == 503
+    assert error.value.detail["state"] == "failed"
+
+def test_require_vectorstore_returns_503_with_retry_after_while_loading():
+    mdlIndexLoader._update("talent", state="loading")
+    with pytest.raises(HTTPException) as error:
+        mdlIndexLoader.require_vectorstore("talent")
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": str(mdlIndexLoader.RETRY_AFTER_SECONDS)}
+    assert error.value.detail["state"] == "loading"
+
+def test_require_vectorstore_waits_for_loading(monkeypatch):
+    monkeypatch.setenv("INDEX_WAIT_SECONDS", "5")
+    vs = FakeVectorstore()
+    release = threading.Event()
+
+    def slow_load():
+        release.wait(5)
+        return vs
+    set_loader(monkeypatch, "talent", slow_load)
+    mdlIndexLoader._update("talent", state="loading")
+    thread = threading.Thread(target=mdlIndexLoader.load_index, args=("talent",))
+    thread.start()
+    release.set()
+    assert mdlIndexLoader.require_vectorstore("talent") is vs
+    thread.join()
+
+def test_readiness_requires_all_indexes():
+    status, result = mdlIndexLoader.getReadiness()
+    assert status == 503 and json.loads(result)["ready"] is False
+
+    vectorstore_global.talent_vectorstore = FakeVectorstore()
+    vectorstore_global.case_vectorstore = FakeVectorstore()
+    status, result = mdlIndexLoader.getReadiness()
+    result = json.loads(result)
+    assert status == 200 and result["ready"] is True
+    assert result["indexes"]["case"]["vectors"] == 3
+
+def test_reload_vectorstore(monkeypatch):
+    loaded = threading.Event()
+    vs = FakeVectorstore()
+
+    def create_vectorstore():
+        loaded.set()
+        return vs
+    set_loader(monkeypatch, "talent", create_vectorstore)
+
+    assert mdlIndexLoader.reloadVectorstore("unknown")[0] == 404
+    status, _ = mdlIndexLoader.reloadVectorstore("talent")
+    assert status == 202
+    assert loaded.wait(5)
+    mdlIndexLoader._loaded["talent"].wait(5)
+    assert vectorstore_global.talent_vectorstore is vs
+
+    mdlIndexLoader._update("case", state="loading")
+    assert mdlIndexLoader.reloadVectorstore("case")[0] == 409
+
+def test_status_reports_loaded_version(monkeypatch):
+    vs = FakeVectorstore()
+    mdlVectorstore._index_version_cache[vs] = "20250101000000"
+    set_loader(monkeypatch, "talent", lambda: vs)
+    mdlIndexLoader.load_index("talent")
+
+    # ディスクの現在のバージョンではなく、このプロセスで読み込んだバージョンを返す
+    monkeypatch.setattr(mdlVectorstore, "current_version", lambda base_dir: "20990101000000")
+    assert mdlIndexLoader.index_status("talent")["version"] == "20250101000000"
+    vectorstore_global.case_vectorstore = FakeVectorstore()
+    result = json.loads(mdlIndexLoader.getReadiness()[1])
+    assert result["indexes"]["talent"]["version"] == "20250101000000"
+
+def test_load_vectorstore_records_version(tmp_path, fake_embeddings):
+    from langchain.docstore.document import Document
+    from langchain.vectorstores import FAISS
+    docs = [Document(page_content=f"人材{i}", metadata={"talent_id": i}) for i in range(1, 4)]
+    base_dir = str(tmp_path / "talent")
+    published = FAISS.from_documents(docs, fake_embeddings, ids=mdlVectorstore.make_document_ids(docs, "talent_id"))
+    first = mdlVectorstore.publish_vectorstore(published, base_dir, {"mode": "full"})
+    assert mdlVectorstore.index_version(published) == first
+
+    loaded = mdlVectorstore.load_vectorstore(base_dir)
+    second = mdlVectorstore.publish_vectorstore(published, base_dir, {"mode": "full"})
+    # 読み込んだ後に別のバージョンが保存されても、読み込んだバージョンのまま
+    assert mdlVectorstore.index_version(loaded) == first
+    assert mdlVectorstore.index_version(published) == second
+
+def test_load_index_waits_for_build_in_other_process(monkeypatch):
+    monkeypatch.setattr(mdlIndexLoader, "REBUILD_POLL_SECONDS", 0.05)
+    vs = FakeVectorstore()
+    loaded = threading.Event()
+
+    def create_vectorstore():
+        loaded.set()
+        return vs
+    set_loader(monkeypatch, "talent", create_vectorstore)
+
+    # 別のプロセスが作成中（ファイルロックを取得中）の間は、読み込み・生成を始めない
+    with mdlIndexLoader.rebuild_lock(mdlIndexLoader.TARGETS["talent"]) as acquired:
+        assert acquired
+        thread = threading.Thread(target=mdlIndexLoader.load_index, args=("talent",))
+        thread.start()
+        assert not loaded.wait(0.3)
+        assert mdlIndexLoader.index_status("talent")["state"] == "loading"
+    thread.join(5)
+    assert loaded.is_set()
+    assert vectorstore_global.talent_vectorstore is vs
@@ -0,0 +1,48 @@
+# インデックスの読み込みモード (VECTORSTORE_LOAD_MODE) と常駐メモリの計測のテスト
+import os
+import numpy as np
+import pytest
+from langchain.vectorstores import FAISS
+from modules import mdlVectorstore
+
+@pytest.fixture
+def base_dir(tmp_path, fake_embeddings):
+    vs = FAISS.from_texts(["営業改革の事例", "人事制度の事例", "物流最適化の事例"], fake_embeddings)
+    base_dir = str(tmp_path / "case")
+    mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full"})
+    return base_dir
+
+@pytest.mark.parametrize("value, expected", [(None, "memory"), ("mmap", "mmap"), ("MMAP", "mmap"), ("shared", "memory")])
+def test_load_mode(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("VECTORSTORE_LOAD_MODE", raising=False)
+    else:
+        monkeypatch.setenv("VECTORSTORE_LOAD_MODE", value)
+    assert mdlVectorstore.load_mode() == expected
+
+@pytest.mark.parametrize("mode", ["memory", "mmap"])
+def test_loaded_index_searches_in_both_modes(base_dir, monkeypatch, mode):
+    monkeypatch.setenv("VECTORSTORE_LOAD_MODE", mode)
+    vs = mdlVectorstore.load_vectorstore(base_dir)
+    assert vs.index.ntotal == 3
+    assert vs.similarity_search("人事制度の事例", k=1)[0].page_content == "人事制度の事例"
+
+def test_writable_load_can_be_modified_in_mmap_mode(base_dir, monkeypatch):
+    monkeypatch.setenv("VECTORSTORE_LOAD_MODE", "mmap")
+    vs = mdlVectorstore.load_vectorstore(base_dir, writable=True)
+    vs.index.add(np.zeros((1, vs.index.d), dtype="float32"))
+    assert vs.index.ntotal == 4
+    # ディスク上のインデックスは変わらない
+    assert mdlVectorstore.load_vectorstore(base_dir).index.ntotal == 3
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps"), reason="/proc/self/smaps が無い環境")
+def test_memory_report_counts_mapped_docstore(base_dir):
+    vs = mdlVectorstore.load_vectorstore(base_dir)
+    vs.similarity_search("営業", k=1)
+    index_dir = mdlVectorstore.current_index_dir(base_dir)
+    report = mdlVectorstore.memory_report(index_dir)
+    assert "docstore.bin" in report["mapped_files"]
+    assert report["mapped_rss_bytes"] > 0
+    assert report["mapped_pss_bytes"] <= report["mapped_rss_bytes"]
+    # memory モードでは index.faiss はヒープに読み込まれる
+    assert report["heap_bytes_estimate"] == os.path.getsize(os.path.join(index_dir, "index.faiss"))
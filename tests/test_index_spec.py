@@ -0,0 +1,80 @@
+# ANN インデックス仕様 (modules.mdlIndexSpec) のテスト
+import faiss
+import numpy as np
+import pytest
+from langchain.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from modules import mdlVectorstore
+from modules.mdlIndexSpec import parse_index_spec, resolve_factory, supports_delete, requires_training, build_index, probe_vector
+
+@pytest.mark.parametrize("spec, expected", [
+    (None, ("Flat", "")),
+    ("", ("Flat", "")),
+    ("Flat", ("Flat", "")),
+    ("IVF1024,Flat;nprobe=16", ("IVF1024,Flat", "nprobe=16")),
+    (" HNSW32 ; efSearch = 64 ", ("HNSW32", "efSearch=64")),
+    ("IVF256,PQ64;nprobe=8,efSearch=32", ("IVF256,PQ64", "nprobe=8,efSearch=32")),
+])
+def test_parse_index_spec(spec, expected):
+    assert parse_index_spec(spec) == expected
+
+@pytest.mark.parametrize("spec", [";nprobe=16", "IVF1024,Flat;nprobe", "IVF1024,Flat;nprobe=abc", "HNSW32;efSearch=64;x=1"])
+def test_parse_index_spec_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_index_spec(spec)
+
+@pytest.mark.parametrize("factory, n_train, expected", [
+    ("Flat", 10, "Flat"),
+    # IVF: クラスタあたり 39 件以上となるよう nlist を下げる（最低 1）
+    ("IVF1024,Flat", 39 * 100, "IVF100,Flat"),
+    ("IVF1024,Flat", 10, "IVF1,Flat"),
+    ("IVF64,Flat", 39 * 100, "IVF64,Flat"),
+    # PQ: 2^nbits 件に満たない場合は Flat
+    ("PQ64", 255, "Flat"),
+    ("PQ64", 256, "PQ64"),
+    ("PQ16x4", 16, "PQ16x4"),
+    ("PQ16x4", 15, "Flat"),
+    # IVF と PQ の組み合わせ
+    ("IVF1024,PQ64", 200, "IVF5,Flat"),
+    # PCA: 出力次元数を学習データの件数まで下げる
+    ("PCA256,Flat", 100, "PCA100,Flat"),
+    ("PCAR256,SQ8", 1000, "PCAR256,SQ8"),
+])
+def test_resolve_factory(factory, n_train, expected):
+    assert resolve_factory(factory, n_train) == expected
+
+def test_capabilities():
+    assert supports_delete("Flat") and supports_delete("SQ8")
+    assert not supports_delete("IVF16,Flat;nprobe=4")
+    assert not supports_delete("HNSW32")
+    assert not requires_training("Flat") and not requires_training("HNSW32")
+    assert requires_training("SQ8") and requires_training("PCA64,Flat") and requires_training("IVF16,Flat")
+
+def test_build_index_applies_search_params_with_few_vectors():
+    vectors = np.random.default_rng(0).random((100, 16), dtype=np.float32)
+    index = build_index("IVF1024,Flat;nprobe=4", vectors)
+    assert index.is_trained
+    assert index.nlist == 2
+    assert index.nprobe == 4
+    index.add(vectors)
+    np.testing.assert_allclose(probe_vector(index), vectors[0])
+
+def test_resolve_index_spec_order(tmp_path, monkeypatch, fake_embeddings):
+    base_dir = str(tmp_path)
+    monkeypatch.delenv("CASE_INDEX_SPEC", raising=False)
+    assert mdlVectorstore.resolve_index_spec("case", base_dir) == "Flat"
+    mdlVectorstore.publish_vectorstore(FAISS.from_texts(["a"], fake_embeddings), base_dir, {"index_spec": "HNSW16"})
+    assert mdlVectorstore.resolve_index_spec("case", base_dir) == "HNSW16"
+    monkeypatch.setenv("CASE_INDEX_SPEC", "IVF8,Flat")
+    assert mdlVectorstore.resolve_index_spec("case", base_dir) == "IVF8,Flat"
+    assert mdlVectorstore.resolve_index_spec("case", base_dir, "Flat") == "Flat"
+
+def test_loaded_index_reapplies_search_params(tmp_path, fake_embeddings):
+    texts = [f"事例 {i}" for i in range(100)]
+    vectors = np.array(fake_embeddings.embed_documents(texts), dtype="float32")
+    vs = FAISS(fake_embeddings, build_index("IVF4,Flat;nprobe=3", vectors), InMemoryDocstore(), {})
+    vs.add_embeddings(list(zip(texts, vectors.tolist())))
+    mdlVectorstore.publish_vectorstore(vs, str(tmp_path), {"index_spec": "IVF4,Flat;nprobe=3"})
+
+    loaded = mdlVectorstore.load_vectorstore(str(tmp_path))
+    assert faiss.extract_index_ivf(loaded.index).nprobe == 3
@@ -0,0 +1,110 @@
+# インデックスのバージョン管理 (modules.mdlIndexVersion) とロールバックのテスト
+import json
+import os
+import pytest
+import vectorstore_global
+from langchain.vectorstores import FAISS
+from modules import mdlVectorstore
+from modules.mdlIndexVersion import (
+    LEGACY_VERSION, read_manifest, current_version, current_index_dir, version_dir, publish_version, rollback_version, rebuild_lock
+)
+
+def publish(base_dir: str, version: str) -> dict:
+    os.makedirs(version_dir(base_dir, version))
+    return publish_version(base_dir, version, {"vectors": 1})
+
+def test_no_index(tmp_path):
+    assert current_version(str(tmp_path)) is None
+    assert current_index_dir(str(tmp_path)) is None
+    assert rollback_version(str(tmp_path)) is None
+
+def test_legacy_index_is_treated_as_a_version(tmp_path):
+    base_dir = str(tmp_path)
+    (tmp_path / "index.faiss").write_bytes(b"")
+    assert current_version(base_dir) == LEGACY_VERSION
+    assert current_index_dir(base_dir) == base_dir
+
+    publish(base_dir, "v1")
+    assert read_manifest(base_dir)["previous"] == [LEGACY_VERSION]
+    # 旧形式のインデックスに戻せる
+    assert rollback_version(base_dir) == LEGACY_VERSION
+    assert current_index_dir(base_dir) == base_dir
+
+def test_publish_keeps_previous_versions_up_to_limit(tmp_path, monkeypatch):
+    monkeypatch.setenv("INDEX_KEEP_VERSIONS", "2")
+    base_dir = str(tmp_path)
+    for version in ("v1", "v2", "v3", "v4"):
+        manifest = publish(base_dir, version)
+
+    assert manifest["current"] == "v4"
+    assert manifest["previous"] == ["v3", "v2"]
+    assert sorted(manifest["versions"]) == ["v2", "v3", "v4"]
+    assert json.loads((tmp_path / "manifest.json").read_text(encoding="utf-8")) == manifest
+    # 保持数を超えたバージョンのディレクトリは削除される
+    assert not os.path.exists(version_dir(base_dir, "v1"))
+    assert all(os.path.exists(version_dir(base_dir, v)) for v in ("v2", "v3", "v4"))
+
+def test_rollback_switches_to_previous_version(tmp_path):
+    base_dir = str(tmp_path)
+    for version in ("v1", "v2", "v3"):
+        publish(base_dir, version)
+
+    assert rollback_version(base_dir) == "v2"
+    manifest = read_manifest(base_dir)
+    assert manifest["current"] == "v2"
+    # ロールバック前のバージョンは削除せずに末尾へ残す
+    assert manifest["previous"] == ["v1", "v3"]
+    assert current_index_dir(base_dir) == version_dir(base_dir, "v2")
+
+    assert rollback_version(base_dir) == "v1"
+    assert rollback_version(base_dir) == "v3"
+
+def test_rollback_refuses_missing_directory(tmp_path):
+    base_dir = str(tmp_path)
+    publish(base_dir, "v1")
+    publish(base_dir, "v2")
+    os.rmdir(version_dir(base_dir, "v1"))
+    assert rollback_version(base_dir) is None
+    assert current_version(base_dir) == "v2"
+
+def test_publish_vectorstore_discards_version_that_fails_validation(tmp_path, monkeypatch, fake_embeddings):
+    base_dir = str(tmp_path)
+    vs = FAISS.from_texts(["営業改革"], fake_embeddings)
+    first = mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full"})
+
+    def broken(index_dir, expected_vectors):
+        raise ValueError("検証に失敗しました")
+    monkeypatch.setattr(mdlVectorstore, "validate_vectorstore", broken)
+    with pytest.raises(ValueError):
+        mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full"})
+
+    assert current_version(base_dir) == first
+    assert os.listdir(os.path.join(base_dir, "versions")) == [first]
+
+def test_rollback_vectorstore_swaps_loaded_index(tmp_path, monkeypatch, fake_embeddings):
+    base_dir = str(tmp_path / "talent")
+    monkeypatch.setattr(mdlVectorstore, "TALENT_INDEX_DIR", base_dir)
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", None)
+    monkeypatch.setattr(vectorstore_global, "loaded_versions", {"talent": None, "case": None})
+    first = mdlVectorstore.publish_vectorstore(FAISS.from_texts(["営業改革"], fake_embeddings), base_dir, {})
+    mdlVectorstore.publish_vectorstore(FAISS.from_texts(["営業改革", "人事制度"], fake_embeddings), base_dir, {})
+
+    status, result = mdlVectorstore.rollbackVectorstore("talent")
+    assert status == 200 and json.loads(result)["version"] == first
+    assert vectorstore_global.talent_vectorstore.index.ntotal == 1
+
+    assert mdlVectorstore.rollbackVectorstore("unknown")[0] == 404
+
+def test_rollback_vectorstore_refuses_while_rebuilding(tmp_path, monkeypatch, fake_embeddings):
+    base_dir = str(tmp_path / "case")
+    monkeypatch.setattr(mdlVectorstore, "CASE_INDEX_DIR", base_dir)
+    monkeypatch.setattr(vectorstore_global, "case_vectorstore", None)
+    mdlVectorstore.publish_vectorstore(FAISS.from_texts(["営業改革"], fake_embeddings), base_dir, {})
+    second = mdlVectorstore.publish_vectorstore(FAISS.from_texts(["営業改革", "人事制度"], fake_embeddings), base_dir, {})
+
+    # 別のプロセスが再作成中（ファイルロックを取得中）の場合は manifest を切り替えない
+    with rebuild_lock(base_dir) as acquired:
+        assert acquired
+        assert mdlVectorstore.rollbackVectorstore("case")[0] == 409
+    assert current_version(base_dir) == second
+    assert vectorstore_global.case_vectorstore is None
@@ -0,0 +1,139 @@
+# 文字 bigram の語彙インデックス (modules.mdlLexical) とハイブリッド検索のテスト
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlVectorstore
+from modules.mdlLexical import LexicalIndex, has_lexical_index, tokenize
+
+def test_tokenize_normalizes_and_splits_bigrams():
+    assert tokenize("ＳａｌｅｓForce") == ["sa", "al", "le", "es", "sf", "fo", "or", "rc", "ce"]
+    assert tokenize("営業DX・人事") == ["営業", "業d", "dx", "人事"]
+    assert tokenize("a b") == ["a", "b"]
+
+def test_score_ranks_matching_rows():
+    index = LexicalIndex.build(["営業改革の経験", "人事制度の設計", "営業と人事の両方"])
+    scores, coverage = index.score("営業改革")
+    assert scores[0] > scores[2] > 0
+    assert scores[1] == 0
+    assert coverage[0] == pytest.approx(1.0)
+    assert 0 < coverage[2] < 1
+    assert coverage[1] == 0
+
+def test_score_coverage_drops_for_unknown_terms():
+    index = LexicalIndex.build(["営業改革の経験", "人事制度の設計"])
+    _, known = index.score("営業")
+    _, partly_unknown = index.score("営業 物流")
+    assert known[0] == pytest.approx(1.0)
+    assert 0 < partly_unknown[0] < 1
+
+def test_score_empty_query_and_index():
+    scores, coverage = LexicalIndex.build(["営業"]).score("  ")
+    assert not scores.any() and not coverage.any()
+    scores, _ = LexicalIndex.build([]).score("営業")
+    assert len(scores) == 0
+
+def test_save_and_load_keep_scores(tmp_path):
+    index = LexicalIndex.build(["営業改革の経験", "人事制度の設計", "営業と人事の両方"])
+    index.save(str(tmp_path))
+    loaded = LexicalIndex.load(str(tmp_path))
+    np.testing.assert_allclose(loaded.score("営業 人事")[0], index.score("営業 人事")[0])
+
+@pytest.fixture
+def case_vs(monkeypatch, fake_embeddings):
+    monkeypatch.delenv("RETRIEVAL_MODE", raising=False)
+    # 行番号 i が case_id i + 1 の Document
+    texts = ["営業改革の事例", "人事制度の事例", "物流最適化の事例", "会計システムの事例"]
+    docs = [Document(page_content=text, metadata={"case_id": i + 1}) for i, text in enumerate(texts)]
+    return FAISS.from_documents(docs, fake_embeddings, ids=mdlVectorstore.make_document_ids(docs, "case_id"))
+
+def stub_vector_ranking(monkeypatch, rows: list[int]):
+    """
+    ベクトル検索の順位を rows（良い順の行番号）に固定する
+    """
+    def search_owners(vs, vectors, k, owner_key, allowed=None):
+        return [[(row, float(rank)) for rank, row in enumerate(rows) if allowed is None or row in allowed][:k]]
+    monkeypatch.setattr(mdlVectorstore, "search_owners", search_owners)
+
+def case_ids(docs: list[Document]) -> list[int]:
+    return [doc.metadata["case_id"] for doc in docs]
+
+def test_hybrid_search_fuses_rankings_with_rrf(case_vs, monkeypatch):
+    monkeypatch.setenv("LEXICAL_SKIP_COVERAGE", "2")
+    # ベクトル検索: 3, 1, 2, 4 の順 / 語彙検索: 1 のみ一致
+    stub_vector_ranking(monkeypatch, [2, 0, 1, 3])
+    docs = mdlVectorstore.hybrid_search(case_vs, "営業改革", 3, "case_id")
+    # 1: 1/(60+2) + 1/(60+1) > 3: 1/(60+1) > 2: 1/(60+3)
+    assert case_ids(docs) == [1, 3, 2]
+
+def test_hybrid_search_prefers_vector_rank_on_ties(case_vs, monkeypatch):
+    monkeypatch.setenv("LEXICAL_SKIP_COVERAGE", "2")
+    # ベクトル検索の 1 位 (4) と語彙検索の 1 位 (2) は同点
+    stub_vector_ranking(monkeypatch, [3])
+    docs = mdlVectorstore.hybrid_search(case_vs, "人事制度", 2, "case_id")
+    assert case_ids(docs) == [4, 2]
+
+def test_hybrid_search_filters_owners(case_vs, monkeypatch):
+    monkeypatch.setenv("LEXICAL_SKIP_COVERAGE", "2")
+    stub_vector_ranking(monkeypatch, [2, 0, 1, 3])
+    docs = mdlVectorstore.hybrid_search(case_vs, "営業改革", 3, "case_id", owner_ids=[2, 4])
+    assert case_ids(docs) == [2, 4]
+    assert mdlVectorstore.hybrid_search(case_vs, "営業改革", 3, "case_id", owner_ids=[99]) == []
+
+def test_hybrid_search_skips_embedding_when_lexical_covers_query(case_vs, monkeypatch):
+    monkeypatch.setenv("LEXICAL_SKIP_COVERAGE", "0.9")
+
+    def fail(*args, **kwargs):
+        pytest.fail("語彙検索で十分な場合にベクトル検索を行いました")
+    monkeypatch.setattr(mdlVectorstore, "search_owners", fail)
+    docs = mdlVectorstore.hybrid_search(case_vs, "物流最適化", 1, "case_id")
+    assert case_ids(docs) == [3]
+
+def test_vector_mode_skips_lexical_index(case_vs, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_MODE", "vector")
+    stub_vector_ranking(monkeypatch, [2, 0, 1, 3])
+
+    def fail(vs):
+        pytest.fail("RETRIEVAL_MODE=vector で語彙検索を行いました")
+    monkeypatch.setattr(mdlVectorstore, "lexical_index", fail)
+    docs = mdlVectorstore.hybrid_search(case_vs, "営業改革", 2, "case_id")
+    assert case_ids(docs) == [3, 1]
+
+def test_published_index_keeps_lexical_index(case_vs, tmp_path):
+    base_dir = str(tmp_path / "case")
+    mdlVectorstore.publish_vectorstore(case_vs, base_dir, {"mode": "full"})
+    assert has_lexical_index(mdlVectorstore.current_index_dir(base_dir))
+
+    loaded = mdlVectorstore.load_vectorstore(base_dir)
+    np.testing.assert_allclose(
+        mdlVectorstore.lexical_index(loaded).score("物流")[0],
+        mdlVectorstore.lexical_index(case_vs).score("物流")[0],
+    )
+
+def test_hybrid_search_uses_lexical_query(case_vs, monkeypatch):
+    monkeypatch.setenv("LEXICAL_SKIP_COVERAGE", "2")
+    stub_vector_ranking(monkeypatch, [2, 0, 1, 3])
+    embedded = []
+    embeddings_class = type(case_vs.embedding_function)
+    original_embed_query = embeddings_class.embed_query
+    monkeypatch.setattr(embeddings_class, "embed_query", lambda self, text: embedded.append(text) or original_embed_query(self, text))
+
+    # プロンプトの指示文（人事制度・物流）は語彙検索に使わない
+    prompt = "あなたは人事制度と物流最適化に詳しいコンサルタントです。営業改革の事例を探してください"
+    docs = mdlVectorstore.hybrid_search(case_vs, prompt, 3, "case_id", lexical_query="営業改革")
+    assert case_ids(docs) == [1, 3, 2]
+    assert embedded == [prompt]
+
+def test_retrieve_cases_builds_lexical_query_from_inputs(monkeypatch):
+    from models.params import dxAdviceData
+    from modules import mdlDxAdvice
+    calls = []
+    monkeypatch.setattr(mdlVectorstore, "hybrid_search", lambda *args, **kwargs: calls.append((args, kwargs)) or [])
+
+    data = dxAdviceData(timing="中期計画の策定", domain="業務効率化", free_word=" 受発注の属人化 ")
+    prompt = mdlDxAdvice.build_chatgpt_advice_and_rag_prompt(data)
+    assert mdlDxAdvice.retrieve_cases(data, object(), prompt) == []
+    (args, kwargs), = calls
+    assert args[1] == prompt
+    assert kwargs["lexical_query"] == "中期計画の策定 業務効率化 受発注の属人化"
+    assert mdlDxAdvice.build_lexical_query(dxAdviceData(domain="業務効率化", free_word="  ")) == "業務効率化"
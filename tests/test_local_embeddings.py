@@ -0,0 +1,56 @@
+# ローカル埋め込み (modules.mdlEmbedding.LocalHashEmbeddings) と埋め込みモデルの整合性チェックのテスト
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlEmbedding, mdlVectorstore
+from modules.mdlEmbedding import LocalHashEmbeddings, can_embed_documents, embedding_model_name, get_base_embeddings
+
+def test_local_embeddings_are_deterministic_and_normalized():
+    embeddings = LocalHashEmbeddings(dim=64)
+    first = embeddings.embed_query("営業改革の経験があります")
+    second = LocalHashEmbeddings(dim=64).embed_documents(["営業改革の経験があります"])[0]
+
+    assert len(first) == 64
+    assert first == second
+    assert np.linalg.norm(first) == pytest.approx(1.0, abs=1e-5)
+    # 空文字列はゼロベクトル
+    assert not any(embeddings.embed_query(""))
+
+def test_local_embeddings_rank_overlapping_text_closer():
+    embeddings = LocalHashEmbeddings()
+    query = np.array(embeddings.embed_query("営業改革"))
+    near = np.array(embeddings.embed_query("営業改革の経験があります"))
+    far = np.array(embeddings.embed_query("データ分析基盤を構築しました"))
+    assert query @ near > query @ far
+    # NFKC 正規化・小文字化により全角・大文字の違いは無視される
+    assert embeddings.embed_query("ＤＸ推進") == embeddings.embed_query("dx推進")
+
+def test_provider_selection(monkeypatch):
+    monkeypatch.delenv("DO_GPT", raising=False)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "local")
+    monkeypatch.setenv("LOCAL_EMBEDDING_DIM", "32")
+    base = get_base_embeddings()
+    assert isinstance(base, LocalHashEmbeddings) and base.dim == 32
+    assert embedding_model_name(base) == "local-hash-ngram1-3-32"
+    assert can_embed_documents()
+
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "unknown")
+    assert mdlEmbedding.embedding_provider() == "openai"
+    assert not can_embed_documents()
+    monkeypatch.setenv("DO_GPT", "TRUE")
+    assert can_embed_documents()
+
+def test_load_refuses_index_from_other_model(tmp_path, monkeypatch, fake_embeddings):
+    base_dir = str(tmp_path / "talent")
+    docs = [Document(page_content="【ID】1\n営業改革の経験があります", metadata={"talent_id": 1})]
+    vs = FAISS.from_documents(docs, fake_embeddings, ids=mdlVectorstore.make_document_ids(docs, "talent_id"))
+    mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full"})
+    assert mdlVectorstore.version_info(base_dir)["embedding_model"] == embedding_model_name(fake_embeddings)
+    assert mdlVectorstore.load_vectorstore(base_dir) is not None
+
+    local = LocalHashEmbeddings(dim=16)
+    monkeypatch.setattr(mdlVectorstore, "get_base_embeddings", lambda: local)
+    monkeypatch.setattr(mdlVectorstore, "get_embeddings", lambda: local)
+    with pytest.raises(ValueError):
+        mdlVectorstore.load_vectorstore(base_dir)
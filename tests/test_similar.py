@@ -0,0 +1,84 @@
+# 関連事例・関連人材の取得 (modules.mdlVectorstore.similar_documents / modules.mdlRecommend) のテスト
+import json
+import pytest
+import vectorstore_global
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlRecommend
+from modules.mdlVectorstore import make_document_ids, similar_documents
+
+def owner_document(owner_key: str, owner_id: int, text: str) -> Document:
+    return Document(page_content=f"【ID】{owner_id}\n【経歴】{text}", metadata={owner_key: owner_id})
+
+TALENT_DOCS = [
+    owner_document("talent_id", 1, "営業改革の経験があります"),
+    owner_document("talent_id", 2, "データ分析基盤を構築しました"),
+    owner_document("talent_id", 3, "人事制度の設計を担当しました"),
+]
+CASE_DOCS = [
+    owner_document("case_id", 10, "営業組織の改革事例"),
+    owner_document("case_id", 20, "データ活用の事例"),
+    # 事例20 は2件の Document に分かれている
+    Document(page_content=TALENT_DOCS[2].page_content, metadata={"case_id": 20}),
+    owner_document("case_id", 30, "人事評価の見直し事例"),
+]
+
+class NoEmbeddings:
+    """埋め込み API を呼び出した場合に失敗させる"""
+    def embed_documents(self, texts):
+        pytest.fail("埋め込みが呼び出されました")
+
+    def embed_query(self, text):
+        pytest.fail("埋め込みが呼び出されました")
+
+@pytest.fixture
+def stores(monkeypatch, fake_embeddings):
+    talent_vs = FAISS.from_documents(TALENT_DOCS, fake_embeddings, ids=make_document_ids(TALENT_DOCS, "talent_id"))
+    case_vs = FAISS.from_documents(CASE_DOCS, fake_embeddings, ids=make_document_ids(CASE_DOCS, "case_id"))
+    talent_vs.embedding_function = NoEmbeddings()
+    case_vs.embedding_function = NoEmbeddings()
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", talent_vs)
+    monkeypatch.setattr(vectorstore_global, "case_vectorstore", case_vs)
+    monkeypatch.setattr(vectorstore_global, "case_talent_affinity", None)
+    return talent_vs, case_vs
+
+def test_similar_documents_excludes_self_and_dedupes_owners(stores):
+    _, case_vs = stores
+    hits = similar_documents(case_vs, "case_id", 10, case_vs, "case_id", 3)
+    owners = [doc.metadata["case_id"] for doc, _ in hits]
+    assert sorted(owners) == [20, 30]
+    assert [distance for _, distance in hits] == sorted(distance for _, distance in hits)
+
+def test_similar_documents_across_types(stores):
+    talent_vs, case_vs = stores
+    # 人材3 の本文は事例20 の2件目の Document と一致する
+    hits = similar_documents(talent_vs, "talent_id", 3, case_vs, "case_id", 1)
+    assert [doc.metadata["case_id"] for doc, _ in hits] == [20]
+    assert hits[0][1] == pytest.approx(0, abs=1e-4)
+
+    hits = similar_documents(case_vs, "case_id", 20, talent_vs, "talent_id", 3)
+    assert [doc.metadata["talent_id"] for doc, _ in hits][0] == 3
+    assert len(hits) == 3
+
+def test_similar_documents_unknown_owner(stores):
+    _, case_vs = stores
+    assert similar_documents(case_vs, "case_id", 99, case_vs, "case_id", 3) is None
+
+def test_get_similar_endpoints(stores):
+    status, result = mdlRecommend.getSimilarTalents(case_id=20, cnt=2)
+    assert status == 200
+    result = json.loads(result)
+    assert len(result) == 2 and result[0]["id"] == "3"
+
+    status, result = mdlRecommend.getSimilarCases(talent_id=3, cnt=1)
+    assert status == 200
+    assert len(json.loads(result)) == 1
+
+    status, _ = mdlRecommend.getSimilarCases(case_id=99)
+    assert status == 404
+
+def test_get_similar_rejects_invalid_requests(stores):
+    assert mdlRecommend.getSimilarCases()[0] == 400
+    assert mdlRecommend.getSimilarCases(case_id=10, talent_id=1)[0] == 400
+    assert mdlRecommend.getSimilarTalents(case_id=10, cnt=0)[0] == 400
+    assert mdlRecommend.getSimilarTalents(case_id=10, cnt=mdlRecommend.MAX_SIMILAR_COUNT + 1)[0] == 400
@@ -0,0 +1,74 @@
+# 戦略文書の生成結果キャッシュ (modules.mdlStrategyCache) のテスト
+import pytest
+from models.params import userData
+from modules import mdlStrategy, mdlStrategyCache
+from modules.mdlStrategyCache import StrategyCache, make_key, normalize_prompt
+
+def test_normalize_prompt():
+    assert normalize_prompt("  業界：製造業\n\n  規模：１００名 ") == "業界:製造業 規模:100名"
+
+def test_key_ignores_whitespace_and_width_differences():
+    assert make_key("gpt-4o", "業界：製造業\n規模：１００名") == make_key("gpt-4o", " 業界:製造業  規模:100名 ")
+    assert make_key("gpt-4o", "業界:製造業") != make_key("gpt-4o-mini", "業界:製造業")
+    assert make_key("gpt-4o", "業界:製造業") != make_key("gpt-4o", "業界:小売業")
+
+def test_key_changes_with_prompt_version(monkeypatch):
+    key = make_key("gpt-4o", "業界:製造業")
+    monkeypatch.setattr(mdlStrategyCache, "PROMPT_VERSION", mdlStrategyCache.PROMPT_VERSION + 1)
+    assert make_key("gpt-4o", "業界:製造業") != key
+
+def test_put_and_get(tmp_path):
+    cache = StrategyCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_size=10)
+    assert cache.get("gpt-4o", "業界:製造業") is None
+    cache.put("gpt-4o", "業界:製造業", "# 戦略")
+    assert cache.get("gpt-4o", " 業界:製造業\n") == "# 戦略"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+def test_expired_entries_are_not_returned(tmp_path, monkeypatch):
+    cache = StrategyCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_size=10)
+    now = 1_000_000.0
+    monkeypatch.setattr(mdlStrategyCache.time, "time", lambda: now)
+    cache.put("gpt-4o", "古い", "# 古い戦略")
+    now += 61
+    assert cache.get("gpt-4o", "古い") is None
+    cache.put("gpt-4o", "新しい", "# 新しい戦略")
+    assert cache.stats()["entries"] == 1
+
+def test_size_limit_evicts_least_recently_used(tmp_path, monkeypatch):
+    cache = StrategyCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=600, max_size=2)
+    clock = iter(range(1_000_000, 1_000_100))
+    monkeypatch.setattr(mdlStrategyCache.time, "time", lambda: float(next(clock)))
+    cache.put("gpt-4o", "a", "A")
+    cache.put("gpt-4o", "b", "B")
+    assert cache.get("gpt-4o", "a") == "A"
+    cache.put("gpt-4o", "c", "C")
+    assert cache.get("gpt-4o", "b") is None
+    assert cache.get("gpt-4o", "a") == "A"
+    assert cache.get("gpt-4o", "c") == "C"
+
+@pytest.mark.parametrize("ttl_seconds, max_size", [(0, 10), (60, 0)])
+def test_disabled_cache(tmp_path, ttl_seconds, max_size):
+    cache = StrategyCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=ttl_seconds, max_size=max_size)
+    cache.put("gpt-4o", "業界:製造業", "# 戦略")
+    assert not cache.enabled
+    assert cache.get("gpt-4o", "業界:製造業") is None
+
+def test_stream_doc_uses_cached_document(tmp_path, monkeypatch):
+    monkeypatch.setenv("DO_GPT", "TRUE")
+    cache = StrategyCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_size=10)
+    cache.put(mdlStrategy.STRATEGY_MODEL, "prompt", "# 戦略\n本文")
+    monkeypatch.setattr(mdlStrategy, "get_strategy_cache", lambda: cache)
+    saved = []
+    monkeypatch.setattr(mdlStrategy.crud, "insert_t_document", lambda *args: (saved.append(args[2]) or 200, "5"))
+
+    events = list(mdlStrategy.streamDoc(userData(search_id=1, search_id_sub=1), "prompt"))
+    assert saved == ["# 戦略\n本文"]
+    assert events[-1] == mdlStrategy.sse_event("done", {"document_id": 5, "cached": True})
+
+def test_regenerate_bypasses_cache(tmp_path, monkeypatch):
+    cache = StrategyCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_size=10)
+    cache.put(mdlStrategy.STRATEGY_MODEL, "prompt", "# 戦略")
+    monkeypatch.setattr(mdlStrategy, "get_strategy_cache", lambda: cache)
+    assert mdlStrategy.lookup_cached_doc("prompt", regenerate=False) == "# 戦略"
+    assert mdlStrategy.lookup_cached_doc("prompt", regenerate=True) is None
@@ -0,0 +1,119 @@
+# 戦略文書のストリーミング (modules.mdlStrategy.StrategyStreamFilter) のテスト
+import json
+import pytest
+from models.params import userData
+from modules import mdlStrategy
+from modules.mdlStrategy import StrategyStreamFilter, START_MARKER, END_MARKER
+
+OUTPUT = f"前置きの説明\n{START_MARKER}\n# 戦略\n本文です。<<注記>>\n{END_MARKER}\n後書き"
+DOCUMENT = "# 戦略\n本文です。<<注記>>"
+
+def feed_chunks(stream_filter: StrategyStreamFilter, chunks: list[str]) -> str:
+    out = "".join(stream_filter.feed(chunk) for chunk in chunks)
+    return out + stream_filter.finish()
+
+def split_every(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, len(OUTPUT)])
+def test_markers_split_across_chunks(size):
+    stream_filter = StrategyStreamFilter()
+    out = feed_chunks(stream_filter, split_every(OUTPUT, size))
+    assert out.rstrip() == DOCUMENT
+    assert stream_filter.document() == DOCUMENT
+    assert stream_filter.raw == OUTPUT
+
+@pytest.mark.parametrize("position", range(1, len(START_MARKER)))
+def test_start_marker_split_at_every_position(position):
+    text = f"前置き{START_MARKER}本文{END_MARKER}"
+    cut = len("前置き") + position
+    stream_filter = StrategyStreamFilter()
+    assert stream_filter.feed(text[:cut]) == ""
+    assert feed_chunks(stream_filter, [text[cut:]]) == "本文"
+
+@pytest.mark.parametrize("position", range(1, len(END_MARKER)))
+def test_end_marker_is_never_emitted(position):
+    text = f"{START_MARKER}本文{END_MARKER}後書き"
+    cut = len(START_MARKER) + len("本文") + position
+    stream_filter = StrategyStreamFilter()
+    emitted = [stream_filter.feed(text[:cut]), stream_filter.feed(text[cut:]), stream_filter.finish()]
+    assert "".join(emitted) == "本文"
+    assert all("<" not in chunk for chunk in emitted)
+
+def test_without_start_marker_returns_whole_output():
+    stream_filter = StrategyStreamFilter()
+    assert feed_chunks(stream_filter, ["マーカーの", "無い出力"]) == "マーカーの無い出力"
+    assert stream_filter.document() == "マーカーの無い出力"
+
+def test_missing_end_marker_flushes_pending_text():
+    stream_filter = StrategyStreamFilter()
+    out = feed_chunks(stream_filter, [START_MARKER, "本文<<END"])
+    assert out == "本文<<END"
+
+def parse_events(events: list[str]) -> list[tuple[str, dict]]:
+    parsed = []
+    for event in events:
+        name, data = event.strip().split("\n")
+        parsed.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return parsed
+
+def test_stream_doc_sends_deltas_and_saves_document(monkeypatch):
+    monkeypatch.delenv("DO_GPT", raising=False)
+    monkeypatch.setenv("SAMPLE_DOC", OUTPUT)
+    saved = []
+
+    def insert_t_document(search_id, search_id_sub, document):
+        saved.append((search_id, search_id_sub, document))
+        return 200, json.dumps(7)
+    monkeypatch.setattr(mdlStrategy.crud, "insert_t_document", insert_t_document)
+
+    events = parse_events(list(mdlStrategy.streamDoc(userData(search_id=1, search_id_sub=2), "prompt")))
+    assert events[-1] == ("done", {"document_id": 7})
+    # GPT を呼び出さない場合は createDoc と同じく SAMPLE_DOC をそのまま登録する
+    assert "".join(data["text"] for name, data in events if name == "delta") == OUTPUT
+    assert saved == [(1, 2, OUTPUT)]
+
+def test_custom_markers():
+    stream_filter = StrategyStreamFilter("<<START_ADVICE>>", "<<END_ADVICE>>")
+    out = feed_chunks(stream_filter, split_every(f"x<<START_ADVICE>>助言<<END_ADVICE>>{START_MARKER}", 4))
+    assert out == "助言"
+
+class DisconnectingRequest:
+    """
+    is_disconnected が after 回目の呼び出しから True を返すリクエスト
+    """
+
+    def __init__(self, after: int):
+        self.after = after
+        self.calls = 0
+
+    async def is_disconnected(self) -> bool:
+        self.calls += 1
+        return self.calls > self.after
+
+def test_stream_until_disconnected_closes_generator():
+    import asyncio
+    from modules.mdlStrategy import stream_until_disconnected
+    closed = []
+
+    def events():
+        try:
+            yield from (f"event-{i}" for i in range(100))
+        finally:
+            closed.append(True)
+
+    async def collect():
+        return [event async for event in stream_until_disconnected(DisconnectingRequest(3), events())]
+
+    assert asyncio.run(collect()) == ["event-0", "event-1", "event-2"]
+    assert closed == [True]
+
+def test_stream_doc_reports_insert_failure(monkeypatch):
+    monkeypatch.delenv("DO_GPT", raising=False)
+    monkeypatch.setenv("SAMPLE_DOC", OUTPUT)
+    monkeypatch.setattr(
+        mdlStrategy.crud, "insert_t_document", lambda *args: (500, json.dumps({"error": "Exception occurred"}))
+    )
+    events = parse_events(list(mdlStrategy.streamDoc(userData(search_id=1, search_id_sub=2), "prompt")))
+    assert events[-1][0] == "error"
+    assert events[-1][1]["details"] == {"error": "Exception occurred"}
@@ -0,0 +1,98 @@
+# インデックス作成時の DB 読み込み・埋め込みのバッチ処理
+# (modules.mdlVectorstore.iter_pages / iter_visible_rows / stream_documents_to_vectorstore) のテスト
+import pytest
+from langchain.docstore.document import Document
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db_control.mymodels import Base, m_case
+from modules import mdlVectorstore
+from modules.mdlIndexSpec import requires_training
+from modules.mdlVectorstore import iter_case_documents, iter_pages, iter_visible_rows, stream_documents_to_vectorstore
+
+@pytest.fixture(autouse=True)
+def batch_env(monkeypatch):
+    monkeypatch.setenv("EXTRACT_BATCH_SIZE", "2")
+    monkeypatch.delenv("CASE_CHUNK_SIZE", raising=False)
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[m_case.__table__])
+    session = sessionmaker(bind=engine)()
+    # display_order は case_id の逆順、case_id 3 は非表示
+    for case_id in range(1, 6):
+        session.add(m_case(
+            case_id=case_id, case_name=f"事例{case_id}", case_summary="概要", company_summary="企業",
+            initiative_summary="取り組み", issue_background="課題", solution_method="解決",
+            display_order=10 - case_id, is_visible=case_id != 3,
+        ))
+    session.commit()
+    yield session
+    session.close()
+
+def case_documents(count: int) -> list[Document]:
+    return [Document(page_content=f"【ID】{i}\n事例{i}", metadata={"case_id": i}) for i in range(1, count + 1)]
+
+def test_iter_pages():
+    assert list(iter_pages(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_pages([], 2)) == []
+
+def test_iter_visible_rows_pages_in_display_order(session):
+    queries = []
+    original_query = session.query
+
+    def counting_query(*args, **kwargs):
+        queries.append(args)
+        return original_query(*args, **kwargs)
+    session.query = counting_query
+
+    rows = iter_visible_rows(session, m_case, m_case.case_id)
+    assert next(rows).case_id == 5
+    # 最初のページまでしか読み込んでいない（ID の取得 + 1ページ目）
+    assert len(queries) == 2
+    assert [row.case_id for row in rows] == [4, 2, 1]
+    assert len(queries) == 3
+
+def test_iter_case_documents(session):
+    docs = list(iter_case_documents(session))
+    assert [doc.metadata["case_id"] for doc in docs] == [5, 4, 2, 1]
+    assert docs[0].metadata["title"] == "事例5"
+    assert docs[0].metadata["content_hash"] == mdlVectorstore.content_hash(docs[0].page_content)
+
+def test_stream_documents_adds_each_batch(fake_embeddings, monkeypatch):
+    added = []
+    original_add = mdlVectorstore.add_embedded_batches
+
+    def add_embedded_batches(vs, batches):
+        added.append([len(texts) for texts, _, _, _ in batches])
+        original_add(vs, batches)
+    monkeypatch.setattr(mdlVectorstore, "add_embedded_batches", add_embedded_batches)
+
+    progress = {}
+    vs, info = stream_documents_to_vectorstore(iter(case_documents(5)), "case", "case_id", progress)
+    # 学習が不要な種別は EXTRACT_BATCH_SIZE 件ごとに追加し、埋め込み前の Document を溜めない
+    assert added == [[2], [2], [1]]
+    assert info == {"documents": 5}
+    assert vs.index.ntotal == 5
+    assert progress["rows_extracted"] == 5
+    assert sorted(vs.index_to_docstore_id.values()) == [f"case:{i}:0" for i in range(1, 6)]
+
+def test_stream_documents_trains_index_on_all_batches(fake_embeddings, monkeypatch):
+    built = []
+    original_build_index = mdlVectorstore.build_index
+
+    def build_index(spec, vectors):
+        built.append(len(vectors))
+        return original_build_index(spec, vectors)
+    monkeypatch.setattr(mdlVectorstore, "build_index", build_index)
+
+    assert requires_training("IVF2,Flat")
+    assert not requires_training("HNSW32")
+    vs, _ = stream_documents_to_vectorstore(iter(case_documents(5)), "case", "case_id", index_spec="IVF2,Flat")
+    # 学習が必要な種別は全件のベクトルで1回だけ作成する
+    assert built == [5]
+    assert vs.index.ntotal == 5
+
+def test_stream_documents_without_documents(fake_embeddings):
+    with pytest.raises(ValueError):
+        stream_documents_to_vectorstore(iter([]), "case", "case_id")
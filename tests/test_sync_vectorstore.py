@@ -0,0 +1,174 @@
+# インデックスの差分更新 (modules.mdlVectorstore._sync_vectorstore) のテスト
+import json
+import pytest
+import vectorstore_global
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from modules import mdlVectorstore
+from modules.mdlEmbedding import LocalHashEmbeddings
+from modules.mdlVectorstore import content_hash, make_document_ids
+
+def talent_document(talent_id: int, text: str, **metadata) -> Document:
+    page_content = f"【ID】{talent_id}\n\n{text}"
+    return Document(
+        page_content=page_content,
+        metadata={"talent_id": talent_id, "content_hash": content_hash(page_content), **metadata},
+    )
+
+INITIAL_DOCS = [
+    talent_document(1, "営業改革の経験があります"),
+    talent_document(2, "データ分析基盤を構築しました"),
+    talent_document(3, "人事制度の設計を担当しました"),
+]
+
+def indexed_texts(vs) -> dict:
+    owners, _ = mdlVectorstore.indexed_owner_map(vs, "talent_id")
+    return {owner: vs.docstore.search(entry["ids"][0]).page_content for owner, entry in owners.items()}
+
+def fail_full_rebuild(*args, **kwargs):
+    pytest.fail("差分更新で全件生成にフォールバックしました")
+
+@pytest.fixture
+def embeddings(monkeypatch, fake_embeddings):
+    monkeypatch.setenv("DO_GPT", "TRUE")
+    return fake_embeddings
+
+@pytest.fixture
+def base_dir(tmp_path, monkeypatch, embeddings):
+    # 差分更新は稼働中のベクトルストアを差し替えるため、テスト後に元へ戻す
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", None)
+    base_dir = str(tmp_path / "talent")
+    vs = FAISS.from_documents(INITIAL_DOCS, embeddings, ids=make_document_ids(INITIAL_DOCS, "talent_id"))
+    mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full"})
+    return base_dir
+
+def sync(base_dir: str, docs: list[Document]) -> dict:
+    status, result = mdlVectorstore._sync_vectorstore(
+        "talent", base_dir, "talent_id", lambda session: list(docs), fail_full_rebuild
+    )
+    assert status == 200, result
+    return json.loads(result)
+
+def test_sync_applies_added_updated_and_deleted_documents(base_dir):
+    version = mdlVectorstore.current_version(base_dir)
+    result = sync(base_dir, [
+        talent_document(1, "営業改革の経験があります"),
+        talent_document(2, "生成AIの導入を支援しました"),
+        talent_document(4, "製造業の DX を推進しました"),
+    ])
+    assert (result["added"], result["updated"], result["deleted"], result["unchanged"]) == (1, 1, 1, 1)
+    assert result["embedded_documents"] == 2
+    assert result["total_vectors"] == 3
+
+    # 公開された新しいバージョンを読み直して、差分が反映されていることを確認する
+    assert mdlVectorstore.current_version(base_dir) != version
+    vs = mdlVectorstore.load_vectorstore(base_dir)
+    texts = indexed_texts(vs)
+    assert sorted(texts) == [1, 2, 4]
+    assert "生成AI" in texts[2]
+    assert vs.index.ntotal == 3
+    assert vectorstore_global.talent_vectorstore is not None
+
+def test_sync_without_changes_keeps_current_version(base_dir):
+    version = mdlVectorstore.current_version(base_dir)
+    result = sync(base_dir, INITIAL_DOCS)
+    assert (result["added"], result["updated"], result["deleted"], result["unchanged"]) == (0, 0, 0, 3)
+    assert result["embedded_documents"] == 0
+    assert mdlVectorstore.current_version(base_dir) == version
+
+def test_sync_refreshes_metadata_without_embedding(base_dir):
+    result = sync(base_dir, [
+        talent_document(1, "営業改革の経験があります", name="山田"),
+        talent_document(2, "データ分析基盤を構築しました"),
+        talent_document(3, "人事制度の設計を担当しました"),
+    ])
+    assert result["unchanged"] == 3
+    assert result["metadata_refreshed"] == 1
+    assert result["embedded_documents"] == 0
+
+    vs = mdlVectorstore.load_vectorstore(base_dir)
+    owners, _ = mdlVectorstore.indexed_owner_map(vs, "talent_id")
+    assert owners[1]["metadata"]["name"] == "山田"
+
+def test_sync_skips_embedding_unless_do_gpt(base_dir, monkeypatch):
+    monkeypatch.delenv("DO_GPT")
+    status, _ = mdlVectorstore._sync_vectorstore(
+        "talent", base_dir, "talent_id", lambda session: INITIAL_DOCS + [talent_document(4, "新規")], fail_full_rebuild
+    )
+    assert status == 500
+
+def test_sync_rebuilds_index_types_without_delete_support(tmp_path, monkeypatch, embeddings):
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", None)
+    base_dir = str(tmp_path / "talent")
+    vs = mdlVectorstore.embed_documents_to_vectorstore(
+        INITIAL_DOCS, make_document_ids(INITIAL_DOCS, "talent_id"), "talent", index_spec="HNSW8"
+    )
+    mdlVectorstore.publish_vectorstore(vs, base_dir, {"mode": "full", "index_spec": "HNSW8"})
+    built = []
+
+    def create_vectorstore(force_recreate, progress=None, index_spec=None):
+        built.append(index_spec)
+        return "rebuilt vectorstore"
+
+    status, result = mdlVectorstore._sync_vectorstore(
+        "talent", base_dir, "talent_id", lambda session: INITIAL_DOCS[:2], create_vectorstore
+    )
+    assert status == 200 and json.loads(result)["mode"] == "full"
+    # 削除に対応しない HNSW は同じ種別で全件生成する
+    assert built == ["HNSW8"]
+
+def test_sync_falls_back_to_full_build_without_index(tmp_path, monkeypatch, embeddings):
+    monkeypatch.setattr(vectorstore_global, "talent_vectorstore", None)
+    built = []
+
+    def create_vectorstore(force_recreate, progress=None, index_spec=None):
+        built.append(force_recreate)
+        return "new vectorstore"
+
+    status, result = mdlVectorstore._sync_vectorstore(
+        "talent", str(tmp_path / "missing"), "talent_id", lambda session: INITIAL_DOCS, create_vectorstore
+    )
+    assert status == 200 and json.loads(result)["mode"] == "full"
+    assert len(built) == 1
+    assert vectorstore_global.talent_vectorstore == "new vectorstore"
+
+def test_sync_rebuilds_index_from_other_embedding_model(base_dir, monkeypatch):
+    # 別の埋め込みモデルで作成されたインデックスには差分を追加せず、全件生成する
+    local = LocalHashEmbeddings(dim=16)
+    monkeypatch.setattr(mdlVectorstore, "get_base_embeddings", lambda: local)
+    built = []
+
+    def create_vectorstore(force_recreate, progress=None, index_spec=None):
+        built.append(force_recreate)
+        return "rebuilt vectorstore"
+
+    status, result = mdlVectorstore._sync_vectorstore(
+        "talent", base_dir, "talent_id", lambda session: INITIAL_DOCS, create_vectorstore
+    )
+    assert status == 200 and json.loads(result)["mode"] == "full"
+    assert len(built) == 1
+
+def test_sync_rebuilds_index_with_other_chunk_size(base_dir, monkeypatch):
+    # チャンク分割の設定が変わった場合は、差分ではなく全件生成する
+    monkeypatch.setenv("TALENT_CHUNK_SIZE", "500")
+    built = []
+
+    def create_vectorstore(force_recreate, progress=None, index_spec=None):
+        built.append(force_recreate)
+        return "rebuilt vectorstore"
+
+    status, result = mdlVectorstore._sync_vectorstore(
+        "talent", base_dir, "talent_id", lambda session: INITIAL_DOCS, create_vectorstore
+    )
+    assert status == 200 and json.loads(result)["mode"] == "full"
+    assert len(built) == 1
+
+def test_sync_compares_documents_page_by_page(base_dir, monkeypatch):
+    # DB の Document を1件ずつ読み込んで比較しても、ページをまたいだ削除を正しく判定する
+    monkeypatch.setenv("EXTRACT_BATCH_SIZE", "1")
+    result = sync(base_dir, [
+        talent_document(3, "人事制度の設計を担当しました"),
+        talent_document(5, "物流の最適化を支援しました"),
+    ])
+    assert (result["added"], result["updated"], result["deleted"], result["unchanged"]) == (1, 0, 2, 1)
+    assert sorted(indexed_texts(mdlVectorstore.load_vectorstore(base_dir))) == [3, 5]
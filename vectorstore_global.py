@@ -1,3 +1,13 @@
 # vectorstore_global.py
+import threading
+
 talent_vectorstore = None
-case_vectorstore = None
\ No newline at end of file
+case_vectorstore = None
+# 稼働中のベクトルストアのインデックスのバージョン（差し替え時に modules.mdlVectorstore.set_vectorstore で記録する）
+loaded_versions = {"talent": None, "case": None}
+# クエリ埋め込みキャッシュ (modules.mdlEmbeddingCache.EmbeddingCache)
+embedding_cache = None
+# 事例→人材の類似度事前計算結果 (modules.mdlAffinity.load_affinity)
+case_talent_affinity = None
+# ベクトルストアの再作成・差し替え用ロック（対象ごと）
+vectorstore_locks = {"talent": threading.Lock(), "case": threading.Lock()}